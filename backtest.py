@@ -0,0 +1,174 @@
+"""
+Walk-forward backtests of mixtures over independent evaluation periods.
+
+At each forecast origin of a period, the mixture is first updated with the targets known at the
+origin, that is the rows whose timestamp plus the information lag is not after the origin, then
+it predicts the rows of the next horizon, whose timestamps are in (origin, origin + horizon].
+A predicted row is thus never known when it is predicted.
+
+Each period starts from a fresh mixture built on the rows known at its first origin, so the
+periods are independent and run in parallel processes.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mixture import Mixture, resolve_loss
+
+
+def run_period(name, experts, y, awake, origins, horizon, lag, warmup, kwargs):
+    """Walk-forward backtest of one period, see backtest.
+
+    Returns:
+        (dict, pandas.DataFrame): the summary of the period and its predictions.
+    """
+    start = time.perf_counter()
+    index = experts.index
+    known = index + lag
+    first = origins[0]
+    begin = 0 if warmup is None else index.searchsorted(first - warmup, side="left")
+    stop = known.searchsorted(first, side="right")
+    if stop <= begin:
+        raise ValueError(f"No target is known at the first origin {first} of the period {name}")
+    rows = slice(begin, stop)
+    awake_rows = None if awake is None else awake.iloc[rows]
+    mixture = Mixture(y=y.iloc[rows], experts=experts.iloc[rows], awake=awake_rows, **kwargs)
+    update_seconds = time.perf_counter() - start
+    predict_seconds = 0.0
+    parts = []
+    for origin in origins:
+        tic = time.perf_counter()
+        new_stop = known.searchsorted(origin, side="right")
+        if new_stop > stop:
+            rows = slice(stop, new_stop)
+            mixture.update(
+                experts.iloc[rows],
+                y.iloc[rows],
+                awake=None if awake is None else awake.iloc[rows],
+            )
+            stop = new_stop
+        toc = time.perf_counter()
+        update_seconds += toc - tic
+        a = index.searchsorted(origin, side="right")
+        b = index.searchsorted(origin + horizon, side="right")
+        if b > a:
+            rows = slice(a, b)
+            predictions = mixture.predict(
+                experts.iloc[rows], awake=None if awake is None else awake.iloc[rows]
+            )
+            parts.append(
+                pd.DataFrame(
+                    {
+                        "period": name,
+                        "origin": origin,
+                        "target": y.iloc[rows].to_numpy(),
+                        "prediction": np.ravel(predictions),
+                    },
+                    index=index[rows],
+                )
+            )
+        predict_seconds += time.perf_counter() - toc
+    predictions = pd.concat(parts) if parts else pd.DataFrame(
+        columns=["period", "origin", "target", "prediction"]
+    )
+    loss_function, _ = resolve_loss(kwargs.get("loss_type", "mse"), False)
+    losses = loss_function(predictions["prediction"].to_numpy(), predictions["target"].to_numpy())
+    summary = {
+        "period": name,
+        "origins": len(origins),
+        "rows": len(predictions),
+        "loss": np.mean(losses) if len(losses) > 0 else np.nan,
+        "seconds": time.perf_counter() - start,
+        "update_seconds": update_seconds,
+        "predict_seconds": predict_seconds,
+    }
+    return summary, predictions
+
+
+def backtest(
+    experts,
+    y,
+    periods,
+    horizon,
+    awake=None,
+    lag=None,
+    warmup=None,
+    n_jobs=None,
+    **kwargs,
+):
+    """Walk-forward backtest of a mixture over independent periods, run in parallel processes.
+
+    Args:
+        experts (pandas.DataFrame): forecasts of the experts, indexed by increasing timestamps.
+        y (pandas.Series): targets, with the index of experts.
+        periods (dict): dict mapping a period name to its forecast origins, e.g. a pandas.DatetimeIndex.
+        horizon (str or pandas.Timedelta): rows predicted at each origin, those whose timestamps are
+            in (origin, origin + horizon].
+        awake (pandas.DataFrame, optional): activation coefficients, with the index and columns of
+            experts. Defaults to None.
+        lag (str or pandas.Timedelta, optional): delay after which the target of a row is known.
+            Defaults to None, the target being known at its timestamp.
+        warmup (str or pandas.Timedelta, optional): length of the history used to build the mixture
+            of a period, before its first origin. Defaults to None, all the rows known at the first origin.
+        n_jobs (int, optional): number of processes, 1 to run the periods in the current process.
+            Defaults to None, the number of processors.
+        **kwargs: arguments of Mixture, e.g. model or loss_type, which must be picklable when n_jobs != 1.
+    Returns:
+        (pandas.DataFrame, pandas.DataFrame): the summary of each period, with its out-of-sample loss
+            and its timings, and the predictions made at each origin.
+
+    Example:
+        periods = {
+            "june_2019": pd.date_range("2019-05-31 12:00", "2019-06-29 12:00", freq="D"),
+            "september_2021": pd.date_range("2021-08-31 12:00", "2021-09-29 12:00", freq="D"),
+        }
+        summary, predictions = backtest(experts, prices, periods, horizon="1D", lag="1h", model="BOA")
+    """
+    if not isinstance(experts, pd.DataFrame) or not isinstance(y, pd.Series):
+        raise (TypeError("experts must be a pandas dataframe and y a pandas series"))
+    if not experts.index.equals(y.index):
+        raise ValueError("experts and y must have the same index")
+    if awake is not None and not awake.index.equals(experts.index):
+        raise ValueError("awake must have the index of experts")
+    if not experts.index.is_monotonic_increasing:
+        raise ValueError("The index of experts must be increasing")
+    horizon = pd.Timedelta(horizon)
+    lag = pd.Timedelta(0) if lag is None else pd.Timedelta(lag)
+    warmup = None if warmup is None else pd.Timedelta(warmup)
+    if lag < pd.Timedelta(0):
+        raise ValueError(f"lag must be non-negative, got {lag}")
+    tasks = []
+    for name, origins in periods.items():
+        origins = pd.DatetimeIndex(origins).sort_values()
+        if len(origins) == 0:
+            raise ValueError(f"The period {name} has no origin")
+        # Each process only receives the rows of its period
+        first = 0
+        if warmup is not None:
+            first = experts.index.searchsorted(origins[0] - warmup, side="left")
+        last = experts.index.searchsorted(origins[-1] + horizon, side="right")
+        rows = slice(first, last)
+        tasks.append(
+            (
+                name,
+                experts.iloc[rows],
+                y.iloc[rows],
+                None if awake is None else awake.iloc[rows],
+                origins,
+                horizon,
+                lag,
+                warmup,
+                kwargs,
+            )
+        )
+    if n_jobs == 1:
+        results = [run_period(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            results = list(executor.map(run_period, *zip(*tasks)))
+    summary = pd.DataFrame([result[0] for result in results]).set_index("period")
+    predictions = pd.concat([result[1] for result in results])
+    return summary, predictions
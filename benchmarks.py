@@ -0,0 +1,265 @@
+"""
+Benchmarks of the package, run with
+
+    python benchmarks.py [name ...]
+
+Each benchmark returns a DataFrame of timings, printed by the command line.
+"""
+
+import argparse
+import copy
+import io
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from mixture import Mixture
+
+
+def synthetic_mixture(T, K, model="BOA", seed=0):
+    """Mixture fitted on T steps of K noisy copies of a random target."""
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.normal(10, 1, T))
+    experts = pd.DataFrame(
+        y.to_numpy()[:, None] + rng.normal(0, np.linspace(0.5, 3, K), (T, K)),
+        columns=[f"expert_{k}" for k in range(K)],
+    )
+    return Mixture(y=y, experts=experts, model=model)
+
+
+def bench_plots(sizes=(1000, 10000, 100000), K=10, max_points=(None, 2000)):
+    """Render time and png size of plot_mixture(plot_type="all") versus the number of steps.
+
+    Args:
+        sizes (tuple): numbers of steps of the mixtures.
+        K (int): number of experts.
+        max_points (tuple): values of the max_points argument of plot_mixture, None drawing every step.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    rows = []
+    for T in sizes:
+        mixture = synthetic_mixture(T, K)
+        for points in max_points:
+            start = time.perf_counter()
+            mixture.plot_mixture(plot_type="all", max_points=points)
+            buffer = io.BytesIO()
+            plt.savefig(buffer, format="png")
+            plt.close("all")
+            rows.append(
+                {
+                    "T": T,
+                    "max_points": "all" if points is None else points,
+                    "seconds": time.perf_counter() - start,
+                    "png_kB": buffer.tell() / 1000,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def bench_snapshots(n_readers=(1, 4, 8), n_updates=2000, K=10):
+    """Throughput of Mixture.predict in reader threads while another thread updates the mixture.
+
+    Every prediction of a reader must be the prediction of one published snapshot, i.e. of the
+    weights of one complete update: a prediction mixing the coefficients of two updates fails
+    the benchmark.
+
+    Args:
+        n_readers (tuple): numbers of reader threads.
+        n_updates (int): number of one-step updates made by the writer thread.
+        K (int): number of experts.
+    """
+    import threading
+
+    rng = np.random.default_rng(0)
+    names = [f"expert_{k}" for k in range(K)]
+    x_new = pd.DataFrame(rng.normal(10, 1, (1, K)), columns=names)
+    x = pd.DataFrame(rng.normal(10, 1, (n_updates, K)), columns=names)
+    y = pd.Series(rng.normal(10, 1, n_updates))
+    rows = []
+    for readers in n_readers:
+        mixture = synthetic_mixture(100, K)
+        published = {mixture.snapshot.version: mixture.snapshot}
+        mixture.add_listener(lambda snapshot: published.__setitem__(snapshot.version, snapshot))
+        stop = threading.Event()
+        seen = [[] for _ in range(readers)]
+
+        def read(predictions):
+            while not stop.is_set():
+                predictions.append(mixture.predict(x_new)[0, 0])
+
+        threads = [threading.Thread(target=read, args=(seen[i],)) for i in range(readers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for t in range(n_updates):
+            mixture.update(x.iloc[t : t + 1], y.iloc[t : t + 1])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        awake = np.ones((1, K))
+        expected = np.sort(
+            [snapshot.predict(x_new.to_numpy(), awake)[0, 0] for snapshot in published.values()]
+        )
+        predictions = np.concatenate([np.asarray(p, dtype=float) for p in seen])
+        position = np.clip(np.searchsorted(expected, predictions), 1, len(expected) - 1)
+        distance = np.minimum(
+            np.abs(predictions - expected[position - 1]), np.abs(predictions - expected[position])
+        )
+        inconsistent = int(np.sum(distance > 1e-12))
+        assert inconsistent == 0, f"{inconsistent} predictions match no published snapshot"
+        rows.append(
+            {
+                "readers": readers,
+                "updates_per_s": n_updates / seconds,
+                "predicts_per_s": len(predictions) / seconds,
+                "versions": len(published),
+                "inconsistent": inconsistent,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def bench_wal(fsync_every=(1, 8, 64, 512), n_updates=2000, K=10, directory=None):
+    """Throughput of the write-ahead log of wal.py versus the number of updates between two fsync.
+
+    Each update holds one step. The log alone and the log followed by the update of a BOA mixture
+    are timed, then the recovery of the mixture from its initial state and the whole log.
+
+    Args:
+        fsync_every (tuple): values of the fsync_every argument of the log.
+        n_updates (int): number of updates logged.
+        K (int): number of experts.
+        directory (str, optional): directory of the logs, on the disk to measure. Defaults to None,
+            the temporary directory of the system.
+    """
+    from wal import DurableMixture, UpdateLog
+
+    rng = np.random.default_rng(0)
+    mixture = synthetic_mixture(100, K)
+    x = rng.normal(10, 1, (n_updates, 1, K))
+    y = rng.normal(10, 1, (n_updates, 1))
+    awake = np.ones((1, K))
+    rows = []
+    for every in fsync_every:
+        with tempfile.TemporaryDirectory(dir=directory) as tmp:
+            log = UpdateLog(f"{tmp}/updates.log", fsync_every=every)
+            start = time.perf_counter()
+            for t in range(n_updates):
+                log.append(x[t], y[t], awake, mixture.experts_names)
+            log.close()
+            log_seconds = time.perf_counter() - start
+            durable = DurableMixture(copy.deepcopy(mixture), tmp, fsync_every=every)
+            start = time.perf_counter()
+            for t in range(n_updates):
+                durable.update(pd.DataFrame(x[t], columns=mixture.experts_names), y[t])
+            durable.close()
+            update_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            DurableMixture.recover(tmp).close()
+            recover_seconds = time.perf_counter() - start
+        rows.append(
+            {
+                "fsync_every": every,
+                "log_updates_per_s": n_updates / log_seconds,
+                "logged_updates_per_s": n_updates / update_seconds,
+                "recover_s": recover_seconds,
+                "fsyncs": log.syncs,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def price_dataset(start="2019-01-01", end="2022-12-31 23:00", seed=0):
+    """Hourly synthetic rows with the columns of the price dataset used by the features."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq="h")
+    columns = ["price", "conso", "fioul", "coal", "gas", "nuclear", "wind", "sun"]
+    data = pd.DataFrame(rng.gamma(2, 50, (len(dates), len(columns))), columns=columns)
+    data["date_wo_h"] = dates.normalize()
+    data["date"] = dates
+    return data
+
+
+def notebook_features(whole_period):
+    """Features computed as in code_to_run.ipynb, FunctionTransformer(f).fit_transform(x) being f(x)."""
+    whole_period = whole_period.copy()
+    whole_period["cos_day"] = whole_period["date"].dt.day.astype(float)
+    whole_period["sin_day"] = whole_period["date"].dt.day.astype(float)
+    whole_period["cos_month"] = whole_period["date"].dt.month.astype(float)
+    whole_period["sin_month"] = whole_period["date"].dt.month.astype(float)
+    whole_period["cos_day"] = np.cos(whole_period["cos_day"] / 365 * 2 * np.pi)
+    whole_period["cos_month"] = np.cos(whole_period["cos_month"] / 12 * 2 * np.pi)
+    whole_period["sin_day"] = np.sin(whole_period["sin_day"] / 365 * 2 * np.pi)
+    whole_period["sin_month"] = np.sin(whole_period["sin_month"] / 12 * 2 * np.pi)
+    whole_period["weekdays"] = whole_period["date"].dt.dayofweek
+    whole_period["weekend"] = np.zeros(whole_period.shape[0])
+    whole_period["not_weekend"] = np.zeros(whole_period.shape[0])
+    whole_period["date_wo_h"] = pd.to_datetime(whole_period["date_wo_h"])
+    for i in range(whole_period.shape[0]):
+        if whole_period.loc[i, "weekdays"] == 5 or whole_period.loc[i, "weekdays"] == 6:
+            whole_period.loc[i, "weekend"] = 1
+        else:
+            whole_period.loc[i, "not_weekend"] = 1
+    whole_period["2_lags_coal"] = whole_period["coal"].shift(48)
+    whole_period["2_lags_fioul"] = whole_period["fioul"].shift(48)
+    whole_period["2_lags_gas"] = whole_period["gas"].shift(48)
+    whole_period["2_lags_nuke"] = whole_period["nuclear"].shift(48)
+    whole_period["target_price"] = whole_period["price"].shift(24)
+    whole_period.dropna(inplace=True)
+    return whole_period
+
+
+def bench_features(start="2019-01-01", end="2022-12-31 23:00"):
+    """Time of the features of features.py versus the notebook code, on hourly rows from start to end.
+
+    Args:
+        start (str): first date of the rows.
+        end (str): last date of the rows, the default range being the size of the 2019-2022 data.
+    """
+    from features import make_features
+
+    data = price_dataset(start, end)
+    rows = []
+    for name, function in [("notebook", notebook_features), ("features.py", make_features)]:
+        start_time = time.perf_counter()
+        result = function(data)
+        rows.append(
+            {"code": name, "rows": len(data), "seconds": time.perf_counter() - start_time}
+        )
+        if name == "notebook":
+            expected = result
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    return pd.DataFrame(rows)
+
+
+BENCHMARKS = {
+    "plots": bench_plots,
+    "snapshots": bench_snapshots,
+    "wal": bench_wal,
+    "features": bench_features,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "names", nargs="*", help=f"benchmarks to run among {list(BENCHMARKS)}, all by default"
+    )
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks {sorted(unknown)}")
+    for name in args.names or list(BENCHMARKS):
+        print(f"# {name}")
+        print(BENCHMARKS[name]().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
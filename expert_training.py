@@ -0,0 +1,309 @@
+"""
+Training of the experts of a mixture: quantile regressors fitted on rolling training windows.
+
+For each forecast day, one regressor is fitted per training window and per quantile, and its
+forecasts of the day are a column of the experts matrix given to Mixture. The windows of
+consecutive days overlap, e.g. the windows of make_training_windows_week are shifted by one day
+from one day to the next, so the fitted regressors are kept in an LRU cache keyed by
+(quantile, window start, window end, features) and reused when a window comes back.
+
+The regressors missing from the cache can be fitted in a process pool. The training rows are
+then copied once in a shared memory segment, which the workers map read-only, and each task only
+sends a quantile and a range of rows.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from shared_weights import attach_segment
+
+# Training rows of a worker process, mapped from the shared segment by _attach_rows
+_rows = {}
+
+
+def make_training_windows_week(date_prediction, hours=(3, 8, 13, 18, 23), n_windows=5, days=31):
+    """Training windows of the regressors predicting a day, as in the notebook.
+
+    Args:
+        date_prediction (str or pandas.Timestamp): the date on which we want to predict.
+        hours (tuple, optional): hours of the training dates. Defaults to (3, 8, 13, 18, 23).
+        n_windows (int, optional): number of windows, each one starting one day after the previous one,
+            the first one eight days before date_prediction. Defaults to 5.
+        days (int, optional): length of the windows in days. Defaults to 31.
+    Returns:
+        pandas.DataFrame: one column of training dates per window.
+    """
+    date_prediction = pd.to_datetime(date_prediction)
+    first_training_date = date_prediction - pd.Timedelta(days=8)
+    windows = {}
+    for i in range(n_windows):
+        begin = first_training_date + pd.Timedelta(days=i)
+        dates = pd.date_range(start=begin, end=begin + pd.Timedelta(days=days), freq="h")
+        windows[f"set_{i}"] = dates[dates.hour.isin(hours)]
+    return pd.DataFrame.from_dict(data=windows)
+
+
+def window_bounds(windows):
+    """First and last training dates of each window.
+
+    Args:
+        windows (pandas.DataFrame or list): windows as returned by make_training_windows_week, or a
+            list of (start, end) pairs.
+    Returns:
+        list: (start, end) pairs of pandas.Timestamp.
+    """
+    if isinstance(windows, pd.DataFrame):
+        return [(windows[column].min(), windows[column].max()) for column in windows.columns]
+    return [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in windows]
+
+
+def _attach_rows(name, shape):
+    # The workers share the resource tracker of the parent process, which owns the segment
+    segment = attach_segment(name, shared_tracker=True)
+    x = np.ndarray(shape, dtype=np.float64, buffer=segment.buf)
+    y = np.ndarray(shape[:1], dtype=np.float64, buffer=segment.buf, offset=x.nbytes)
+    x.setflags(write=False)
+    y.setflags(write=False)
+    _rows["segment"] = segment
+    _rows["x"] = x
+    _rows["y"] = y
+
+
+def _fit_rows(make_model, quantile, start, stop):
+    return make_model(quantile).fit(_rows["x"][start:stop], _rows["y"][start:stop])
+
+
+def quantile_regressor(quantile, **options):
+    try:
+        from sklearn.linear_model import QuantileRegressor
+    except ImportError:
+        raise (ImportError("scikit-learn is required to fit quantile regressors"))
+    return QuantileRegressor(quantile=quantile, **options)
+
+
+class ExpertModels:
+    """Quantile regressors fitted on training windows, kept in an LRU cache.
+
+    The training rows of a window are the rows of data whose date is between the start and the
+    end of the window, both included, so data is expected to hold the training hours only, as
+    training_data in the notebook.
+
+    Args:
+        data (pandas.DataFrame): features, target and dates of the training rows.
+        target (str): column of the target.
+        features (list): columns of the features.
+        date_column (str, optional): column of the dates. Defaults to "date".
+        max_size (int, optional): max number of fitted regressors kept. Defaults to 64.
+        make_model (function, optional): function of a quantile returning an unfitted model with the
+            fit and predict methods of scikit-learn. Defaults to None, QuantileRegressor.
+        model_options (dict, optional): options of QuantileRegressor when make_model is None,
+            e.g. {"alpha": 0, "solver": "highs"}. Defaults to None.
+
+    Example:
+        models = ExpertModels(training_data, "target_price", features)
+        experts = models.experts(target_june_dates, quantiles=(0.05, 0.5, 0.95))
+        mod = Mixture(y=targets, experts=experts, model="BOA")
+    """
+
+    def __init__(
+        self,
+        data,
+        target,
+        features,
+        date_column="date",
+        max_size=64,
+        make_model=None,
+        model_options=None,
+    ):
+        data = data.sort_values(date_column)
+        self.date_column = date_column
+        self.dates = pd.DatetimeIndex(data[date_column])
+        self.features = tuple(features)
+        self.x = np.ascontiguousarray(data[list(self.features)].to_numpy(dtype=float))
+        self.y = data[target].to_numpy(dtype=float)
+        self.max_size = max_size
+        self.model_options = {} if model_options is None else dict(model_options)
+        self.make_model = make_model
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, quantile, start, end):
+        return (quantile, pd.Timestamp(start), pd.Timestamp(end), self.features)
+
+    def rows(self, start, end):
+        return slice(
+            self.dates.searchsorted(pd.Timestamp(start), side="left"),
+            self.dates.searchsorted(pd.Timestamp(end), side="right"),
+        )
+
+    def model_factory(self):
+        """Function of a quantile returning an unfitted model, picklable for the worker processes."""
+        if self.make_model is None:
+            return partial(quantile_regressor, **self.model_options)
+        return self.make_model
+
+    def new_model(self, quantile):
+        return self.model_factory()(quantile)
+
+    def fit_window(self, quantile, start, end):
+        """Fits a new regressor on the rows of a window, without the cache."""
+        rows = self.rows(start, end)
+        if rows.stop <= rows.start:
+            raise ValueError(f"No training row between {start} and {end}")
+        return self.new_model(quantile).fit(self.x[rows], self.y[rows])
+
+    def get(self, quantile, start, end):
+        """Regressor of a quantile fitted on a window, fitted only when it is not in the cache."""
+        key = self.key(quantile, start, end)
+        model = self.models.get(key)
+        if model is not None:
+            self.hits += 1
+            self.models.move_to_end(key)
+            return model
+        self.misses += 1
+        model = self.fit_window(quantile, start, end)
+        self.put(key, model)
+        return model
+
+    def fit_all(self, windows, n_jobs=None):
+        """Fits the regressors of several (quantile, start, end) windows in a process pool.
+
+        The windows in the cache are not fitted again.
+
+        Args:
+            windows (list): (quantile, start, end) triplets.
+            n_jobs (int, optional): number of processes. Defaults to None, the number of processors.
+        Returns:
+            dict: dict mapping each cache key of the windows to its fitted regressor.
+        """
+        models = {}
+        missing = []
+        for quantile, start, end in windows:
+            key = self.key(quantile, start, end)
+            if key in models:
+                continue
+            if key in self.models:
+                self.hits += 1
+                self.models.move_to_end(key)
+                models[key] = self.models[key]
+                continue
+            rows = self.rows(start, end)
+            if rows.stop <= rows.start:
+                raise ValueError(f"No training row between {start} and {end}")
+            models[key] = None
+            missing.append((key, rows))
+        if not missing:
+            return models
+        self.misses += len(missing)
+        # The features followed by the target
+        segment = shared_memory.SharedMemory(create=True, size=max(self.x.nbytes + self.y.nbytes, 1))
+        try:
+            np.ndarray(self.x.shape, dtype=np.float64, buffer=segment.buf)[:] = self.x
+            np.ndarray(self.y.shape, dtype=np.float64, buffer=segment.buf, offset=self.x.nbytes)[:] = self.y
+            with ProcessPoolExecutor(
+                n_jobs, initializer=_attach_rows, initargs=(segment.name, self.x.shape)
+            ) as executor:
+                fitted = executor.map(
+                    _fit_rows,
+                    [self.model_factory()] * len(missing),
+                    [key[0] for key, _ in missing],
+                    [rows.start for _, rows in missing],
+                    [rows.stop for _, rows in missing],
+                )
+                for (key, _), model in zip(missing, fitted):
+                    models[key] = model
+                    self.put(key, model)
+        finally:
+            segment.close()
+            segment.unlink()
+        return models
+
+    def put(self, key, model):
+        self.models[key] = model
+        self.models.move_to_end(key)
+        while len(self.models) > self.max_size:
+            self.models.popitem(last=False)
+
+    def experts(
+        self,
+        days,
+        quantiles=(0.05, 0.5, 0.95),
+        windows=make_training_windows_week,
+        data=None,
+        n_jobs=1,
+    ):
+        """Forecasts of the regressors of each (quantile, window) on the rows of each forecast day.
+
+        Args:
+            days (list): forecast days, e.g. pd.date_range("2019-06-01", "2019-06-30", freq="D").
+            quantiles (tuple, optional): quantiles of the regressors. Defaults to (0.05, 0.5, 0.95).
+            windows (function, optional): function of a day returning its training windows, see
+                window_bounds. Defaults to make_training_windows_week.
+            data (pandas.DataFrame, optional): rows to forecast, with the features and the date column.
+                Defaults to None, the training rows.
+            n_jobs (int, optional): number of processes fitting the regressors missing from the cache,
+                None for the number of processors, 1 to fit them one after the other. Defaults to 1.
+        Returns:
+            pandas.DataFrame: the experts matrix, one row per forecast row and one column
+                "q<quantile>_w<window>" per (quantile, window), indexed by the dates of the rows,
+                without rows when no day has rows to forecast.
+        """
+        dates, x = self.forecast_rows(data)
+        bounds = {pd.Timestamp(day): window_bounds(windows(day)) for day in days}
+        if not bounds:
+            raise ValueError("No forecast day")
+        models = {}
+        if n_jobs != 1:
+            models = self.fit_all(
+                [
+                    (quantile, start, end)
+                    for day_bounds in bounds.values()
+                    for quantile in quantiles
+                    for start, end in day_bounds
+                ],
+                n_jobs=n_jobs,
+            )
+        parts = []
+        for day, day_bounds in bounds.items():
+            rows = slice(
+                dates.searchsorted(day, side="left"),
+                dates.searchsorted(day + pd.Timedelta(days=1), side="left"),
+            )
+            if rows.stop <= rows.start:
+                continue
+            columns = {}
+            for quantile in quantiles:
+                for i, (start, end) in enumerate(day_bounds):
+                    model = models.get(self.key(quantile, start, end))
+                    if model is None:
+                        model = self.get(quantile, start, end)
+                    columns[expert_name(quantile, i)] = model.predict(x[rows])
+            parts.append(pd.DataFrame(columns, index=dates[rows]))
+        if not parts:
+            # No row to forecast on any day: the columns are the ones of the first day
+            names = [
+                expert_name(quantile, i)
+                for quantile in quantiles
+                for i in range(len(next(iter(bounds.values()))))
+            ]
+            return pd.DataFrame(columns=names, index=dates[:0], dtype=float)
+        return pd.concat(parts)
+
+    def forecast_rows(self, data=None):
+        if data is None:
+            return self.dates, self.x
+        data = data.sort_values(self.date_column)
+        return (
+            pd.DatetimeIndex(data[self.date_column]),
+            data[list(self.features)].to_numpy(dtype=float),
+        )
+
+
+def expert_name(quantile, window):
+    return f"q{quantile:g}_w{window}"
@@ -0,0 +1,239 @@
+"""
+Value of the experts of a mixture: loss of the mixture without each expert, or without coalitions
+of experts, for the BOA, MLpol and MLprod algorithms.
+
+A mixture without some experts is the same mixture in which these experts are always asleep,
+with K the number of experts left. The variants are thus run together on the same data, their
+slot variables being arrays of shape (V, K), one row per variant, and their awake coefficients
+the awake coefficients of the data masked by the experts of the variant. One pass over the data
+with arrays V times wider replaces V runs of Mixture.
+"""
+
+import numpy as np
+import pandas as pd
+
+from mixture import (
+    discount,
+    fill_asleep,
+    regrets,
+    resolve_loss,
+    step_BOA,
+    step_MLpol,
+    step_MLprod,
+)
+
+FLOOR = 1 / np.power(2, 20)
+
+
+class MaskedVariants:
+    """Slot variables of V variants of a mixture, each one running on a subset of the K experts.
+
+    Args:
+        masks (numpy.array): boolean array of shape (V, K), the experts of each variant.
+        model (str): "BOA", "MLpol" or "MLprod".
+        loss_type (function): function computing the regrets, as returned by resolve_loss.
+        loss_gradient (bool or function): whether the regrets are computed with the gradient of the loss.
+        forgetting (float, optional): forgetting factor, see Mixture. Defaults to None.
+    """
+
+    def __init__(self, masks, model, loss_type, loss_gradient, forgetting=None):
+        if model.upper() not in ["BOA", "MLPOL", "MLPROD"]:
+            raise ValueError(f"Expert values are not available for the {model} algorithm.")
+        self.masks = np.asarray(masks, dtype=bool)
+        self.model = model.upper()
+        self.loss_type = loss_type
+        self.loss_gradient = loss_gradient
+        self.forgetting = forgetting
+        shape = self.masks.shape
+        # Number of experts of each variant
+        self.K = np.sum(self.masks, axis=1, keepdims=True)
+        self.cum_vars = np.full(shape, FLOOR)
+        self.max_losses = np.full(shape, FLOOR)
+        self.cum_regrets = np.zeros(shape)
+        self.cum_reg_regrets = np.zeros(shape)
+        self.learning_rates = np.full(shape, FLOOR)
+        self.max_sq_regrets = np.zeros((shape[0], 1))
+
+    def weights(self, awake):
+        """Weights of the variants at a step, of shape (V, K)."""
+        if self.model == "BOA":
+            Raux = (
+                np.log(self.learning_rates)
+                + np.log(1 / self.K)
+                + self.learning_rates * self.cum_reg_regrets
+            )
+            Rmax = np.max(np.where(awake > 0, Raux, -np.inf), axis=1, keepdims=True)
+            w = np.where(awake > 0, np.exp(Raux - Rmax), 0)
+        elif self.model == "MLPOL":
+            w = self.learning_rates * np.maximum(self.cum_regrets, 0)
+            w_sum = np.sum(w, axis=1, keepdims=True)
+            w = np.where(w_sum != 0, w / np.where(w_sum != 0, w_sum, 1), 1 / self.K)
+            w = awake * w
+        else:
+            w = self.learning_rates * np.exp(self.cum_regrets)
+            w = awake * (w / np.sum(w, axis=1, keepdims=True))
+        return w / np.sum(w, axis=1, keepdims=True)
+
+    def regrets(self, w, x, y, awake):
+        """Predictions and regrets of the variants, as in Mixture.r_by_hand.
+
+        Args:
+            w (numpy.array): weights of shape (V, K).
+            x (numpy.array): experts of the step, of shape (K,) or (d, K).
+            y (numpy.array): target of the step, of shape (1,) or (d, 1).
+            awake (numpy.array): awake coefficients of shape (V, K).
+        Returns:
+            (numpy.array, numpy.array): predictions of shape (V,) + y.shape and regrets of shape (V, K).
+        """
+        batch_axes = tuple(range(1, x.ndim))
+        shape = (w.shape[0],) + (1,) * (x.ndim - 1) + (w.shape[1],)
+        w = w.reshape(shape)
+        awake = awake.reshape(shape)
+        y_hat = np.sum(w * x, axis=-1, keepdims=True)
+        r = regrets(self.loss_type, self.loss_gradient, x, y_hat, y, awake)
+        return y_hat, np.mean(r, axis=batch_axes)
+
+    def step(self, x, y, awake):
+        """Advances every variant by one step, returns their predictions.
+
+        Args:
+            x (numpy.array): experts of the step, of shape (K,) or (d, K).
+            y (numpy.array): target of the step, of shape (1,) or (d, 1).
+            awake (numpy.array): awake coefficients of the experts, of shape (K,).
+        """
+        awake = self.masks * awake
+        w = self.weights(awake)
+        y_hat, r = self.regrets(w, x, y, awake)
+        if self.model == "BOA":
+            step_BOA(self, r, self.K)
+        elif self.model == "MLPOL":
+            step_MLpol(self, r, np.max(np.square(r), axis=1, keepdims=True))
+        else:
+            step_MLprod(self, r, self.K)
+        if self.forgetting is not None:
+            discount(self, self.forgetting, self.model)
+        return y_hat
+
+
+def first_asleep_steps(awake, masks):
+    """First step at which no expert of each variant is awake.
+
+    Args:
+        awake (numpy.array): awake coefficients of shape (T, K).
+        masks (numpy.array): boolean array of shape (V, K), the experts of each variant.
+    Returns:
+        numpy.array: for each variant, the first step without any awake expert, -1 if there is none.
+    """
+    asleep = ((np.asarray(awake) > 0).astype(int) @ np.asarray(masks, dtype=int).T) == 0
+    return np.where(np.any(asleep, axis=0), np.argmax(asleep, axis=0), -1)
+
+
+def variant_losses(
+    experts,
+    y,
+    awake,
+    masks,
+    model="BOA",
+    loss_type="mse",
+    loss_gradient=True,
+    forgetting=None,
+):
+    """Average losses of V variants of a mixture, each one aggregating a subset of the experts.
+
+    Args:
+        experts (numpy.array): experts of shape (T, K) or (T, d, K).
+        y (numpy.array): targets of shape (T,) or (T, d).
+        awake (numpy.array): awake coefficients of shape (T, K), None for all experts awake.
+        masks (numpy.array): boolean array of shape (V, K), the experts of each variant.
+        model (str, optional): "BOA", "MLpol" or "MLprod". Defaults to "BOA".
+        loss_type (str or function, optional): loss, see Mixture. Defaults to "mse".
+        loss_gradient (bool or function, optional): see Mixture. Defaults to True.
+        forgetting (float, optional): forgetting factor, see Mixture. Defaults to None.
+    Returns:
+        numpy.array: the average loss of each variant, as Mixture.loss.
+    """
+    loss_function, gradient = resolve_loss(loss_type, loss_gradient)
+    x = fill_asleep(np.asarray(experts, dtype=float))
+    y = np.asarray(y, dtype=float)
+    awake = np.ones((x.shape[0], x.shape[-1])) if awake is None else np.asarray(awake, dtype=float)
+    masks = np.asarray(masks, dtype=bool)
+    if x.shape[:-1] != y.shape:
+        raise ValueError("Bad dimensions: x and y should have the same shape")
+    if masks.ndim != 2 or masks.shape[1] != x.shape[-1]:
+        raise ValueError(f"Bad dimention for masks, expected (V, {x.shape[-1]}) got {masks.shape}")
+    if not np.all(np.any(masks, axis=1)):
+        raise ValueError("Each variant must keep at least one expert")
+    steps = first_asleep_steps(awake, masks)
+    if np.any(steps >= 0):
+        v = np.argmax(steps >= 0)
+        raise ValueError(f"No expert of variant {v} is awake at step {steps[v]}")
+    variants = MaskedVariants(masks, model, gradient, loss_gradient, forgetting)
+    cum_losses = np.zeros(masks.shape[0])
+    for xt, value, awake_t in zip(x, y, awake):
+        yt = np.expand_dims(value, -1)
+        y_hat = variants.step(xt, yt, awake_t)
+        predictions = y_hat.reshape((-1,) + np.shape(value))
+        cum_losses += np.sum(
+            np.reshape(loss_function(predictions, value), (masks.shape[0], -1)), axis=1
+        )
+    return cum_losses / np.size(y)
+
+
+def expert_values(mixture, coalitions=None):
+    """Loss of a mixture without each expert, or without each coalition of experts.
+
+    The mixture is replayed on its history with the experts of its current pool, see
+    Mixture.block_array, together with all its variants in a single pass. A mixture has no
+    prediction at a step without any awake expert, so a coalition cannot be left out when it holds
+    all the awake experts of a step.
+
+    Args:
+        mixture (Mixture): a BOA, MLpol or MLprod mixture, without pruning.
+        coalitions (list, optional): lists of expert names left out together. Defaults to None,
+            each expert alone.
+    Returns:
+        pandas.DataFrame: one row per coalition, with the loss of the mixture without it, the change
+            of loss with respect to the whole mixture (positive when the coalition is useful) and
+            the number of experts left.
+
+    Example:
+        values = expert_values(mod_1)
+        pairs = expert_values(mod_1, coalitions=itertools.combinations(mod_1.experts_names, 2))
+    """
+    if mixture.pruning is not None:
+        raise ValueError("Expert values are not available for a mixture with pruning.")
+    names = list(mixture.experts_names)
+    if coalitions is None:
+        coalitions = [[name] for name in names]
+    coalitions = [list(coalition) for coalition in coalitions]
+    masks = np.ones((len(coalitions) + 1, len(names)), dtype=bool)
+    for i, coalition in enumerate(coalitions):
+        unknown = set(coalition) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown experts {sorted(unknown, key=str)}")
+        masks[i + 1, [names.index(name) for name in coalition]] = False
+    steps = first_asleep_steps(mixture.awakes, masks[1:])
+    if np.any(steps >= 0):
+        i = np.argmax(steps >= 0)
+        raise ValueError(
+            f"Experts {coalitions[i]} are the only awake experts at step {steps[i]}, "
+            "they cannot be left out"
+        )
+    losses = variant_losses(
+        mixture.experts,
+        mixture.targets,
+        mixture.awakes,
+        masks,
+        model=mixture.model,
+        loss_type=mixture.loss_function,
+        loss_gradient=mixture.loss_type if mixture.loss_gradient else False,
+        forgetting=mixture.forgetting,
+    )
+    return pd.DataFrame(
+        {
+            "loss": losses[1:],
+            "delta": losses[1:] - losses[0],
+            "K": np.sum(masks[1:], axis=1),
+        },
+        index=pd.Index([" + ".join(str(name) for name in c) for c in coalitions], name="left out"),
+    )
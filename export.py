@@ -0,0 +1,223 @@
+"""
+Columnar export of the history of a mixture and of its diagnostics.
+
+The history blocks of the mixture are read chunk by chunk, so no full copy of the history is
+built. Each chunk gives one table per quantity, with the expert names as columns:
+
+    series        : step, target, prediction, loss of the mixture, effective number of experts
+    weights       : weight of each expert
+    experts       : forecast of each expert, NaN for the missing forecasts of asleep experts
+    awakes        : activation coefficient of each expert
+    losses        : loss of each expert, an asleep expert suffering the loss of the mixture
+    residuals     : cumulative residual of each expert, as in the plot cumul_res
+    contributions : weight times prediction of the mixture, as in the plot contrib
+
+With d targets per step, each step gives d rows, identified by the columns step and position.
+The files of each table are listed in metadata.json, written once the export is complete.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+TABLES = ["series", "weights", "experts", "awakes", "losses", "residuals", "contributions"]
+
+
+def iter_blocks(mixture, chunk_size):
+    """Yields the history of a mixture by chunks of at most chunk_size steps, as dicts of arrays."""
+    parts, n_parts = [], 0
+    for block in mixture.history:
+        n = len(block["targets"])
+        start = 0
+        while start < n:
+            stop = min(n, start + chunk_size - n_parts)
+            rows = slice(start, stop)
+            parts.append(
+                {
+                    "targets": block["targets"][rows],
+                    "predictions": block["predictions"][rows],
+                    "weights": mixture.block_array(block, "weights", rows=rows),
+                    "experts": mixture.block_array(block, "experts", rows=rows),
+                    "awakes": mixture.block_array(block, "awakes", rows=rows),
+                    "effective_K": np.full(stop - start, len(block["active"])),
+                }
+            )
+            n_parts += stop - start
+            start = stop
+            if n_parts == chunk_size:
+                yield {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+                parts, n_parts = [], 0
+    if parts:
+        yield {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def iter_history(mixture, chunk_size=100000, tables=None):
+    """Yields the tables of the history of a mixture, chunk by chunk.
+
+    Args:
+        mixture (Mixture): the mixture.
+        chunk_size (int, optional): max number of steps per chunk. Defaults to 100000.
+        tables (list, optional): names of the tables, among TABLES. Defaults to None, all of them.
+    Yields:
+        dict: dict mapping each table name to a pandas.DataFrame of the chunk.
+    """
+    tables = TABLES if tables is None else tables
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables {sorted(unknown)}, available tables are {TABLES}")
+    names = [str(name) for name in mixture.experts_names]
+    carry = np.zeros(len(names))
+    step = 0
+    for chunk in iter_blocks(mixture, chunk_size):
+        n = len(chunk["targets"])
+        targets = chunk["targets"].reshape(n, -1)
+        d = targets.shape[1]
+        predictions = chunk["predictions"].reshape(n, d)
+        experts = chunk["experts"].reshape(n, d, len(names))
+        awakes = chunk["awakes"][:, None, :]
+        weights = np.broadcast_to(chunk["weights"][:, None, :], experts.shape)
+        p_experts = np.where(
+            awakes > 0,
+            experts * awakes + predictions[..., None] * (1 - awakes),
+            predictions[..., None],
+        )
+        index = {"step": np.repeat(step + np.arange(n), d)}
+        if d > 1:
+            index["position"] = np.tile(np.arange(d), n)
+        index = pd.DataFrame(index)
+
+        def table(values):
+            values = pd.DataFrame(values.reshape(n * d, len(names)), columns=names)
+            return pd.concat([index, values], axis=1)
+
+        result = {}
+        if "series" in tables:
+            result["series"] = index.assign(
+                target=targets.reshape(-1),
+                prediction=predictions.reshape(-1),
+                loss=mixture.loss_function(predictions, targets).reshape(-1),
+                effective_K=np.repeat(chunk["effective_K"], d),
+            )
+        if "weights" in tables:
+            result["weights"] = table(weights)
+        if "experts" in tables:
+            result["experts"] = table(experts)
+        if "awakes" in tables:
+            result["awakes"] = table(np.broadcast_to(awakes, experts.shape))
+        if "losses" in tables:
+            result["losses"] = table(mixture.loss_function(targets[..., None], p_experts))
+        if "residuals" in tables:
+            residuals = carry + np.cumsum((targets[..., None] - p_experts).reshape(n * d, -1), axis=0)
+            carry = residuals[-1]
+            result["residuals"] = table(residuals)
+        if "contributions" in tables:
+            result["contributions"] = table(weights * predictions[..., None])
+        step += n
+        yield result
+
+
+def export_history(
+    mixture,
+    directory,
+    format="parquet",
+    chunk_size=100000,
+    tables=None,
+    compression="zstd",
+):
+    """Writes the history of a mixture and its diagnostics in a columnar format, chunk by chunk.
+
+    Args:
+        mixture (Mixture): the mixture.
+        directory (str): output directory, created if needed.
+        format (str, optional): "parquet", one file per table with one row group per chunk, which
+            requires pyarrow, or "npz", one compressed numpy archive per table and chunk. Defaults to "parquet".
+        chunk_size (int, optional): max number of steps per chunk. Defaults to 100000.
+        tables (list, optional): names of the tables, among TABLES. Defaults to None, all of them.
+        compression (str, optional): parquet compression codec. Defaults to "zstd".
+    Returns:
+        list: paths of the files written.
+
+    Example:
+        export_history(mod_1, "runs/2024-01-01/h00_q50", format="parquet")
+        weights = pd.read_parquet("runs/2024-01-01/h00_q50/weights.parquet")
+    """
+    if format not in ["parquet", "npz"]:
+        raise NotImplementedError(f"{format} format is not implemented.")
+    if format == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise (ImportError("pyarrow is required to export in the parquet format"))
+    os.makedirs(directory, exist_ok=True)
+    metadata_path = os.path.join(directory, "metadata.json")
+    # The files of a previous export are no longer listed while this one is written
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+    paths = []
+    files = {}
+    writers = {}
+    try:
+        for i, chunk in enumerate(iter_history(mixture, chunk_size, tables)):
+            for name, frame in chunk.items():
+                if format == "npz":
+                    path = os.path.join(directory, f"{name}_{i:05d}.npz")
+                    np.savez_compressed(
+                        path,
+                        columns=np.array(frame.columns, dtype=str),
+                        values=frame.to_numpy(dtype=float),
+                    )
+                    paths.append(path)
+                    files.setdefault(name, []).append(os.path.basename(path))
+                else:
+                    batch = pa.Table.from_pandas(frame, preserve_index=False)
+                    if name not in writers:
+                        path = os.path.join(directory, f"{name}.parquet")
+                        writers[name] = pq.ParquetWriter(path, batch.schema, compression=compression)
+                        paths.append(path)
+                        files[name] = [os.path.basename(path)]
+                    writers[name].write_table(batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    with open(metadata_path, "w") as f:
+        json.dump(
+            {
+                "model": mixture.model,
+                "experts_names": [str(name) for name in mixture.experts_names],
+                "loss": float(mixture.loss),
+                "chunk_size": chunk_size,
+                "format": format,
+                "tables": files,
+            },
+            f,
+        )
+    return paths
+
+
+def read_npz(directory, table):
+    """Reads back a table exported in the npz format as a pandas.DataFrame.
+
+    Only the chunks listed in metadata.json are read, so the chunks left by a previous export of
+    the directory are ignored.
+    """
+    with open(os.path.join(directory, "metadata.json")) as f:
+        metadata = json.load(f)
+    if metadata.get("format") != "npz":
+        raise ValueError(f"No npz export in {directory}")
+    if table not in metadata["tables"]:
+        raise ValueError(
+            f"Table {table} was not exported, available tables are {list(metadata['tables'])}"
+        )
+    files = metadata["tables"][table]
+    frames = []
+    for f in files:
+        with np.load(os.path.join(directory, f)) as archive:
+            frames.append(pd.DataFrame(archive["values"], columns=archive["columns"]))
+    frame = pd.concat(frames, ignore_index=True)
+    for column in ["step", "position"]:
+        if column in frame:
+            frame[column] = frame[column].astype(int)
+    return frame
@@ -0,0 +1,83 @@
+"""
+Features of the price dataset, the inputs of the experts, computed in one vectorised pass.
+
+The features are those of the notebook:
+
+    calendar cycles : cosine and sine of the day and of the month
+    week            : day of the week and weekend flags
+    lags            : fossil fuel and nuclear productions two days before, i.e. 48 steps
+    target          : the price shifted by 24 steps
+
+The dates are parsed once, every new column is computed on whole arrays and the columns are
+added to the frame with a single concatenation.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Name of the cycle: (attribute of the dates, period), the notebook dividing the day of the month by 365
+CYCLES = {"day": ("day", 365), "month": ("month", 12)}
+# Name of the lagged column: column
+LAGS = {
+    "2_lags_coal": "coal",
+    "2_lags_fioul": "fioul",
+    "2_lags_gas": "gas",
+    "2_lags_nuke": "nuclear",
+}
+
+
+def cyclical(values, period):
+    """Cosine and sine of values of a given period."""
+    angles = np.asarray(values, dtype=float) / period * 2 * np.pi
+    return np.cos(angles), np.sin(angles)
+
+
+def make_features(
+    data,
+    date_column="date",
+    cycles=CYCLES,
+    lags=LAGS,
+    lag=48,
+    target="price",
+    target_shift=24,
+    target_name="target_price",
+    dropna=True,
+):
+    """Adds the features of the experts to the price dataset.
+
+    Args:
+        data (pandas.DataFrame): hourly rows, with a column of dates and the columns of lags and target.
+        date_column (str, optional): column of the dates. Defaults to "date".
+        cycles (dict, optional): dict mapping a name to an attribute of the dates, e.g. "month" or
+            "dayofyear", and its period, giving the columns cos_<name> and sin_<name>. Defaults to CYCLES.
+        lags (dict, optional): dict mapping the name of a lagged column to the column lagged. Defaults to LAGS.
+        lag (int, optional): number of steps of the lags. Defaults to 48.
+        target (str, optional): column of the target. Defaults to "price".
+        target_shift (int, optional): shift of the target column, as pandas.Series.shift. Defaults to 24.
+        target_name (str, optional): name of the shifted target. Defaults to "target_price".
+        dropna (bool, optional): whether to drop the rows with missing values, e.g. the first lag
+            rows. Defaults to True.
+    Returns:
+        pandas.DataFrame: the rows of data with the new columns.
+
+    Example:
+        whole_period = make_features(whole_period)
+        training_data = whole_period[whole_period["date_wo_h"].dt.year < 2022]
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(data[date_column]))
+    columns = {}
+    for name, (attribute, period) in cycles.items():
+        columns[f"cos_{name}"], columns[f"sin_{name}"] = cyclical(getattr(dates, attribute), period)
+    weekdays = np.asarray(dates.dayofweek)
+    columns["weekdays"] = weekdays
+    columns["weekend"] = (weekdays >= 5).astype(float)
+    columns["not_weekend"] = (weekdays < 5).astype(float)
+    for name, column in lags.items():
+        columns[name] = data[column].shift(lag).to_numpy()
+    if target_name is not None:
+        columns[target_name] = data[target].shift(target_shift).to_numpy()
+    features = pd.DataFrame(columns, index=data.index)
+    result = pd.concat([data.drop(columns=list(columns), errors="ignore"), features], axis=1)
+    if dropna:
+        result = result.dropna()
+    return result
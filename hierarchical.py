@@ -0,0 +1,220 @@
+"""
+Two-level aggregation: groups of experts are aggregated by inner mixtures, whose
+predictions are the experts of an outer mixture.
+
+The prediction of an inner mixture at time t only uses the targets before t, so the group
+forecasts fed to the outer mixture respect the sequential setting. A group whose experts are
+all asleep at time t is asleep for the outer mixture at time t.
+"""
+
+import numpy as np
+import pandas as pd
+
+from mixture import Mixture
+
+
+class HierarchicalMixture:
+    """Aggregation of groups of experts by inner mixtures and of the groups by an outer mixture.
+
+    Args:
+        y (numpy.array or pandas.DataFrame): array of targets
+        experts (pandas.DataFrame): array of experts
+        groups (dict or function): either a dict mapping each group name to the list of its
+            experts, or a function returning the group name of an expert name.
+        awake (numpy.array or pandas.DataFrame, optional): A matrix specifying the activation coefficients
+            of the experts. Defaults to None.
+        model (str, optional): aggregation rule of the outer mixture. Defaults to "BOA".
+        inner_model (str, optional): aggregation rule of the inner mixtures. Defaults to model.
+        loss_type (function or str, optional): loss function, see Mixture. Defaults to "mse".
+        loss_gradient (function or bool, optional): see Mixture. Defaults to True.
+
+    Attributes
+    ----------
+    inner : dict of the inner mixtures, by group
+    outer : mixture of the groups
+    group_weights : history of the weights of the groups
+
+    Example:
+        groups = {"q05": ["q05_set_0", "q05_set_1"], "q50": ["q50_set_0", "q50_set_1"]}
+        mod = HierarchicalMixture(y=targets, experts=experts, groups=groups, model="BOA")
+        mod.plot_mixture()
+        mod.plot_group("q05")
+    """
+
+    def __init__(
+        self,
+        y,
+        experts,
+        groups,
+        awake=None,
+        model="BOA",
+        inner_model=None,
+        loss_type="mse",
+        loss_gradient=True,
+    ):
+        if not isinstance(experts, pd.DataFrame):
+            raise (TypeError("Experts must be a pandas dataframe"))
+        self.experts_names = experts.columns
+        if callable(groups):
+            mapping = {}
+            for name in self.experts_names:
+                mapping.setdefault(groups(name), []).append(name)
+            groups = mapping
+        self.groups = {group: list(names) for group, names in groups.items()}
+        grouped = [name for names in self.groups.values() for name in names]
+        if sorted(map(str, grouped)) != sorted(map(str, self.experts_names)):
+            raise ValueError("Each expert must belong to exactly one group")
+        self.positions = {
+            group: self.experts_names.get_indexer(names)
+            for group, names in self.groups.items()
+        }
+        self.model = model
+        self.inner_model = model if inner_model is None else inner_model
+        self.loss_type = loss_type
+        self.loss_gradient = loss_gradient
+        self.inner = {group: None for group in self.groups}
+        self.outer = None
+        self.update(experts, y, awake=awake)
+
+    def check(self, experts, awake):
+        if set(experts.columns) != set(self.experts_names):
+            raise (
+                ValueError(
+                    f"Bad experts columns, expected {list(self.experts_names)} found {list(experts.columns)}"
+                )
+            )
+        experts = experts[self.experts_names]
+        if awake is None:
+            awake = np.ones(experts.shape)
+        if awake.shape != experts.shape:
+            raise ValueError(
+                f"Bad dimention for awake, expexted {experts.shape} got {awake.shape}"
+            )
+        if isinstance(awake, pd.DataFrame):
+            awake = awake[self.experts_names]
+        return experts, np.asarray(awake)
+
+    def update(self, new_experts, new_y, awake=None):
+        """updates the inner mixtures and the outer mixture with new experts and new targets.
+
+        Args:
+            new_experts (pandas.DataFrame): matrix of new experts used to update the model
+            new_y (numpy.array or pandas.DataFrame): array of new targets used to update the model
+            awake (numpy.array or pandas.Dataframe, optional): an array specifying the activation coefficients
+                of the experts. Defaults to None.
+        """
+        new_experts, awake = self.check(new_experts, awake)
+        y = new_y if isinstance(new_y, np.ndarray) else new_y.to_numpy()
+
+        def update_group(group):
+            group_awake = awake[:, self.positions[group]]
+            rows = np.any(group_awake > 0, axis=1)
+            n_rows = int(np.sum(rows))
+            if n_rows == 0:
+                return rows, np.array([])
+            group_experts = new_experts.iloc[rows, self.positions[group]]
+            if self.inner[group] is None:
+                self.inner[group] = Mixture(
+                    y=y[rows],
+                    experts=group_experts,
+                    awake=group_awake[rows],
+                    model=self.inner_model,
+                    loss_type=self.loss_type,
+                    loss_gradient=self.loss_gradient,
+                )
+            else:
+                self.inner[group].update(group_experts, y[rows], awake=group_awake[rows])
+            return rows, self.inner[group].predictions[-n_rows:]
+
+        group_experts = np.zeros((len(y), len(self.groups)))
+        group_awake = np.zeros((len(y), len(self.groups)))
+        for i, (rows, predictions) in enumerate(map(update_group, self.groups)):
+            group_experts[rows, i] = predictions
+            group_awake[rows, i] = 1
+        group_experts = pd.DataFrame(group_experts, columns=list(self.groups))
+        if self.outer is None:
+            self.outer = Mixture(
+                y=y,
+                experts=group_experts,
+                awake=group_awake,
+                model=self.model,
+                loss_type=self.loss_type,
+                loss_gradient=self.loss_gradient,
+            )
+        else:
+            self.outer.update(group_experts, y, awake=group_awake)
+
+    def group_predictions(self, new_experts, awake=None):
+        """Predictions of each inner mixture, with the awake coefficients of the groups."""
+        new_experts, awake = self.check(new_experts, awake)
+
+        def predict_group(group):
+            group_awake = awake[:, self.positions[group]]
+            rows = np.any(group_awake > 0, axis=1)
+            if self.inner[group] is None or not np.any(rows):
+                return np.zeros(len(new_experts)), np.zeros(len(new_experts))
+            predictions = np.zeros(len(new_experts))
+            predictions[rows] = self.inner[group].predict(
+                new_experts.iloc[rows, self.positions[group]], awake=group_awake[rows]
+            )[:, 0]
+            return predictions, rows.astype(float)
+
+        results = [predict_group(group) for group in self.groups]
+        predictions = pd.DataFrame(
+            np.column_stack([p for p, _ in results]), columns=list(self.groups)
+        )
+        return predictions, np.column_stack([a for _, a in results])
+
+    def predict(self, new_experts, awake=None):
+        """Predictions of the two-level mixture based on new experts and last coefficients.
+
+        Args:
+            new_experts (pandas.DataFrame): an array of new experts.
+            awake (numpy.array or pandas.Dataframe, optional): an array specifying the activation coefficients
+                of the experts. Defaults to None.
+        Returns:
+            numpy.array: array of predictions
+        """
+        predictions, group_awake = self.group_predictions(new_experts, awake)
+        return self.outer.predict(predictions, awake=group_awake)
+
+    @property
+    def predictions(self):
+        return self.outer.predictions
+
+    @property
+    def targets(self):
+        return self.outer.targets
+
+    @property
+    def loss(self):
+        return self.outer.loss
+
+    @property
+    def group_weights(self):
+        return pd.DataFrame(self.outer.weights, columns=list(self.groups))
+
+    def group_losses(self):
+        """Average loss of each inner mixture on the steps where its group was awake."""
+        return pd.Series(
+            {
+                group: np.nan if mixture is None else mixture.loss
+                for group, mixture in self.inner.items()
+            }
+        )
+
+    def expert_weights(self):
+        """Current weight of each expert, the product of its group weight and its inner weight."""
+        weights = pd.Series(0.0, index=self.experts_names)
+        for group_weight, (group, mixture) in zip(self.outer.w, self.inner.items()):
+            if mixture is not None:
+                weights[self.groups[group]] = group_weight * mixture.snapshot.weights
+        return weights
+
+    def plot_mixture(self, **kwargs):
+        """Diagnostic plots of the outer mixture, one series per group. See Mixture.plot_mixture."""
+        self.outer.plot_mixture(**kwargs)
+
+    def plot_group(self, group, **kwargs):
+        """Diagnostic plots of the inner mixture of a group. See Mixture.plot_mixture."""
+        self.inner[group].plot_mixture(**kwargs)
@@ -0,0 +1,186 @@
+"""
+Chunked ingestion of experts, targets and awake coefficients from CSV or Parquet files.
+
+The files are read in chunks of a fixed number of rows, optionally by a background thread which
+reads the next chunks while the mixture is updated with the current one, so the input is never
+loaded at once.
+"""
+
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+from mixture import Mixture
+
+
+def read_file_chunks(path, columns, chunk_size, read_options):
+    if str(path).endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise (ImportError("pyarrow is required to read parquet files"))
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        with pd.read_csv(path, usecols=columns, chunksize=chunk_size, **read_options) as reader:
+            yield from reader
+
+
+def read_chunks(paths, columns=None, chunk_size=10000, read_options=None):
+    """Yields the rows of one or several files, in order, by DataFrames of chunk_size rows.
+
+    Args:
+        paths (str or list): paths of the files, read one after the other. Files ending with .parquet
+            are read with pyarrow, the others with pandas.read_csv.
+        columns (list, optional): columns to read. Defaults to None, all of them.
+        chunk_size (int, optional): number of rows per chunk, the last one being shorter. Defaults to 10000.
+        read_options (dict, optional): options of pandas.read_csv, e.g. {"sep": ";"}. Defaults to None.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    read_options = {} if read_options is None else read_options
+    pending = []
+    n_pending = 0
+    for path in paths:
+        for frame in read_file_chunks(path, columns, chunk_size, read_options):
+            pending.append(frame)
+            n_pending += len(frame)
+            while n_pending >= chunk_size:
+                frame = pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+                yield frame.iloc[:chunk_size].reset_index(drop=True)
+                rest = frame.iloc[chunk_size:]
+                pending = [rest] if len(rest) > 0 else []
+                n_pending = len(rest)
+    if n_pending > 0:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def prefetch(iterator, depth=2):
+    """Runs an iterator in a background thread, at most depth items ahead of the consumer.
+
+    The exceptions of the iterator are raised in the consumer, and the thread stops when the
+    consumer stops iterating.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def send(item, error=None):
+        # A blocking put would never return once the consumer has stopped on a full queue
+        while not stop.is_set():
+            try:
+                items.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not send(item):
+                    return
+            send(done)
+        except BaseException as error:
+            send(done, error)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class ChunkedReader:
+    """Streams the experts, the targets and the awake coefficients of a mixture from files.
+
+    Args:
+        paths (str or list): CSV or Parquet files, read one after the other, see read_chunks.
+        target (str): column of the targets.
+        experts (list): columns of the experts, which are the experts names.
+        awake (dict, optional): dict mapping an expert name to the column of its awake coefficients,
+            the experts missing from the dict being awake. Defaults to None.
+        chunk_size (int, optional): number of rows per update. Defaults to 10000.
+        prefetch (int, optional): number of chunks read ahead by a background thread, 0 to read
+            in the thread of the updates. Defaults to 2.
+        read_options (dict, optional): options of pandas.read_csv. Defaults to None.
+
+    Only the input is bounded: the mixture still keeps its history in memory.
+
+    Example:
+        reader = ChunkedReader(["data_2019.csv", "data_2020.csv"], target="price", experts=names,
+                               read_options={"sep": ";"})
+        mod = reader.mixture(model="BOA")
+    """
+
+    def __init__(
+        self,
+        paths,
+        target,
+        experts,
+        awake=None,
+        chunk_size=10000,
+        prefetch=2,
+        read_options=None,
+    ):
+        self.paths = paths
+        self.target = target
+        self.experts = list(experts)
+        self.awake = {} if awake is None else dict(awake)
+        unknown = set(self.awake) - set(self.experts)
+        if unknown:
+            raise ValueError(f"Awake columns given for unknown experts {sorted(unknown)}")
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self.read_options = read_options
+
+    @property
+    def columns(self):
+        return list(dict.fromkeys(self.experts + [self.target] + list(self.awake.values())))
+
+    def __iter__(self):
+        """Yields (experts, targets, awake) chunks, the awake coefficients being in the order of experts."""
+        chunks = read_chunks(self.paths, self.columns, self.chunk_size, self.read_options)
+        if self.prefetch:
+            chunks = prefetch(chunks, self.prefetch)
+        for chunk in chunks:
+            experts = chunk[self.experts]
+            awake = np.ones(experts.shape)
+            for k, name in enumerate(self.experts):
+                if name in self.awake:
+                    awake[:, k] = chunk[self.awake[name]].to_numpy()
+            yield experts, chunk[self.target].to_numpy(dtype=float), awake
+
+    def feed(self, mixture):
+        """Updates a mixture with every chunk, returns the number of rows read."""
+        n_rows = 0
+        for experts, y, awake in self:
+            mixture.update(experts, y, awake=awake)
+            n_rows += len(y)
+        return n_rows
+
+    def mixture(self, **kwargs):
+        """Builds a Mixture on the first chunk and updates it with the next ones.
+
+        Args:
+            **kwargs: arguments of Mixture, e.g. model or loss_type.
+        """
+        chunks = iter(self)
+        try:
+            experts, y, awake = next(chunks)
+        except StopIteration:
+            raise (ValueError("No rows to read"))
+        mixture = Mixture(y=y, experts=experts, awake=awake, **kwargs)
+        for experts, y, awake in chunks:
+            mixture.update(experts, y, awake=awake)
+        return mixture
@@ -0,0 +1,246 @@
+"""
+Experts computed on demand.
+
+An expert is given as a provider, a function returning its forecasts for a set of rows. A provider
+is only called on the rows where its expert is awake, since the weight of an asleep expert is
+forced to zero, and its outputs are kept in a bounded LRU cache so that the recent rows are not
+computed twice. The forecasts of the asleep experts are missing, NaN in the history of the mixture.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mixture import Mixture
+
+
+class ExpertProviders:
+    """Forecasts of experts computed by providers, only where the experts are awake.
+
+    Args:
+        providers (dict): dict mapping each expert name to a function which takes a pandas.Index of
+            row labels and returns the forecasts of the expert for these rows, as an array-like.
+        n_jobs (int, optional): number of threads calling the providers in parallel. Defaults to None,
+            the providers being called one after the other.
+        cache (bool, optional): whether to keep the forecasts already computed. Defaults to True.
+        max_rows (int, optional): max number of rows kept per expert, the least recently used ones
+            being dropped. Defaults to 10000.
+
+    Attributes
+    ----------
+    calls : number of rows computed by each provider
+    """
+
+    def __init__(self, providers, n_jobs=None, cache=True, max_rows=10000):
+        self.providers = dict(providers)
+        self.n_jobs = n_jobs
+        self.cache = cache
+        self.max_rows = max_rows
+        self.cached = {name: OrderedDict() for name in self.providers}
+        self.calls = {name: 0 for name in self.providers}
+
+    @property
+    def experts_names(self):
+        return pd.Index(list(self.providers))
+
+    def add(self, name, provider):
+        if name in self.providers:
+            raise ValueError(f"Expert {name} already has a provider")
+        self.providers[name] = provider
+        self.cached[name] = OrderedDict()
+        self.calls[name] = 0
+
+    def remove(self, name):
+        del self.providers[name]
+        del self.cached[name]
+        del self.calls[name]
+
+    def clear_cache(self):
+        self.cached = {name: OrderedDict() for name in self.providers}
+
+    def check_awake(self, index, awake):
+        names = self.experts_names
+        if awake is None:
+            return np.ones((len(index), len(names)))
+        if isinstance(awake, pd.DataFrame):
+            if set(awake.columns) != set(names):
+                raise (
+                    ValueError(
+                        f"Bad awake columns, expected {list(names)} found {list(awake.columns)}"
+                    )
+                )
+            awake = awake[names]
+        awake = np.asarray(awake)
+        if awake.shape != (len(index), len(names)):
+            raise ValueError(
+                f"Bad dimention for awake, expexted {(len(index), len(names))} got {awake.shape}"
+            )
+        return awake
+
+    def evaluate_expert(self, name, labels):
+        """Forecasts of an expert for some row labels, calling its provider on the missing rows only."""
+        cached = self.cached[name]
+        missing = [label for label in labels if label not in cached]
+        computed = {}
+        if len(missing) > 0:
+            values = np.asarray(self.providers[name](pd.Index(missing)), dtype=float)
+            if values.shape != (len(missing),):
+                raise ValueError(
+                    f"Bad dimention for the forecasts of {name}, expected {(len(missing),)} got {values.shape}"
+                )
+            self.calls[name] += len(missing)
+            computed = dict(zip(missing, values))
+        result = np.array(
+            [computed[label] if label in computed else cached[label] for label in labels]
+        )
+        if self.cache:
+            for label in labels:
+                if label in cached:
+                    cached.move_to_end(label)
+            cached.update(computed)
+            while len(cached) > self.max_rows:
+                cached.popitem(last=False)
+        return result
+
+    def evaluate(self, index, awake=None):
+        """Matrix of the forecasts of the experts, computed only where they are awake.
+
+        Args:
+            index (pandas.Index or array-like): labels of the rows.
+            awake (numpy.array or pandas.DataFrame, optional): activation coefficients of the experts,
+                their columns in the order of the providers if it is not a DataFrame. Defaults to None.
+        Returns:
+            (pandas.DataFrame, numpy.array): the forecasts, NaN where an expert is asleep, and the
+                activation coefficients.
+        """
+        index = pd.Index(index)
+        awake = self.check_awake(index, awake)
+        names = list(self.providers)
+
+        def evaluate_column(k):
+            rows = np.flatnonzero(awake[:, k] > 0)
+            column = np.full(len(index), np.nan)
+            if len(rows) > 0:
+                column[rows] = self.evaluate_expert(names[k], index[rows])
+            return column
+
+        if self.n_jobs is None or self.n_jobs == 1:
+            columns = [evaluate_column(k) for k in range(len(names))]
+        else:
+            with ThreadPoolExecutor(self.n_jobs) as executor:
+                columns = list(executor.map(evaluate_column, range(len(names))))
+        experts = pd.DataFrame(
+            np.column_stack(columns) if columns else np.empty((len(index), 0)),
+            index=index,
+            columns=names,
+        )
+        return experts, awake
+
+
+class LazyMixture:
+    """Mixture of experts given by providers, which are only evaluated where they are needed.
+
+    At update time an expert is evaluated on the rows where it is awake. At prediction time it is
+    also skipped when its current weight is 0, for instance when it is frozen by the pruning.
+
+    Args:
+        y (numpy.array or pandas.Series): array of targets
+        providers (dict or ExpertProviders): providers of the experts, see ExpertProviders.
+        index (pandas.Index or array-like): labels of the rows of y, passed to the providers.
+        awake (numpy.array or pandas.DataFrame, optional): activation coefficients of the experts.
+            Defaults to None.
+        n_jobs (int, optional): number of threads calling the providers. Defaults to None.
+        model, coefficients, loss_type, loss_gradient, parameters, pruning: see Mixture.
+
+    Example:
+        providers = {"gbm": lambda rows: gbm.predict(features.loc[rows]), "naive": lambda rows: lag.loc[rows]}
+        mod = LazyMixture(y=targets, providers=providers, index=targets.index, awake=awake)
+        mod.predict(new_index, awake=new_awake)
+    """
+
+    def __init__(
+        self,
+        y,
+        providers,
+        index,
+        awake=None,
+        n_jobs=None,
+        model="BOA",
+        coefficients="uniform",
+        loss_type="mse",
+        loss_gradient=True,
+        parameters=None,
+        pruning=None,
+    ):
+        if not isinstance(providers, ExpertProviders):
+            providers = ExpertProviders(providers, n_jobs=n_jobs)
+        self.providers = providers
+        experts, awake = self.providers.evaluate(index, awake)
+        self.mixture = Mixture(
+            y=y,
+            experts=experts,
+            awake=awake,
+            model=model,
+            coefficients=coefficients,
+            loss_type=loss_type,
+            loss_gradient=loss_gradient,
+            parameters=parameters,
+            pruning=pruning,
+        )
+
+    def update(self, index, new_y, awake=None):
+        """updates the mixture with new targets, the experts being evaluated where they are awake.
+
+        Args:
+            index (pandas.Index or array-like): labels of the new rows.
+            new_y (numpy.array or pandas.Series): array of new targets.
+            awake (numpy.array or pandas.DataFrame, optional): activation coefficients of the experts.
+                Defaults to None.
+        """
+        experts, awake = self.providers.evaluate(index, awake)
+        self.mixture.update(experts, new_y, awake=awake)
+
+    def predict(self, index, awake=None):
+        """Predictions of the mixture for new rows, based on the last coefficients.
+
+        Args:
+            index (pandas.Index or array-like): labels of the new rows.
+            awake (numpy.array or pandas.DataFrame, optional): activation coefficients of the experts.
+                Defaults to None.
+        Returns:
+            numpy.array: array of predictions
+        """
+        snapshot = self.mixture.snapshot
+        index = pd.Index(index)
+        awake = self.providers.check_awake(index, awake)
+        # An expert with a zero weight does not contribute to the predictions
+        needed = awake * (snapshot.weights > 0)
+        experts, _ = self.providers.evaluate(index, needed)
+        return snapshot.predict(experts.to_numpy(), needed)
+
+    def add_expert(self, name, provider, init_weight=None):
+        """Adds an expert given by a provider, see Mixture.add_expert."""
+        self.providers.add(name, provider)
+        self.mixture.add_expert(name, init_weight=init_weight)
+
+    def remove_expert(self, name):
+        self.mixture.remove_expert(name)
+        self.providers.remove(name)
+
+    @property
+    def weights(self):
+        return self.mixture.weights
+
+    @property
+    def predictions(self):
+        return self.mixture.predictions
+
+    @property
+    def loss(self):
+        return self.mixture.loss
+
+    def plot_mixture(self, **kwargs):
+        """Diagnostic plots of the mixture. See Mixture.plot_mixture."""
+        self.mixture.plot_mixture(**kwargs)
@@ -0,0 +1,278 @@
+"""
+Diagnostic figure of a mixture updated after each update of the mixture.
+
+The figure keeps running reductions of the history over buckets of steps, whose width doubles
+when there are too many of them, so each refresh costs the new steps plus a bounded number of
+points per series, however long the history is.
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from mixture import MAX_POINTS, palette
+
+
+class Buckets:
+    """Running reduction of the rows of a series over contiguous buckets of steps.
+
+    Args:
+        n_columns (int): number of columns of the series.
+        max_buckets (int): max number of buckets, their width doubling when it is exceeded.
+        mode (str): "mean" to keep the means of the buckets, "minmax" to keep their min and max.
+    """
+
+    def __init__(self, n_columns, max_buckets=MAX_POINTS, mode="mean"):
+        self.max_buckets = max_buckets
+        self.mode = mode
+        self.width = 1
+        self.n_steps = 0
+        if mode == "mean":
+            self.values = [np.zeros((0, n_columns))]
+        else:
+            self.values = [np.full((0, n_columns), np.inf), np.full((0, n_columns), -np.inf)]
+        self.counts = np.zeros(0, dtype=int)
+
+    def append(self, rows):
+        """Adds the rows of shape (n, n_columns) of the next steps."""
+        n = rows.shape[0]
+        if n == 0:
+            return
+        ids = (self.n_steps + np.arange(n)) // self.width
+        n_buckets = ids[-1] + 1
+        self.grow(n_buckets)
+        np.add.at(self.counts, ids, 1)
+        if self.mode == "mean":
+            np.add.at(self.values[0], ids, rows)
+        else:
+            np.minimum.at(self.values[0], ids, rows)
+            np.maximum.at(self.values[1], ids, rows)
+        self.n_steps += n
+        while self.counts.shape[0] > self.max_buckets:
+            self.merge()
+
+    def grow(self, n_buckets):
+        extra = n_buckets - self.counts.shape[0]
+        if extra <= 0:
+            return
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=int)])
+        fills = [0.0] if self.mode == "mean" else [np.inf, -np.inf]
+        self.values = [
+            np.concatenate([value, np.full((extra, value.shape[1]), fill)])
+            for value, fill in zip(self.values, fills)
+        ]
+
+    def merge(self):
+        """Merges the buckets two by two."""
+        if self.counts.shape[0] % 2 == 1:
+            self.grow(self.counts.shape[0] + 1)
+        self.counts = self.counts[0::2] + self.counts[1::2]
+        if self.mode == "mean":
+            self.values = [self.values[0][0::2] + self.values[0][1::2]]
+        else:
+            self.values = [
+                np.minimum(self.values[0][0::2], self.values[0][1::2]),
+                np.maximum(self.values[1][0::2], self.values[1][1::2]),
+            ]
+        self.width *= 2
+        if self.counts[-1] == 0:
+            self.counts = self.counts[:-1]
+            self.values = [value[:-1] for value in self.values]
+
+    @property
+    def centers(self):
+        starts = np.arange(self.counts.shape[0]) * self.width
+        return starts + (self.counts - 1) / 2
+
+    def means(self):
+        return self.values[0] / self.counts[:, None]
+
+    def envelope(self):
+        """Positions and values of lines going through the min and the max of each bucket."""
+        centers = np.repeat(self.centers, 2)
+        values = np.empty((2 * self.counts.shape[0], self.values[0].shape[1]))
+        values[0::2] = self.values[0]
+        values[1::2] = self.values[1]
+        return centers, values
+
+
+class LiveFigure:
+    """Diagnostic figure bound to a mixture, refreshed with the new steps after each update.
+
+    The panels are the stacked weights, the dynamic average loss, the cumulative residuals and the
+    contributions of the experts, as in Mixture.plot_mixture. The experts drawn are the max_experts
+    experts with the largest weights when the figure is created, the others being summed up in
+    "others", and the mixture and the uniform mixture.
+
+    Args:
+        mixture (Mixture): the mixture to follow.
+        max_experts (int, optional): number of experts drawn. Defaults to 10.
+        colors (numpy.array, optional): colors of the experts drawn. Defaults to None.
+        max_points (int, optional): max number of points per series. Defaults to MAX_POINTS.
+        refresh (bool, optional): whether to redraw the figure after each update. Defaults to True.
+
+    Example:
+        live = LiveFigure(mixture)
+        for new_experts, new_y in stream:
+            mixture.update(new_experts, new_y)  # the figure follows
+        live.close()
+    """
+
+    def __init__(self, mixture, max_experts=10, colors=None, max_points=MAX_POINTS, refresh=True):
+        self.mixture = mixture
+        weights = mixture.snapshot.weights
+        max_experts = min(max_experts, len(weights))
+        best = np.argsort(weights)[::-1][:max_experts]
+        self.experts_names = [mixture.experts_names[k] for k in best]
+        if colors is None:
+            colors = palette(max_experts)
+        self.colors = np.array(colors)[:max_experts]
+        self.labels = self.experts_names + [mixture.model, "Uniform"]
+        self.line_colors = np.vstack([self.colors, [0, 0, 0], [0.3, 0.3, 0.3]])
+        n_lines = len(self.labels)
+        self.weights = Buckets(max_experts + 1, max_points // 2, "mean")
+        self.contributions = Buckets(max_experts + 2, max_points // 2, "mean")
+        self.cum_losses = Buckets(n_lines, max_points // 2, "minmax")
+        self.cum_residuals = Buckets(n_lines, max_points // 2, "minmax")
+        self.loss_carry = np.zeros(n_lines)
+        self.residual_carry = np.zeros(n_lines)
+        self.n_blocks = 0
+        self.n_steps = 0
+        self.fig, ax = plt.subplots(2, 2, figsize=(10, 6), dpi=100)
+        self.ax_weights, self.ax_loss = ax[0]
+        self.ax_residuals, self.ax_contributions = ax[1]
+        self.loss_lines = self.make_lines(self.ax_loss, "Dynamic average loss", "Average Loss")
+        self.residual_lines = self.make_lines(
+            self.ax_residuals, "Cumulative Residuals", "Cumulative Residuals"
+        )
+        (self.prediction_line,) = self.ax_contributions.plot(
+            [], [], color="black", linestyle="dashed", label="Predictions"
+        )
+        self.stacks = {self.ax_weights: [], self.ax_contributions: []}
+        for axis, title, ylabel in [
+            (self.ax_weights, "Weights associated with the experts", "Weights"),
+            (self.ax_contributions, "Contribution of each expert to the prediction", "Contributions"),
+        ]:
+            axis.set_title(title)
+            axis.set(ylabel=ylabel)
+            axis.grid()
+        handles, labels = self.ax_loss.get_legend_handles_labels()
+        self.fig.legend(handles, labels, loc="upper center", ncol=10, frameon=False)
+        self.fig.tight_layout(rect=(0, 0, 1, 0.93))
+        self.refresh = refresh
+        self.update()
+        mixture.add_listener(self.on_snapshot)
+
+    def make_lines(self, axis, title, ylabel):
+        lines = [
+            axis.plot([], [], color=color, label=label)[0]
+            for color, label in zip(self.line_colors, self.labels)
+        ]
+        axis.set_title(title)
+        axis.set(ylabel=ylabel)
+        axis.grid()
+        return lines
+
+    def on_snapshot(self, snapshot):
+        self.update()
+
+    def new_steps(self):
+        """Arrays of the steps recorded by the mixture since the last refresh."""
+        blocks = self.mixture.history[self.n_blocks :]
+        self.n_blocks = len(self.mixture.history)
+        if len(blocks) == 0:
+            return None
+        names = self.mixture.experts_names
+        positions = names.get_indexer(self.experts_names)
+        columns = np.maximum(positions, 0)
+        parts = {"experts": [], "awakes": [], "weights": [], "uniform": []}
+        for block in blocks:
+            for name in ["experts", "awakes", "weights"]:
+                parts[name].append(self.mixture.block_array(block, name, columns))
+            parts["uniform"].append(
+                np.nanmean(self.mixture.block_array(block, "experts"), axis=-1)
+            )
+        steps = {name: np.concatenate(value) for name, value in parts.items()}
+        steps["predictions"] = np.concatenate([block["predictions"] for block in blocks])
+        steps["targets"] = np.concatenate([block["targets"] for block in blocks])
+        # Removed experts are drawn as asleep
+        steps["awakes"] = steps["awakes"] * (positions >= 0)
+        steps["weights"] = steps["weights"] * (positions >= 0)
+        return steps
+
+    def update(self):
+        """Adds the new steps of the mixture to the figure."""
+        steps = self.new_steps()
+        if steps is None:
+            return
+        predictions = steps["predictions"]
+        targets = steps["targets"]
+        weights = steps["weights"]
+        awake = steps["awakes"]
+        experts = np.where(
+            awake > 0,
+            steps["experts"] * awake + predictions[:, None] * (1 - awake),
+            predictions[:, None],
+        )
+        series = np.column_stack([experts, predictions, steps["uniform"]])
+        others = np.clip(1 - np.sum(weights, axis=1, keepdims=True), 0, None)
+        self.weights.append(np.hstack([others, weights]))
+        self.contributions.append(
+            np.hstack([others * predictions[:, None], weights * predictions[:, None], predictions[:, None]])
+        )
+        losses = self.mixture.loss_function(targets[:, None], series)
+        cum_losses = self.loss_carry + np.cumsum(losses, axis=0)
+        self.loss_carry = cum_losses[-1]
+        counts = self.n_steps + np.arange(1, len(targets) + 1)
+        self.cum_losses.append(cum_losses / counts[:, None])
+        cum_residuals = self.residual_carry + np.cumsum(targets[:, None] - series, axis=0)
+        self.residual_carry = cum_residuals[-1]
+        self.cum_residuals.append(cum_residuals)
+        self.n_steps += len(targets)
+        self.draw()
+
+    def draw_stack(self, axis, centers, values):
+        for collection in self.stacks[axis]:
+            collection.remove()
+        colors = np.vstack([[0.6, 0.6, 0.6], self.colors])
+        self.stacks[axis] = axis.stackplot(
+            centers, values.T, colors=colors, edgecolor="white", labels=["others"] + self.experts_names
+        )
+
+    def draw(self):
+        """Sets the data of the artists, of bounded size, and redraws the canvas."""
+        centers = self.weights.centers
+        self.draw_stack(self.ax_weights, centers, self.weights.means())
+        contributions = self.contributions.means()
+        self.draw_stack(self.ax_contributions, centers, contributions[:, :-1])
+        self.prediction_line.set_data(centers, contributions[:, -1])
+        for buckets, lines in [
+            (self.cum_losses, self.loss_lines),
+            (self.cum_residuals, self.residual_lines),
+        ]:
+            positions, values = buckets.envelope()
+            for i, line in enumerate(lines):
+                line.set_data(positions, values[:, i])
+        for axis in [self.ax_loss, self.ax_residuals]:
+            axis.relim()
+            axis.autoscale_view()
+        # relim ignores the collections of the stack plots
+        right = max(self.n_steps - 1, 1)
+        self.ax_weights.set_xlim(0, right)
+        self.ax_weights.set_ylim(0, 1)
+        self.ax_contributions.set_xlim(0, right)
+        low = min(np.min(contributions), 0)
+        high = max(np.max(np.sum(contributions[:, :-1], axis=1)), np.max(contributions[:, -1]))
+        self.ax_contributions.set_ylim(low, high + 0.05 * (high - low) + 1e-12)
+        if self.refresh:
+            self.fig.canvas.draw_idle()
+            self.fig.canvas.flush_events()
+
+    def savefig(self, *args, **kwargs):
+        self.fig.savefig(*args, **kwargs)
+
+    def close(self):
+        """Stops following the mixture and closes the figure."""
+        if self.mixture is not None:
+            self.mixture.remove_listener(self.on_snapshot)
+            self.mixture = None
+            plt.close(self.fig)
@@ -2,9 +2,14 @@
 opera - Online Python by Expert Aggregation
 """
 
+import copy
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib import cbook
 import seaborn as sns
 from scipy.optimize import minimize
 
@@ -53,6 +58,125 @@ def normalize(x):
     return x / np.sum(x, axis=-1)
 
 
+def resolve_loss(loss_type, loss_gradient):
+    """Returns the loss function and the function used to compute the regrets.
+
+    The second function is the gradient of the loss when loss_gradient is True or a function,
+    and the loss itself otherwise.
+    """
+    if callable(loss_type):
+        if loss_gradient and not callable(loss_gradient):
+            raise ValueError(
+                "When a custom loss function is passed the loss_gradient should be either False or the gradient function corresponding to the loss function"
+            )
+        if callable(loss_gradient):
+            return loss_type, loss_gradient
+        return loss_type, loss_type
+    elif loss_type.lower() in ["mape", "mae", "mse", "msle", "mspe"]:
+        loss_function = globals()[loss_type.lower()]
+        if loss_gradient and not callable(loss_gradient):
+            return loss_function, globals()["gradient_" + loss_type.lower()]
+        elif loss_gradient and callable(loss_gradient):
+            return loss_function, loss_gradient
+        else:
+            return loss_function, loss_function
+    else:
+        raise NotImplementedError(f"{loss_type} loss function is not implemented.")
+
+
+def fill_asleep(x):
+    """Forecasts with the missing forecasts of asleep experts, given as NaN, set to 0."""
+    if x.dtype.kind == "f" and np.isnan(x).any():
+        return np.where(np.isnan(x), 0.0, x)
+    return x
+
+
+# Steps of the aggregation rules, shared by Mixture, sharded.Shard and expert_value.MaskedVariants.
+# The slot variables are attributes of state, arrays whose last axis is the experts, and r holds
+# the regrets of one step, of the shape of the slot variables.
+
+
+def regrets(loss_type, loss_gradient, x, y_hat, y, awake):
+    """Regrets of the experts x with respect to the prediction y_hat, before any averaging.
+
+    loss_type is the function used for the regrets, see resolve_loss.
+    """
+    if not loss_gradient:
+        return awake * (loss_type(y_hat, y) - loss_type(x, y))
+    return awake * (loss_type(y_hat, y) * y_hat - loss_type(y_hat, y) * x)
+
+
+def step_BOA(state, r, K):
+    """Updates the BOA slot variables of state with the regrets r, K being the number of experts."""
+    r_square = np.square(r)
+    state.max_losses = np.maximum(state.max_losses, np.abs(r))
+    B2 = np.power(2, np.ceil(np.log2(state.max_losses)))
+    state.cum_vars += r_square
+    state.learning_rates = np.minimum(1 / B2, np.sqrt(np.log(K) / state.cum_vars))
+    state.cum_reg_regrets += (
+        1
+        / 2
+        * (
+            r
+            - state.learning_rates * r_square
+            + B2 * (state.learning_rates * r > 1 / 2)
+        )
+    )
+    state.cum_regrets += r
+
+
+def step_MLpol(state, r, max_r_square):
+    """Updates the MLpol slot variables of state with the regrets r.
+
+    max_r_square is the largest squared regret of the step over all the experts of the mixture,
+    which may be spread over several states.
+    """
+    r_square = np.square(r)
+    state.cum_regrets += r
+    max_squared_regret_diff = np.maximum(max_r_square - state.max_sq_regrets, 0)
+    state.learning_rates = 1 / (
+        1 / state.learning_rates + r_square + max_squared_regret_diff
+    )
+    state.max_sq_regrets += max_squared_regret_diff
+
+
+def step_MLprod(state, r, K):
+    """Updates the MLprod slot variables of state with the regrets r, K being the number of experts."""
+    r_square = np.square(r)
+    state.cum_vars += r_square
+    state.max_losses = np.maximum(state.max_losses, np.abs(r))
+    epsilon = 1e-30
+    new_learning_rates = np.minimum(
+        np.minimum(0.5 / state.max_losses, np.sqrt(np.log(K) / state.cum_vars)),
+        np.ones(np.shape(state.learning_rates)) / epsilon,
+    )
+    state.cum_regrets = (
+        new_learning_rates / state.learning_rates * state.cum_regrets
+        + np.log(1 + new_learning_rates * r)
+    )
+    state.learning_rates = new_learning_rates
+
+
+def discount(state, gamma, model):
+    """Discounts the accumulators of the slot variables of state by the forgetting factor gamma.
+
+    The accumulators initialised at a positive value decay towards it, so the learning rates
+    stay bounded. A factor of 1 leaves them unchanged, exactly as without forgetting.
+    """
+    if gamma == 1:
+        return
+    floor = 1 / np.power(2, 20)
+    state.cum_regrets = gamma * state.cum_regrets
+    state.cum_reg_regrets = gamma * state.cum_reg_regrets
+    state.cum_vars = floor + gamma * (state.cum_vars - floor)
+    state.max_losses = floor + gamma * (state.max_losses - floor)
+    if model.upper() == "MLPOL":
+        state.learning_rates = 1 / (
+            1 / floor + gamma * (1 / state.learning_rates - 1 / floor)
+        )
+        state.max_sq_regrets = gamma * state.max_sq_regrets
+
+
 def idx_worst(arr, k):
     result = np.argpartition(arr, arr.shape[0] - k)
     return result[: arr.shape[0] - k]
@@ -63,24 +187,160 @@ def idx_best(arr, k):
     return result[arr.shape[0] - k :]
 
 
-def plot_weight(
-    ax,
-    colors,
-    mixture,
-    max_experts,
-    title=None,
-    ylabel=None,
-    index_start=None,
-    index_stop=None,
-):
+@lru_cache(maxsize=32)
+def palette(n_colors):
+    """Default colors of the plots, an array of shape (n_colors, 3) built once per size."""
+    colors = np.array(sns.color_palette(None, n_colors))
+    colors.setflags(write=False)
+    return colors
 
-    # Stack plot of weights associated to each expert
-    if title is None:
-        title = "Weights associated with the experts"
-    if ylabel is None:
-        ylabel = "Weights"
+
+# Max number of points drawn per series, about the width of a figure in pixels
+MAX_POINTS = 2000
+
+
+def bucket_edges(n, n_buckets):
+    return np.linspace(0, n, n_buckets + 1).astype(int)
+
+
+def bucket_mean(values, max_points=MAX_POINTS):
+    """Means of the rows of values over contiguous buckets, so that at most max_points rows are drawn.
+
+    Args:
+        values (numpy.array): array of shape (T,) or (T, m).
+        max_points (int, optional): max number of rows returned, None or 0 to keep all the rows.
+    Returns:
+        (numpy.array, numpy.array): the positions of the buckets in the original steps and the means.
+    """
+    n = values.shape[0]
+    if not max_points or n <= max_points:
+        return np.arange(n), values
+    edges = bucket_edges(n, max_points)
+    sums = np.add.reduceat(values, edges[:-1], axis=0)
+    counts = np.diff(edges).reshape((-1,) + (1,) * (values.ndim - 1))
+    return (edges[:-1] + edges[1:] - 1) / 2, sums / counts
+
+
+def min_max_decimate(values, max_points=MAX_POINTS):
+    """Keeps, for each column and each of max_points / 2 buckets, the rows of the min and of the max.
+
+    The decimated lines keep the envelope of the original ones, spikes included.
+
+    Args:
+        values (numpy.array): array of shape (T, m), one line per column.
+        max_points (int, optional): max number of points per line, None or 0 to keep all the points.
+    Returns:
+        (numpy.array, numpy.array): the positions in the original steps and the values, both of shape (n, m).
+    """
+    n = values.shape[0]
+    steps = np.broadcast_to(np.arange(n)[:, None], values.shape)
+    if not max_points or n <= max_points:
+        return steps, values
+    edges = bucket_edges(n, max_points // 2)
+    imin = np.array([np.argmin(values[a:b], axis=0) + a for a, b in zip(edges[:-1], edges[1:])])
+    imax = np.array([np.argmax(values[a:b], axis=0) + a for a, b in zip(edges[:-1], edges[1:])])
+    positions = np.empty((2 * imin.shape[0], values.shape[1]), dtype=int)
+    positions[0::2] = np.minimum(imin, imax)
+    positions[1::2] = np.maximum(imin, imax)
+    return positions, np.take_along_axis(values, positions, axis=0)
+
+
+class WeightsSnapshot(namedtuple("WeightsSnapshot", ["version", "weights", "experts_names"])):
+    """Immutable view of the weights of a mixture, published after each update.
+
+    Readers grab the current snapshot with a single attribute read, so they always see
+    the weights of one complete update even while the next one is being computed.
+
+    Attributes
+    ----------
+    version : number of updates published so far
+    weights : read-only array of the last coefficients
+    experts_names : names of the experts, in the order of weights
+    """
+
+    __slots__ = ()
+
+    def predict(self, x, awake):
+        """Aggregates the rows of x with the weights renormalised on the awake experts.
+
+        The rows of x may hold several targets, x being of shape (T, d, K) and awake of shape (T, K).
+        """
+        coef = awake * self.weights
+        coef = coef / np.sum(coef, axis=-1, keepdims=True)
+        coef = np.reshape(coef, coef.shape[:1] + (1,) * (np.ndim(x) - 2) + coef.shape[1:])
+        if x.dtype.kind == "f" and np.isnan(x).any():
+            # Asleep experts may have no forecast
+            x = np.where(np.reshape(awake, coef.shape) > 0, x, 0.0)
+        return np.sum(coef * x, axis=-1, keepdims=True)
+
+
+class AwakePlan(namedtuple("AwakePlan", ["index", "all_awake"])):
+    """Arrays of a binary awake mask, computed once and shared by the steps with the same mask.
+
+    Attributes
+    ----------
+    index : read-only array of the positions of the awake experts
+    all_awake : whether every expert is awake, the awake coefficients being then skipped
+    """
+
+    __slots__ = ()
+
+
+class AwakeCache:
+    """Bounded LRU cache interning the binary awake masks of a mixture, keyed by their bitsets.
+
+    Args:
+        max_size (int, optional): max number of distinct masks kept. Defaults to 256.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.plans_by_key = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def plans(self, awake):
+        """Plans of the rows of awake, of shape (T, K), or None when a coefficient is not 0 or 1.
+
+        The rows are grouped by bitset first, so each distinct mask of the update is looked up once.
+        """
+        active = awake > 0
+        if awake.shape[0] == 0 or not np.all(active == awake):
+            return None
+        bits = np.packbits(active, axis=1)
+        if bits.shape[0] == 1:
+            return [self.get(bits[0].tobytes(), active[0])]
+        keys, first, inverse = np.unique(bits, axis=0, return_index=True, return_inverse=True)
+        distinct = [self.get(key.tobytes(), active[i]) for key, i in zip(keys, first)]
+        return [distinct[i] for i in inverse.reshape(-1)]
+
+    def get(self, bits, active):
+        key = (active.shape[0], bits)
+        plan = self.plans_by_key.get(key)
+        if plan is not None:
+            self.hits += 1
+            self.plans_by_key.move_to_end(key)
+            return plan
+        self.misses += 1
+        index = np.flatnonzero(active)
+        index.setflags(write=False)
+        plan = AwakePlan(index, index.shape[0] == active.shape[0])
+        self.plans_by_key[key] = plan
+        if len(self.plans_by_key) > self.max_size:
+            self.plans_by_key.popitem(last=False)
+        return plan
+
+
+def stacked_experts(mixture, max_experts, colors, index_start=None, index_stop=None):
+    """Weights of the experts drawn in the stack plots, with their colors and labels.
+
+    The max_experts experts with the largest mean weights are drawn, the weights of the others
+    being summed up in a first "others" column.
+
+    Returns:
+        (numpy.array, numpy.array, numpy.array): the weights of shape (T, n), their colors and labels.
+    """
     printable_weights = mixture.weights[index_start:index_stop].copy()
-    # print(printable_weights)
     labels = np.array(mixture.experts_names)
     mean_weights = np.mean(printable_weights, axis=0)
     id_worst = idx_worst(mean_weights, max_experts)
@@ -88,24 +348,191 @@ def plot_weight(
     weights = printable_weights[:, id_best]
     colors = colors[id_best]
     labels = labels[id_best]
-    if mixture.w.shape[0] > max_experts:
+    if mixture.weights.shape[1] > max_experts:
         avg_weights = np.sum(printable_weights[:, id_worst], axis=1, keepdims=True)
         weights = np.hstack([avg_weights, weights])
         colors = np.vstack([[0.6, 0.6, 0.6], colors])
         labels = np.hstack([["others"], labels])
+    return weights, colors, labels
+
+
+def selected_experts(mixture, max_experts, colors, index_start=None, index_stop=None):
+    """Experts drawn in the boxplots and the loss plots, with their colors and labels.
+
+    The max_experts experts with the largest mean weights are drawn, followed by the worst and
+    the best of the others.
+
+    Returns:
+        (numpy.array, numpy.array, numpy.array): the columns of the experts, their colors and labels.
+    """
+    labels = np.array(mixture.experts_names)
+    mean_weights = np.mean(mixture.weights[index_start:index_stop], axis=0)
+    id_worst = idx_worst(mean_weights, max_experts)
+    id_best = idx_best(mean_weights, max_experts)
+    columns = list(id_best)
+    colors = colors[id_best]
+    labels = labels[id_best]
+    if id_worst.shape[0] > 0:
+        columns.append(id_worst[np.argmin(mean_weights[id_worst])])
+        colors = np.vstack([colors, [0.5, 0.5, 0.5]])
+        labels = np.hstack([labels, ["worst others"]])
+    if id_worst.shape[0] > 1:
+        columns.append(id_worst[np.argmax(mean_weights[id_worst])])
+        colors = np.vstack([colors, [0.7, 0.7, 0.7]])
+        labels = np.hstack([labels, ["best others"]])
+    return np.array(columns, dtype=int), colors, labels
+
+
+def check_scalar_targets(mixture, plot):
+    """Raises a ValueError for the plots of the predictions of a mixture with vector targets.
+
+    The weights of such a mixture are shared by the d targets of a step and can be drawn, not the
+    predictions.
+    """
+    if np.ndim(mixture.targets) > 1:
+        raise ValueError(
+            f"The {plot} plot is not available for vector targets, only plot_weight and boxplot_weight are"
+        )
+
+
+def series_predictions(
+    mixture, columns, index_start=None, index_stop=None, asleep_as_mixture=True
+):
+    """Predictions of some experts, of the mixture and of the uniform mixture, one column each.
+
+    Args:
+        mixture (Mixture): the mixture.
+        columns (numpy.array): columns of the experts, see selected_experts.
+        asleep_as_mixture (bool, optional): whether an asleep expert predicts as the mixture.
+            Defaults to True.
+    Returns:
+        numpy.array: array of shape (T, len(columns) + 2).
+    """
+    check_scalar_targets(mixture, "series")
+    printable_experts = mixture.experts[index_start:index_stop].copy()
+    predictions = mixture.predictions[index_start:index_stop].copy()
+    K = printable_experts.shape[1]
+    if np.isnan(printable_experts).any():
+        # The missing forecasts of asleep experts are left out of the uniform mixture
+        unimix = np.nanmean(printable_experts, 1)
+    else:
+        unimix = np.sum(printable_experts * np.ones_like(printable_experts) / K, 1)
+    experts = printable_experts[:, columns]
+    if asleep_as_mixture:
+        printable_awakes = mixture.awakes[index_start:index_stop][:, columns]
+        experts = np.where(
+            printable_awakes > 0,
+            experts * printable_awakes
+            + predictions.reshape(predictions.shape[0], 1) * (1 - printable_awakes),
+            predictions.reshape(predictions.shape[0], 1),
+        )
+    return np.column_stack((experts, predictions, unimix))
+
+
+def series_legend(mixture, colors, labels):
+    """Colors and labels of the series of series_predictions."""
+    return (
+        np.vstack([colors, [0, 0, 0], [0.3, 0.3, 0.3]]),
+        np.hstack((labels, mixture.model, "Uniform")),
+    )
+
+
+def series_losses(mixture, preds, index_start=None, index_stop=None):
+    """Losses of the series of series_predictions, one row per series."""
+    targets = mixture.targets[index_start:index_stop].copy()
+    return np.array([mixture.loss_function(targets, pred) for pred in preds.T])
+
+
+def average_losses(mixture, preds, index_start=None, index_stop=None):
+    """Average losses of the series of series_predictions, without the missing forecasts."""
+    return np.nanmean(series_losses(mixture, preds, index_start, index_stop), 1)
+
+
+def dynamic_average_losses(mixture, preds, index_start=None, index_stop=None):
+    """Average losses of the series of series_predictions since the first step, one column per series."""
+    cumloss = np.cumsum(series_losses(mixture, preds, index_start, index_stop), 1).T
+    div = np.arange(1, preds.shape[0] + 1)
+    div = np.repeat(div, preds.shape[1]).reshape(preds.shape)
+    return cumloss / div
+
+
+def cumulative_residuals(mixture, preds, index_start=None, index_stop=None):
+    """Cumulative residuals of the series of series_predictions, one column per series."""
+    targets = mixture.targets[index_start:index_stop].copy()
+    return np.cumsum([targets - pred for pred in preds.T], 1).T
+
+
+# Titles and y labels of the diagnostic plots
+TITLES = {
+    "plot_weight": ("Weights associated with the experts", "Weights"),
+    "boxplot_weight": ("Weights associated with the experts", "Weights"),
+    "dyn_avg_loss": ("Dynamic average loss", "Average Loss"),
+    "cumul_res": ("Cumulative Residuals", "Cumulative Residuals"),
+    "avg_loss": ("Average loss suffered by the experts", "Average Loss"),
+    "contrib": ("Contribution of each expert to the prediction", "Contributions"),
+}
+
+
+def set_titles(ax, plot, title=None, ylabel=None):
+    default_title, default_ylabel = TITLES[plot]
+    ax.set_title(default_title if title is None else title)
+    ax.set(ylabel=default_ylabel if ylabel is None else ylabel)
+    ax.grid()
+
+
+def draw_stack(ax, steps, values, colors, labels, predictions=None):
+    """Stack plot of the columns of values, with the predictions dashed on top if given."""
     ax.stackplot(
-        range(len(weights)),
-        np.stack(weights).T,
+        steps,
+        values.T,
         edgecolor="white",
         colors=colors,
         labels=labels,
     )
-    ax.set_title(title)
-    ax.set(ylabel=ylabel)
-    ax.grid()
+    if predictions is not None:
+        ax.plot(
+            steps,
+            predictions,
+            color="black",
+            linestyle="dashed",
+            label="Predictions",
+        )
 
 
-def boxplot_weight(
+def draw_boxplot(ax, stats, colors):
+    """Boxplots of the statistics of cbook.boxplot_stats, by decreasing mean."""
+    idx = np.argsort([-stat["mean"] for stat in stats], kind="stable")
+    handles = ax.bxp([stats[i] for i in idx], showfliers=False, patch_artist=True)
+    for box, c in zip(handles["boxes"], colors[idx]):
+        box.set_facecolor(c)
+    ax.set_xticks(range(1, len(idx) + 1))
+    ax.set_xticklabels([stats[i]["label"] for i in idx], rotation=90)
+    return handles
+
+
+def draw_lines(ax, steps, values, colors, labels, order=None):
+    """One line per column of values, the positions being the ones of min_max_decimate."""
+    for i in range(values.shape[1]) if order is None else order:
+        ax.plot(steps[:, i], values[:, i], color=colors[i], label=labels[i])
+
+
+def draw_bars(ax, losses, colors, labels):
+    """Bars of the losses, by increasing loss."""
+    idx = np.argsort(losses)
+    ax.bar(labels[idx], losses[idx], color=colors[idx], alpha=1, label=labels[idx])
+    ax.set_xticks(range(len(idx)))
+    ax.set_xticklabels(labels[idx], rotation=90)
+
+
+def layout_panels(fig, ax):
+    """Legend and layout of the figure of the six diagnostic plots."""
+    handles, labels = ax[1, 1].get_legend_handles_labels()
+    fig.legend(handles, labels, loc="upper center", ncol=10, bbox_to_anchor=(0.5, 1), frameon=False)
+    fig.suptitle(" ", fontsize=24)
+    fig.tight_layout()
+
+
+def plot_weight(
     ax,
     colors,
     mixture,
@@ -114,54 +541,35 @@ def boxplot_weight(
     ylabel=None,
     index_start=None,
     index_stop=None,
+    max_points=MAX_POINTS,
 ):
-    # Boxplot of weights associated to each expert
-
-    if title is None:
-        title = "Weights associated with the experts"
-    if ylabel is None:
-        ylabel = "Weights"
-    labels = np.array(mixture.experts_names)
-    printable_weights = mixture.weights[index_start:index_stop].copy()
-
-    mean_weights = np.mean(printable_weights, axis=0)
 
-    id_worst = idx_worst(mean_weights, max_experts)
-    id_best = idx_best(mean_weights, max_experts)
+    # Stack plot of weights associated to each expert
+    weights, colors, labels = stacked_experts(
+        mixture, max_experts, colors, index_start, index_stop
+    )
+    steps, weights = bucket_mean(weights, max_points)
+    draw_stack(ax, steps, weights, colors, labels)
+    set_titles(ax, "plot_weight", title, ylabel)
 
-    weights = printable_weights[:, id_best]
-    colors = colors[id_best]
-    labels = labels[id_best]
-    if id_worst.shape[0] > 0:
-        id_worst_worst = id_worst[np.argmin(mean_weights[id_worst])]
-        worst_worst_weights = printable_weights[:, id_worst_worst]
-        worst_worst_weights = worst_worst_weights.reshape(
-            worst_worst_weights.shape[0], 1
-        )
-        weights = np.hstack([weights, worst_worst_weights])
-        colors = np.vstack([colors, [0.5, 0.5, 0.5]])
-        labels = np.hstack([labels, ["worst others"]])
-    if id_worst.shape[0] > 1:
-        id_best_worst = id_worst[np.argmax(mean_weights[id_worst])]
-        best_worst_weights = printable_weights[:, id_best_worst]
-        best_worst_weights = best_worst_weights.reshape(best_worst_weights.shape[0], 1)
-        weights = np.hstack([weights, best_worst_weights])
-        colors = np.vstack([colors, [0.7, 0.7, 0.7]])
-        labels = np.hstack([labels, ["best others"]])
 
-    idx = np.argsort(np.mean(weights, 0))[::-1]
-    handles = ax.boxplot(
-        np.stack(weights)[:, idx],
-        showfliers=False,
-        patch_artist=True,
-        labels=labels[idx],
+def boxplot_weight(
+    ax,
+    colors,
+    mixture,
+    max_experts,
+    title=None,
+    ylabel=None,
+    index_start=None,
+    index_stop=None,
+):
+    # Boxplot of weights associated to each expert
+    columns, colors, labels = selected_experts(
+        mixture, max_experts, colors, index_start, index_stop
     )
-    for box, c in zip(ax.patches, colors[idx]):
-        box.set_facecolor(c)
-    ax.set_title(title)
-    ax.set_xticklabels(labels[idx], rotation=90)
-    ax.set(ylabel=ylabel)
-    ax.grid()
+    weights = mixture.weights[index_start:index_stop][:, columns]
+    handles = draw_boxplot(ax, cbook.boxplot_stats(weights, labels=labels), colors)
+    set_titles(ax, "boxplot_weight", title, ylabel)
 
     return handles
 
@@ -177,52 +585,16 @@ def avg_loss(
     index_stop=None,
 ):
 
-    if title is None:
-        title = "Average loss suffered by the experts"
-    if ylabel is None:
-        ylabel = "Average Loss"
-    labels = np.array(mixture.experts_names)
-    K = mixture.experts.shape[1]
-    printable_weights = mixture.weights[index_start:index_stop].copy()
-
-    mean_weights = np.mean(printable_weights, axis=0)
-    id_worst = idx_worst(mean_weights, max_experts)
-    id_best = idx_best(mean_weights, max_experts)
-    printable_experts = mixture.experts[index_start:index_stop].copy()
-    experts = printable_experts[:, id_best]
-    predictions = mixture.predictions[index_start:index_stop].copy()
-    targets = mixture.targets[index_start:index_stop].copy()
-    unimix = np.sum(printable_experts * np.ones_like(printable_experts) / K, 1)
-    colors = colors[id_best]
-    labels = labels[id_best]
-
-    if id_worst.shape[0] > 0:
-        id_worst_worst = id_worst[np.argmin(mean_weights[id_worst])]
-        worst_worst_experts = printable_experts[:, id_worst_worst]
-        worst_worst_experts = worst_worst_experts.reshape(
-            worst_worst_experts.shape[0], 1
-        )
-        experts = np.hstack([experts, worst_worst_experts])
-        colors = np.vstack([colors, [0.5, 0.5, 0.5]])
-        labels = np.hstack([labels, ["worst others"]])
-    if id_worst.shape[0] > 1:
-        id_best_worst = id_worst[np.argmax(mean_weights[id_worst])]
-        best_worst_experts = printable_experts[:, id_best_worst]
-        best_worst_experts = best_worst_experts.reshape(best_worst_experts.shape[0], 1)
-        experts = np.hstack([experts, best_worst_experts])
-        colors = np.vstack([colors, [0.7, 0.7, 0.7]])
-        labels = np.hstack([labels, ["best others"]])
-    alabels = np.hstack((labels, mixture.model, "Uniform"))
-    colors = np.vstack([colors, [0, 0, 0], [0.3, 0.3, 0.3]])
-    preds = np.column_stack((experts, predictions, unimix))
-    loss = np.array([mixture.loss_function(targets, pred) for pred in preds.T])
-    sortedloss = np.sort(loss.mean(1))  # - epsilon
-    idx = np.argsort(loss.mean(1))
-    ax.bar(alabels[idx], sortedloss, color=colors[idx], alpha=1, label=alabels[idx])
-    ax.set_title(title)
-    ax.set_xticklabels(alabels[idx], rotation=90)
-    ax.set(ylabel=ylabel)
-    ax.grid()
+    columns, colors, labels = selected_experts(
+        mixture, max_experts, colors, index_start, index_stop
+    )
+    colors, alabels = series_legend(mixture, colors, labels)
+    preds = series_predictions(
+        mixture, columns, index_start, index_stop, asleep_as_mixture=False
+    )
+    loss = average_losses(mixture, preds, index_start, index_stop)
+    draw_bars(ax, loss, colors, alabels)
+    set_titles(ax, "avg_loss", title, ylabel)
 
 
 def cumul_res(
@@ -234,57 +606,19 @@ def cumul_res(
     ylabel=None,
     index_start=None,
     index_stop=None,
+    max_points=MAX_POINTS,
 ):
 
-    if title is None:
-        title = "Cumulative Residuals"
-    if ylabel is None:
-        ylabel = "Cumulative Residuals"
-    labels = np.array(mixture.experts_names)
-    K = mixture.experts.shape[1]
-    printable_weights = mixture.weights[index_start:index_stop].copy()
-    printable_awakes = mixture.awakes[index_start:index_stop].copy()
-    printable_experts = mixture.experts[index_start:index_stop].copy()
-    predictions = mixture.predictions[index_start:index_stop].copy()
-    targets = mixture.targets[index_start:index_stop].copy()
-    unimix = np.sum(printable_experts * np.ones_like(printable_experts) / K, 1)
-    p_experts = printable_experts * printable_awakes + predictions.reshape(
-        predictions.shape[0], 1
-    ) * (1 - printable_awakes)
-    mean_weights = np.mean(printable_weights, axis=0)
-    id_worst = idx_worst(mean_weights, max_experts)
-    id_best = idx_best(mean_weights, max_experts)
-    pred_experts = p_experts[:, id_best]
-    colors = colors[id_best]
-    labels = labels[id_best]
-
-    if id_worst.shape[0] > 0:
-        id_worst_worst = id_worst[np.argmin(mean_weights[id_worst])]
-        worst_worst_experts = p_experts[:, id_worst_worst]
-        worst_worst_experts = worst_worst_experts.reshape(
-            worst_worst_experts.shape[0], 1
-        )
-        pred_experts = np.hstack([pred_experts, worst_worst_experts])
-        colors = np.vstack([colors, [0.5, 0.5, 0.5]])
-        labels = np.hstack([labels, ["worst others"]])
-    if id_worst.shape[0] > 1:
-        id_best_worst = id_worst[np.argmax(mean_weights[id_worst])]
-        best_worst_experts = p_experts[:, id_best_worst]
-        best_worst_experts = best_worst_experts.reshape(best_worst_experts.shape[0], 1)
-        pred_experts = np.hstack([pred_experts, best_worst_experts])
-        colors = np.vstack([colors, [0.7, 0.7, 0.7]])
-        labels = np.hstack([labels, ["best others"]])
-    alabels = np.hstack((labels, mixture.model, "Uniform"))
-    colors = np.vstack([colors, [0, 0, 0], [0.3, 0.3, 0.3]])
-    preds = np.column_stack((pred_experts, predictions, unimix))
-    cumres = np.cumsum([targets - pred for pred in preds.T], 1).T
-    for i in range(2, cumres.shape[1]):
-        ax.plot(cumres[:, i], color=colors[i], label=alabels[i])
-    ax.plot(cumres[:, 0], color=colors[0], label=alabels[0])
-    ax.plot(cumres[:, 1], color=colors[1], label=alabels[1])
-    ax.set_title(title)
-    ax.set(ylabel=ylabel)
-    ax.grid()
+    columns, colors, labels = selected_experts(
+        mixture, max_experts, colors, index_start, index_stop
+    )
+    colors, alabels = series_legend(mixture, colors, labels)
+    preds = series_predictions(mixture, columns, index_start, index_stop)
+    cumres = cumulative_residuals(mixture, preds, index_start, index_stop)
+    steps, cumres = min_max_decimate(cumres, max_points)
+    order = list(range(2, cumres.shape[1])) + [0, 1]
+    draw_lines(ax, steps, cumres, colors, alabels, order)
+    set_titles(ax, "cumul_res", title, ylabel)
 
 
 def dyn_avg_loss(
@@ -296,61 +630,18 @@ def dyn_avg_loss(
     ylabel=None,
     index_start=None,
     index_stop=None,
+    max_points=MAX_POINTS,
 ):
 
-    if title is None:
-        title = "Dynamic average loss"
-    if ylabel is None:
-        ylabel = "Average Loss"
-    labels = np.array(mixture.experts_names)
-    K = mixture.experts.shape[1]
-    printable_weights = mixture.weights[index_start:index_stop].copy()
-    printable_awakes = mixture.awakes[index_start:index_stop].copy()
-    printable_experts = mixture.experts[index_start:index_stop].copy()
-    unimix = np.sum(printable_experts * np.ones_like(printable_experts) / K, 1)
-    predictions = mixture.predictions[index_start:index_stop].copy()
-    targets = mixture.targets[index_start:index_stop].copy()
-
-    p_experts = printable_experts * printable_awakes + predictions.reshape(
-        predictions.shape[0], 1
-    ) * (1 - printable_awakes)
-    mean_weights = np.mean(printable_weights, axis=0)
-    id_worst = idx_worst(mean_weights, max_experts)
-    id_best = idx_best(mean_weights, max_experts)
-    pred_experts = p_experts[:, id_best]
-    colors = colors[id_best]
-    labels = labels[id_best]
-
-    if id_worst.shape[0] > 0:
-        id_worst_worst = id_worst[np.argmin(mean_weights[id_worst])]
-        worst_worst_experts = p_experts[:, id_worst_worst]
-        worst_worst_experts = worst_worst_experts.reshape(
-            worst_worst_experts.shape[0], 1
-        )
-        pred_experts = np.hstack([pred_experts, worst_worst_experts])
-        colors = np.vstack([colors, [0.5, 0.5, 0.5]])
-        labels = np.hstack([labels, ["worst others"]])
-    if id_worst.shape[0] > 1:
-        id_best_worst = id_worst[np.argmax(mean_weights[id_worst])]
-        best_worst_experts = p_experts[:, id_best_worst]
-        best_worst_experts = best_worst_experts.reshape(best_worst_experts.shape[0], 1)
-        pred_experts = np.hstack([pred_experts, best_worst_experts])
-        colors = np.vstack([colors, [0.7, 0.7, 0.7]])
-        labels = np.hstack([labels, ["best others"]])
-    alabels = np.hstack((labels, mixture.model, "Uniform"))
-    colors = np.vstack([colors, [0, 0, 0], [0.3, 0.3, 0.3]])
-    preds = np.column_stack((pred_experts, predictions, unimix))
-    cumloss = np.cumsum([mixture.loss_function(targets, pred) for pred in preds.T], 1).T
-    div = np.arange(1, preds.shape[0] + 1)
-    div = np.repeat(div, preds.shape[1]).reshape(preds.shape)
-    cumloss = cumloss / div
-    for i in range(0, cumloss.shape[1]):
-        ax.plot(cumloss[:, i], color=colors[i], label=alabels[i])
-
-    ax.set_title(title)
-    ax.set(ylabel=ylabel)
-
-    ax.grid()
+    columns, colors, labels = selected_experts(
+        mixture, max_experts, colors, index_start, index_stop
+    )
+    colors, alabels = series_legend(mixture, colors, labels)
+    preds = series_predictions(mixture, columns, index_start, index_stop)
+    cumloss = dynamic_average_losses(mixture, preds, index_start, index_stop)
+    steps, cumloss = min_max_decimate(cumloss, max_points)
+    draw_lines(ax, steps, cumloss, colors, alabels)
+    set_titles(ax, "dyn_avg_loss", title, ylabel)
 
 
 def contrib(
@@ -362,46 +653,24 @@ def contrib(
     ylabel=None,
     index_start=None,
     index_stop=None,
+    max_points=MAX_POINTS,
 ):
 
-    if title is None:
-        title = "Contribution of each expert to the prediction"
-    if ylabel is None:
-        ylabel = "Contributions"
+    check_scalar_targets(mixture, "contrib")
 
     # Stack plot of weights associated to each expert
-    printable_weights = mixture.weights[index_start:index_stop].copy()
     printable_predictions = mixture.predictions[index_start:index_stop].copy()
-    mean_weights = np.mean(printable_weights, axis=0)
-    id_worst = idx_worst(mean_weights, max_experts)
-    id_best = idx_best(mean_weights, max_experts)
-    labels = np.array(mixture.experts_names)
-    weights = printable_weights[:, id_best]
-    colors = colors[id_best]
-    labels = labels[id_best]
-    if mixture.w.shape[0] > max_experts:
-        avg_weights = np.sum(printable_weights[:, id_worst], axis=1, keepdims=True)
-        weights = np.hstack([avg_weights, weights])
-        colors = np.vstack([[0.6, 0.6, 0.6], colors])
-        labels = np.hstack([["others"], labels])
-
-    ax.stackplot(
-        range(len(weights)),
-        np.stack(weights).T * printable_predictions,
-        edgecolor="white",
-        colors=colors,
-        labels=labels,
+    weights, colors, labels = stacked_experts(
+        mixture, max_experts, colors, index_start, index_stop
     )
-    ax.plot(
-        range(len(printable_predictions)),
-        printable_predictions,
-        color="black",
-        linestyle="dashed",
-        label="Predictions",
+
+    # The contributions sum to the predictions, so their bucket means sum to the means of the predictions
+    steps, contributions = bucket_mean(
+        np.stack(weights) * printable_predictions.reshape(-1, 1), max_points
     )
-    ax.set_title(title)
-    ax.set(ylabel=ylabel)
-    ax.grid()
+    steps, printable_predictions = bucket_mean(printable_predictions, max_points)
+    draw_stack(ax, steps, contributions, colors, labels, printable_predictions)
+    set_titles(ax, "contrib", title, ylabel)
 
 
 class Mixture:
@@ -422,10 +691,12 @@ class Mixture:
     the help of expert advice.
 
     Args:
-        y (numpy.array or pandas.DataFrame): array of targets
-        experts (numpy.array or pandas.DataFrame): array of experts
-        awake (numpy.array or pandas.DataFrame, optional): A matrix specifying the activation coefficients
-            of the experts. Defaults to None.
+        y (numpy.array or pandas.DataFrame): array of targets, of shape (T,) or (T, d) for d targets per step
+        experts (numpy.array or pandas.DataFrame): array of experts, a DataFrame of shape (T, K) or an array
+            of shape (T, d, K) whose d rows per step are aggregated with the same weights, the regrets
+            being averaged over the d targets
+        awake (numpy.array or pandas.DataFrame, optional): A matrix of shape (T, K) specifying the activation
+            coefficients of the experts. Defaults to None.
         model (str, optional): string specifying the aggregation rule to use. Currently available aggregation
             rules are: BOA, MLpol, MLprod, FTRL. Defaults to "BOA".
         coefficients (array or str, optional): array of weight to be used for the aggregation rule. Defaults to "uniform".
@@ -446,6 +717,29 @@ class Mixture:
             - "tol": tolerance for termination
             - "options": a dictionary of solver options
             For more informations on how to use the parameters, give a look to Example 4 below
+        pruning (dict): dict of optional parameters to freeze the experts with negligible weights, default to None
+            (no pruning). Not available for FTRL. Available parameters :
+            - "threshold": weight under which an awake expert is considered negligible, default to 1e-3
+            - "patience": number of consecutive awake steps under the threshold before freezing an expert,
+                default to 100
+            - "review_every": number of steps between two reviews, default to 100
+            - "review_samples": number of steps of each period on which the frozen experts are screened,
+                default to 10, None for all the steps
+            The experts are frozen at the reviews. A frozen expert is left out of the per step computations
+            and of the weights history. At each review, estimates of the slot variables of the frozen experts
+            are advanced in one vectorised pass over review_samples steps of the period, each of them standing
+            for the skipped ones. The experts whose estimated weight is above the threshold are brought exactly
+            up to date from the history, and re-admitted if their exact weight is above the threshold.
+        experts_names (list, optional): names of the experts when experts is an array of shape (T, d, K).
+            Defaults to None.
+        forgetting (float, optional): forgetting factor in (0, 1] of the BOA, MLpol and MLprod accumulators,
+            default to None (no forgetting). After each step, the cumulative regrets and losses are multiplied
+            by the factor, so the aggregation tracks changes of regime with an effective memory of about
+            1 / (1 - forgetting) steps, instead of being refitted on rolling windows. The running maxima
+            decay the same way towards their initial values. Not available for FTRL nor with pruning.
+        checkpoint_every (int, optional): number of steps between two checkpoints of the slot variables,
+            default to None (no checkpoints). The checkpoints let replay_from restart from the last
+            checkpoint before a given step instead of the first step.
 
     Attributes
     ----------
@@ -454,6 +748,8 @@ class Mixture:
     awakes : history of awakes
     experts : history of experts
     targets : history of targets
+    effective_K : history of the number of experts not frozen by the pruning
+    snapshot : WeightsSnapshot of the last coefficients, replaced atomically after each update
 
     Methods
     -------
@@ -461,6 +757,9 @@ class Mixture:
     updates(new_experts, new_y, awake): updates the model sequentially with new experts and new targets
     predict(new_experts, awake): Performs sequential predictions and updates of a mixture object based on new observations
         and the last coefficients
+    publish(): publishes a new immutable snapshot of the current coefficients
+    add_listener(callback), remove_listener(callback): callbacks receiving each published snapshot
+    add_check(callback), remove_check(callback): callbacks validating the expert names before add_expert
     plot_mixture(plot_type, colors) : provides different diagnostic plots for an aggregation procedure.
 
     Examples
@@ -587,38 +886,34 @@ class Mixture:
         loss_type="mse",
         loss_gradient=True,
         parameters=None,
+        pruning=None,
+        experts_names=None,
+        forgetting=None,
+        checkpoint_every=None,
     ):
-        if callable(loss_type):
-            self.loss_type = loss_type
-            self.loss_function = loss_type
-            if loss_gradient and not callable(loss_gradient):
-                raise ValueError(
-                    "When a custom loss function is passed the loss_gradient should be either False or the gradient function corresponding to the loss function"
-                )
-            if callable(loss_gradient):
-                self.loss_type = loss_gradient
-        elif loss_type.lower() in ["mape", "mae", "mse", "msle", "mspe"]:
-            self.loss_function = globals()[loss_type.lower()]
-            if loss_gradient and not callable(loss_gradient):
-                self.loss_type = globals()["gradient_" + loss_type.lower()]
-            elif loss_gradient and callable(loss_gradient):
-                self.loss_type = loss_gradient
-            else:
-                self.loss_type = globals()[loss_type.lower()]
-        else:
-            raise NotImplementedError(f"{loss_type} loss function is not implemented.")
+        self.loss_function, self.loss_type = resolve_loss(loss_type, loss_gradient)
         self.model = model
         self.loss_gradient = loss_gradient
         self.gradient_to_call = getattr(self, "r_by_hand")
 
-        if not isinstance(experts, pd.DataFrame):
-            raise (TypeError("Experts must be a pandas dataframe"))
-
-        self.experts_names = experts.columns
+        if isinstance(experts, pd.DataFrame):
+            self.experts_names = experts.columns
+        elif isinstance(experts, np.ndarray) and experts.ndim == 3:
+            if experts_names is None or len(experts_names) != experts.shape[-1]:
+                raise ValueError(
+                    f"experts_names must give the names of the {experts.shape[-1]} experts"
+                )
+            self.experts_names = pd.Index(experts_names)
+        else:
+            raise (
+                TypeError(
+                    "Experts must be a pandas dataframe or an array of shape (T, d, K)"
+                )
+            )
 
-        batch_shape = experts.shape[:-1]
         self.K = experts.shape[-1]
-        weights_shape = [1] * (len(batch_shape) - 1) + [self.K]
+        # One weight vector per step, shared by the d targets of the step
+        weights_shape = [self.K]
         # Initialize variables
         if coefficients == "uniform":
             self.w = np.full(experts.shape[-1], 1 / experts.shape[-1])
@@ -638,12 +933,49 @@ class Mixture:
         self.cum_reg_regrets = np.zeros(weights_shape)
         self.learning_rates = np.ones(weights_shape) / np.power(2, 20)
         self.max_sq_regrets = np.zeros(weights_shape)
-        self.predictions = np.array([])
-        self.weights = np.empty((0, experts.shape[-1]))
-        self.awakes = np.empty((0, experts.shape[-1]))
-        self.experts = np.empty((0, experts.shape[-1]))
-        self.targets = np.array([])
+        self.history = []
+        self.history_cache = {}
+        self.cum_loss = 0.0
+        self.n_losses = 0
+        self.n_rows = 0
         self.N = experts.shape[-1]
+        self.active = np.arange(self.N)
+        self.parked = None
+        if pruning is not None:
+            if model.upper() == "FTRL":
+                raise ValueError("pruning is not available for the FTRL algorithm.")
+            pruning = {
+                "threshold": 1e-3,
+                "patience": 100,
+                "review_every": 100,
+                "review_samples": 10,
+                **pruning,
+            }
+            self.below = np.zeros(self.N, dtype=int)
+            self.review_window = []
+            self.review_step = 0
+            self.review_stride = 1
+            if pruning["review_samples"] is not None:
+                self.review_stride = max(
+                    pruning["review_every"] // pruning["review_samples"], 1
+                )
+        self.pruning = pruning
+        if forgetting is not None:
+            if model.upper() == "FTRL" or pruning is not None:
+                raise ValueError(
+                    "forgetting is not available for the FTRL algorithm nor with pruning."
+                )
+            if not 0 < forgetting <= 1:
+                raise ValueError(f"forgetting must be in (0, 1], got {forgetting}")
+        self.forgetting = forgetting
+        if checkpoint_every is not None and checkpoint_every < 1:
+            raise ValueError(f"checkpoint_every must be positive, got {checkpoint_every}")
+        self.checkpoint_every = checkpoint_every
+        self.checkpoints = []
+        self.awake_cache = AwakeCache()
+        self.snapshot = None
+        self.listeners = []
+        self.checks = []
         if model.upper() == "BOA":
             self.predict_at_t = getattr(self, "predict_at_t_BOA")
             self.update_coefficient = getattr(self, "update_coefficient_BOA")
@@ -675,7 +1007,7 @@ class Mixture:
             else:
                 self.tol = 1e-20
                 self.options = None
-            self.N = experts.shape[1]  # Number of experts
+            self.N = experts.shape[-1]  # Number of experts
             self.T = experts.shape[0]  # Number of instants
             self.w0 = np.full(self.N, 1 / self.N)
             if (
@@ -720,9 +1052,11 @@ class Mixture:
                 options=self.options,
                 jac=self.fun_reg_grad,
             )
-            self.weights = np.vstack((self.weights, result.x))
+            self.w = result.x
         else:
             raise NotImplementedError(f"Algorithm {model} is not implemented.")
+        if self.checkpoint_every is not None:
+            self.checkpoint(0, 0.0, 0)
         self.update(experts, y, awake=awake)
 
     def r_by_hand(self, x, y, awake=None):
@@ -730,13 +1064,7 @@ class Mixture:
         batch_shape = x.shape[:-1]
         batch_axes = list(range(len(batch_shape)))
         y_hat = np.sum(self.w * x, axis=-1, keepdims=True)
-        if not self.loss_gradient:
-            r = awake * (self.loss_type(y_hat, y) - self.loss_type(x, y))
-        else:
-            r = awake * (
-                self.loss_type(y_hat, y) * y_hat - self.loss_type(y_hat, y) * x
-            )
-
+        r = regrets(self.loss_type, self.loss_gradient, x, y_hat, y, awake)
         r = np.mean(r, axis=tuple(batch_axes))
         return y_hat, r
 
@@ -745,41 +1073,87 @@ class Mixture:
         Args:
             new_experts (numpy.array or pandas.Dataframe): an array of new experts.
             awake (numpy.array or pandas.Dataframe, optional): an array specifying the activation coefficients of the experts.
-                It must have the same dimension as experts. Defaults to None.
+                It must be of shape (T, K). Defaults to None.
         Returns:
             numpy.array: array of predictions based on the new experts and last coefficients
         """
-        new_experts = self.check_columns(new_experts)
-        awake = self.check_awake(awake=awake, x=new_experts)
-        x = new_experts.to_numpy()
-        coef = np.apply_along_axis(normalize, 1, (awake * self.w))
-        y_hat = np.sum(coef * x, axis=-1, keepdims=True)
-        return y_hat
-
-    def check_columns(self, experts):
-        if set(experts.columns) != set(self.experts_names):
+        # A single read of the published snapshot: the weights and the names used below
+        # always come from the same update, whatever the writer thread is doing.
+        snapshot = self.snapshot
+        names = list(snapshot.experts_names)
+        new_experts = self.check_columns(new_experts, experts_names=names)
+        awake = self.check_awake(awake=awake, x=new_experts, experts_names=names)
+        x = np.asarray(new_experts)
+        return snapshot.predict(x, awake)
+
+    def publish(self):
+        """Publishes an immutable snapshot of the current coefficients.
+
+        The snapshot is built completely before being bound to `self.snapshot`, so concurrent
+        readers either see the previous version or the new one, never a partially updated state.
+        Only one thread is expected to update the mixture.
+        """
+        weights = np.zeros(len(self.experts_names))
+        weights[self.active] = self.w
+        weights.setflags(write=False)
+        version = 1 if self.snapshot is None else self.snapshot.version + 1
+        self.snapshot = WeightsSnapshot(version, weights, tuple(self.experts_names))
+        for callback in self.listeners:
+            callback(self.snapshot)
+        return self.snapshot
+
+    def add_listener(self, callback):
+        """Registers a function called with each new WeightsSnapshot after an update."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def add_check(self, callback):
+        """Registers a function called with the new expert names before add_expert changes the mixture.
+
+        The callback raises an exception to reject the new expert, the mixture being left unchanged.
+        """
+        self.checks.append(callback)
+
+    def remove_check(self, callback):
+        self.checks.remove(callback)
+
+    def check_columns(self, experts, experts_names=None):
+        if experts_names is None:
+            experts_names = self.experts_names
+        if isinstance(experts, np.ndarray):
+            if experts.ndim != 3 or experts.shape[-1] != len(experts_names):
+                raise ValueError(
+                    f"Bad dimention for experts, expected (T, d, {len(experts_names)}) got {experts.shape}"
+                )
+            return experts
+        if set(experts.columns) != set(experts_names):
             raise (
                 ValueError(
-                    f"Bad experts columns, expected {list(self.experts_names)} found {list(experts.columns)}"
+                    f"Bad experts columns, expected {list(experts_names)} found {list(experts.columns)}"
                 )
             )
-        return experts[self.experts_names]
+        return experts[experts_names]
 
-    def check_awake(self, awake, x):
+    def check_awake(self, awake, x, experts_names=None):
+        if experts_names is None:
+            experts_names = self.experts_names
+        shape = (x.shape[0], x.shape[-1])
         if awake is None:
-            awake = np.ones(x.shape)
-        if awake.shape != x.shape:
+            awake = np.ones(shape)
+        if awake.shape != shape:
             raise ValueError(
-                f"Bad dimention for awake, expexted {x.shape} got {awake.shape}"
+                f"Bad dimention for awake, expexted {shape} got {awake.shape}"
             )
         if isinstance(awake, pd.DataFrame):
-            if set(awake.columns) != set(self.experts_names):
+            if set(awake.columns) != set(experts_names):
                 raise (
                     ValueError(
-                        f"Bad awake columns, expected {list(self.experts_names)} found {list(awake.columns)}"
+                        f"Bad awake columns, expected {list(experts_names)} found {list(awake.columns)}"
                     )
                 )
-            awake = awake[self.experts_names]
+            awake = awake[experts_names]
             awake = awake.to_numpy()
         return awake
 
@@ -787,10 +1161,11 @@ class Mixture:
         """updates the model sequentially with new experts and new targets
 
         Args:
-            new_experts (numpy.array or pandas.DataFrame): matrix of nex experts used to update the model
+            new_experts (numpy.array or pandas.DataFrame): matrix of nex experts used to update the model,
+                NaN being allowed for the experts which are asleep
             new_y (numpy.array or pandas.DataFrame): array of new targets used to update the model
             awake (numpy.array or pandas.Dataframe, optional): an array specifying the activation coefficients
-                of the experts. It must have the same dimension as experts. Defaults to None.
+                of the experts. It must be of shape (T, K). Defaults to None.
         """
         new_experts = self.check_columns(new_experts)
         awake = self.check_awake(awake, new_experts)
@@ -806,49 +1181,666 @@ class Mixture:
             awake = awake.to_numpy()
         if x.shape[:-1] != y.shape:
             raise ValueError("Bad dimensions: x and y should have the same shape")
+        # An asleep expert may have no forecast: it is recorded as NaN and counts as 0
+        x_steps = fill_asleep(x)
+        if x_steps is not x:
+            awake_rows = np.reshape(awake, awake.shape[:1] + (1,) * (x.ndim - 2) + awake.shape[1:])
+            if np.any(np.isnan(x) & (awake_rows > 0)):
+                raise ValueError("The awake experts must have forecasts, found NaN")
+        predictions = np.empty(y.shape)
+        weights = []
+        start = 0
+        offset = self.n_rows
+        cum_loss, counted = self.cum_loss, 0
+        # Steps sharing an awake mask share its index arrays
+        plans = self.awake_cache.plans(awake)
         for index, value in enumerate(y):
-            xt = x[index]
+            xt = x_steps[index]
             yt = np.expand_dims(value, -1)
-            y_hat, updates = self.predict_at_t(xt, yt, awake=awake[index, :])
-            self.predictions = np.append(self.predictions, y_hat)
-            self.weights = np.vstack((self.weights, updates.get("weights")))
-            self.experts = np.vstack((self.experts, xt))
-            self.targets = np.append(self.targets, value)
-        self.awakes = np.vstack((self.awakes, awake))
-
-        self.loss = np.mean(self.loss_function(self.predictions, self.targets))
+            if self.N == len(self.experts_names):
+                plan = None if plans is None else plans[index]
+                y_hat, updates = self.predict_at_t(xt, yt, awake=awake[index, :], plan=plan)
+            else:
+                awake_t = awake[index, self.active]
+                if not np.any(awake_t > 0):
+                    # Every awake expert is frozen: they are re-admitted to predict this step
+                    self.record(x, y, awake, predictions, weights, start, index)
+                    start, weights = index, []
+                    self.readmit(np.intersect1d(self.frozen, np.flatnonzero(awake[index] > 0)))
+                    awake_t = awake[index, self.active]
+                y_hat, updates = self.predict_at_t(
+                    xt[..., self.active], yt, awake=awake_t
+                )
+            if self.forgetting is not None:
+                self.forget()
+            predictions[index] = np.reshape(y_hat, np.shape(value))
+            weights.append(updates.get("weights"))
+            if self.pruning is not None and self.prune(xt, value, y_hat, awake[index]):
+                self.record(x, y, awake, predictions, weights, start, index + 1)
+                start, weights = index + 1, []
+                self.review()
+            if self.checkpoint_every is not None and (offset + index + 1) % self.checkpoint_every == 0:
+                cum_loss += np.sum(
+                    self.loss_function(predictions[counted : index + 1], y[counted : index + 1])
+                )
+                counted = index + 1
+                self.checkpoint(offset + index + 1, cum_loss, self.n_losses + np.size(y[:counted]))
+        self.record(x, y, awake, predictions, weights, start, len(y))
+
+        self.cum_loss += np.sum(self.loss_function(predictions, y))
+        self.n_losses += np.size(y)
+        self.loss = self.cum_loss / self.n_losses
+        self.update_coefficient()
+        self.publish()
+
+    def add_expert(self, name, init_weight=None):
+        """Adds an expert to the mixture, close to an expert asleep since the first update.
+
+        The history is not replayed: the slot variables of the new expert are the ones of an expert
+        which was never awake, and its column in the history arrays is the one of an asleep expert.
+        The next updates must provide the predictions of the new expert.
+
+        For MLpol, the next predictions are the ones of a mixture which had the expert asleep from the
+        start. The learning rates of BOA and MLprod depend on the number of experts, and the ones of
+        the current experts were computed with one expert less, so their next weights only approach
+        the ones of such a mixture.
+
+        Args:
+            name (str): name of the new expert.
+            init_weight (float, optional): weight of the new expert among the current experts, its regret
+                being set accordingly. Defaults to None, the weight given by the aggregation rule to an
+                expert without regret.
+        """
+        if self.model.upper() == "FTRL":
+            raise NotImplementedError("The experts of the FTRL algorithm are fixed.")
+        if name in self.experts_names:
+            raise ValueError(f"Expert {name} is already in the mixture")
+        if init_weight is not None and not 0 < init_weight < 1:
+            raise ValueError(f"init_weight must be in (0, 1), got {init_weight}")
+        for callback in self.checks:
+            callback(tuple(self.experts_names) + (name,))
+        shape = np.shape(self.learning_rates)[:-1] + (1,)
+        state = {
+            "w": np.zeros(shape),
+            "cum_vars": np.ones(shape) / np.power(2, 20),
+            "max_losses": np.ones(shape) / np.power(2, 20),
+            "cum_regrets": np.zeros(shape),
+            "cum_reg_regrets": np.zeros(shape),
+            "learning_rates": np.ones(shape) / np.power(2, 20),
+            "max_sq_regrets": np.zeros(shape),
+        }
+        self.K += 1
+        if self.n_rows > 0:
+            # One asleep step gives the new expert the learning rates of an expert never awake
+            block = self.history[-1]
+            y_hat = block["predictions"][-1:]
+            state = self.advance_frozen(
+                state,
+                np.expand_dims(y_hat, -1),
+                block["targets"][-1:],
+                y_hat,
+                np.zeros((1, 1)),
+                stride=1,
+                max_sq_regret=np.max(self.max_sq_regrets),
+            )
+        if init_weight is not None:
+            current = np.logaddexp.reduce(
+                self.log_weights({key: getattr(self, key) for key in self.SLOT_VARIABLES})
+            )
+            target = np.log(init_weight / (1 - init_weight)) + current
+            learning_rates = state["learning_rates"]
+            if self.model.upper() == "BOA":
+                state["cum_reg_regrets"] = (
+                    target - np.log(learning_rates) - np.log(1 / self.K)
+                ) / learning_rates
+            elif self.model.upper() == "MLPOL":
+                state["cum_regrets"] = np.exp(target) / learning_rates
+            else:
+                state["cum_regrets"] = target - np.log(learning_rates)
+        for key in self.SLOT_VARIABLES:
+            state[key] = np.reshape(state[key], np.shape(getattr(self, key))[:-1] + (1,))
+            setattr(self, key, np.concatenate([getattr(self, key), state[key]], axis=-1))
+        if self.parked is not None:
+            for key in self.SLOT_VARIABLES:
+                self.parked[key] = np.concatenate([self.parked[key], state[key]], axis=-1)
+                self.estimates[key] = np.concatenate([self.estimates[key], state[key]], axis=-1)
+            self.frozen_at = np.append(self.frozen_at, self.n_rows)
+        if self.pruning is not None:
+            self.below = np.append(self.below, 0)
+        self.active = np.append(self.active, len(self.experts_names))
+        self.N = len(self.active)
+        self.experts_names = self.experts_names.append(pd.Index([name]))
+        self.history_cache = {}
+        self.update_coefficient()
+        if self.checkpoint_every is not None:
+            self.checkpoint(self.n_rows, self.cum_loss, self.n_losses)
+        self.publish()
+
+    def remove_expert(self, name):
+        """Removes an expert from the mixture.
+
+        The slot variables of the other experts are kept, and the weights of the remaining experts
+        are renormalized. The expert is dropped from the history arrays.
+
+        Args:
+            name (str): name of the expert to remove.
+        """
+        if self.model.upper() == "FTRL":
+            raise NotImplementedError("The experts of the FTRL algorithm are fixed.")
+        if name not in self.experts_names:
+            raise ValueError(f"Expert {name} is not in the mixture")
+        if len(self.experts_names) == 1:
+            raise ValueError("The last expert of the mixture cannot be removed")
+        k = self.experts_names.get_loc(name)
+        kept = self.active != k
+        for key in self.SLOT_VARIABLES:
+            setattr(self, key, getattr(self, key)[..., kept])
+        if self.parked is not None:
+            for key in self.SLOT_VARIABLES:
+                self.parked[key] = np.delete(self.parked[key], k, axis=-1)
+                self.estimates[key] = np.delete(self.estimates[key], k, axis=-1)
+            self.frozen_at = np.delete(self.frozen_at, k)
+        if self.pruning is not None:
+            self.below = self.below[kept]
+        active = self.active[kept]
+        self.active = active - (active > k)
+        self.N = len(self.active)
+        self.K -= 1
+        self.experts_names = self.experts_names.delete(k)
+        self.history_cache = {}
+        if self.N == 0:
+            self.readmit(self.frozen)
         self.update_coefficient()
+        if self.checkpoint_every is not None:
+            self.checkpoint(self.n_rows, self.cum_loss, self.n_losses)
+        self.publish()
+
+    CHECKPOINT_ATTRIBUTES = [
+        "active",
+        "N",
+        "K",
+        "experts_names",
+        "parked",
+        "estimates",
+        "frozen_at",
+        "below",
+        "review_window",
+        "review_step",
+        "G",
+        "eta",
+    ]
+
+    def checkpoint(self, row, cum_loss, n_losses):
+        """Records a copy of the state of the mixture after row steps."""
+        state = {
+            name: copy.deepcopy(getattr(self, name))
+            for name in self.SLOT_VARIABLES + self.CHECKPOINT_ATTRIBUTES
+            if hasattr(self, name)
+        }
+        self.checkpoints.append(
+            {"row": row, "cum_loss": cum_loss, "n_losses": n_losses, "state": state}
+        )
+
+    def history_rows(self, start, stop=None):
+        """Experts, targets and awakes of the history rows start:stop, in the columns of the current experts."""
+        stop = self.n_rows if stop is None else stop
+        parts = {"experts": [], "targets": [], "awakes": []}
+        begin = 0
+        for block in self.history:
+            end = begin + len(block["targets"])
+            if end > start and begin < stop:
+                rows = slice(max(start - begin, 0), min(stop, end) - begin)
+                parts["experts"].append(self.block_array(block, "experts", rows=rows))
+                parts["awakes"].append(self.block_array(block, "awakes", rows=rows))
+                parts["targets"].append(block["targets"][rows])
+            begin = end
+        return {
+            name: np.concatenate(value) if value else self.empty_history(name)
+            for name, value in parts.items()
+        }
+
+    def replay_from(self, t, experts=None, awake=None):
+        """Replays the mixture from step t with other experts or awake coefficients.
+
+        The state is restored from the last checkpoint before t, the steps between the checkpoint and t
+        are replayed as they were, and the steps from t onwards are replayed with the given changes. The
+        mixture itself is left unchanged.
+
+        Args:
+            t (int): first step of the changes.
+            experts (list or pandas.DataFrame, optional): either the names of the experts kept from t
+                onwards, the others being asleep, or the forecasts of the experts for the steps from t
+                onwards. Defaults to None, the recorded forecasts.
+            awake (numpy.array or pandas.DataFrame, optional): activation coefficients of the experts for
+                the steps from t onwards. Defaults to None, the recorded ones.
+        Returns:
+            Mixture: a new mixture with the replayed history and coefficients.
+
+        Example:
+            mod = Mixture(y=targets, experts=experts, checkpoint_every=168)
+            # weights if expert "gbm" had been removed from step 5000 onwards
+            what_if = mod.replay_from(5000, experts=[name for name in mod.experts_names if name != "gbm"])
+            what_if.weights[5000:]
+        """
+        if self.checkpoint_every is None:
+            raise ValueError("replay_from requires checkpoints, see checkpoint_every")
+        if not 0 <= t <= self.n_rows:
+            raise ValueError(f"t must be between 0 and {self.n_rows}, got {t}")
+        checkpoint = [c for c in self.checkpoints if c["row"] <= t][-1]
+        if not checkpoint["state"]["experts_names"].equals(self.experts_names):
+            raise NotImplementedError(
+                "Replays across a change of the experts are not implemented, replay from after the change."
+            )
+        row = checkpoint["row"]
+        tail = self.history_rows(row)
+        x, y, tail_awake = tail["experts"], tail["targets"], tail["awakes"]
+        if isinstance(experts, pd.DataFrame):
+            x = x.copy()
+            x[t - row :] = np.asarray(self.check_columns(experts))
+        elif experts is not None:
+            kept = self.experts_names.isin(list(experts))
+            tail_awake = tail_awake.copy()
+            tail_awake[t - row :, ~kept] = 0
+        if awake is not None:
+            tail_awake = tail_awake.copy()
+            tail_awake[t - row :] = self.check_awake(awake, x[t - row :])
+        replay = copy.copy(self)
+        for name in ["predict_at_t", "update_coefficient", "gradient_to_call"]:
+            setattr(replay, name, getattr(replay, getattr(self, name).__name__))
+        for name, value in checkpoint["state"].items():
+            setattr(replay, name, copy.deepcopy(value))
+        replay.history = self.truncated_history(row)
+        replay.history_cache = {}
+        replay.n_rows = row
+        replay.checkpoints = [c for c in self.checkpoints if c["row"] <= row]
+        replay.cum_loss = checkpoint["cum_loss"]
+        replay.n_losses = checkpoint["n_losses"]
+        replay.loss = replay.cum_loss / replay.n_losses if replay.n_losses else np.nan
+        replay.listeners = []
+        replay.checks = []
+        replay.snapshot = None
+        if len(y) > 0:
+            if x.ndim == 2:
+                x = pd.DataFrame(x, columns=self.experts_names)
+            replay.update(x, y, awake=tail_awake)
+        else:
+            # The checkpoint was taken during a step, before the coefficients of the next one
+            replay.update_coefficient()
+            replay.publish()
+        return replay
+
+    def truncated_history(self, row):
+        """The history blocks of the first row steps."""
+        blocks = []
+        begin = 0
+        for block in self.history:
+            end = begin + len(block["targets"])
+            if end <= row:
+                blocks.append(block)
+            elif begin < row:
+                part = dict(block)
+                for name in ["predictions", "targets", "weights", "experts", "awakes"]:
+                    part[name] = block[name][: row - begin]
+                blocks.append(part)
+            begin = end
+        return blocks
+
+    def forget(self):
+        """Discounts the accumulators of the aggregation rule by the forgetting factor, see discount."""
+        discount(self, self.forgetting, self.model)
+
+    def record(self, x, y, awake, predictions, weights, start, stop):
+        """Appends the rows start:stop of an update to the history.
+
+        The weights are stored for the experts not frozen by the pruning only.
+        """
+        if stop <= start:
+            return
+        self.history.append(
+            {
+                "names": self.experts_names,
+                "active": self.active,
+                "predictions": predictions[start:stop],
+                "targets": y[start:stop],
+                "weights": np.array(weights).reshape(stop - start, self.N),
+                "experts": x[start:stop],
+                "awakes": awake[start:stop],
+            }
+        )
+        self.n_rows += stop - start
+
+    def history_array(self, name):
+        """Concatenates a variable of the history blocks, the result being cached."""
+        n_blocks, cached = self.history_cache.get(name, (0, None))
+        if n_blocks == len(self.history) and cached is not None:
+            return cached
+        blocks = self.history[n_blocks:]
+        if name in ["weights", "experts", "awakes"]:
+            parts = [self.block_array(block, name) for block in blocks]
+        elif name == "effective_K":
+            parts = [np.full(len(block["targets"]), len(block["active"])) for block in blocks]
+        else:
+            parts = [block[name] for block in blocks]
+        if cached is not None:
+            parts = [cached] + parts
+        cached = np.concatenate(parts) if parts else self.empty_history(name)
+        self.history_cache[name] = (len(self.history), cached)
+        return cached
+
+    def block_array(self, block, name, columns=None, rows=slice(None)):
+        """The weights, experts or awakes of a history block in the columns of the current experts.
+
+        An expert added after the block was recorded was asleep during the block: its weight and
+        awake coefficient are 0 and its prediction is the one of the mixture.
+
+        Args:
+            block (dict): block of the history.
+            name (str): "weights", "experts" or "awakes".
+            columns (numpy.array, optional): indices of the current experts to keep. Defaults to None, all of them.
+            rows (slice, optional): rows of the block to keep. Defaults to all of them.
+        """
+        if name == "weights":
+            values = np.zeros((len(block["targets"][rows]), len(block["names"])))
+            values[:, block["active"]] = block["weights"][rows]
+        else:
+            values = block[name][rows]
+        if block["names"] is self.experts_names:
+            return values if columns is None else values[..., columns]
+        names = self.experts_names if columns is None else self.experts_names[columns]
+        positions = block["names"].get_indexer(names)
+        result = values[..., np.maximum(positions, 0)]
+        if name == "experts":
+            fill = np.expand_dims(block["predictions"][rows], -1)
+        else:
+            fill = 0.0
+        return np.where(positions >= 0, result, fill)
+
+    def empty_history(self, name):
+        if name in ["predictions", "targets", "effective_K"]:
+            return np.array([])
+        return np.empty((0, len(self.experts_names)))
+
+    @property
+    def predictions(self):
+        return self.history_array("predictions")
+
+    @property
+    def targets(self):
+        return self.history_array("targets")
+
+    @property
+    def weights(self):
+        return self.history_array("weights")
+
+    @property
+    def experts(self):
+        return self.history_array("experts")
+
+    @property
+    def awakes(self):
+        return self.history_array("awakes")
+
+    @property
+    def effective_K(self):
+        return self.history_array("effective_K")
+
+    SLOT_VARIABLES = [
+        "w",
+        "cum_vars",
+        "max_losses",
+        "cum_regrets",
+        "cum_reg_regrets",
+        "learning_rates",
+        "max_sq_regrets",
+    ]
+
+    @property
+    def frozen(self):
+        return np.setdiff1d(np.arange(len(self.experts_names)), self.active)
+
+    def set_active(self, active):
+        """Changes the set of experts used in the computations.
+
+        The slot variables of all the experts are parked in full width arrays, from which the
+        variables of the new set are gathered, so every slot variable stays aligned with self.active.
+        """
+        active = np.asarray(active, dtype=int)
+        K = len(self.experts_names)
+        if self.parked is None:
+            self.parked = {
+                name: np.zeros(np.shape(getattr(self, name))[:-1] + (K,))
+                for name in self.SLOT_VARIABLES
+            }
+            self.estimates = {name: value.copy() for name, value in self.parked.items()}
+            self.frozen_at = np.zeros(K, dtype=int)
+        for name in self.SLOT_VARIABLES:
+            self.parked[name][..., self.active] = getattr(self, name)
+            setattr(self, name, self.parked[name][..., active].copy())
+        leaving = np.setdiff1d(self.active, active)
+        for name, value in self.estimates.items():
+            value[..., leaving] = self.parked[name][..., leaving]
+        self.frozen_at[leaving] = self.n_rows
+        if self.pruning is not None:
+            below = np.zeros(K, dtype=int)
+            below[self.active] = self.below
+            below[np.setdiff1d(active, self.active)] = 0
+            self.below = below[active]
+        self.active = active
+        self.N = len(active)
+
+    def prune(self, x, y, y_hat, awake):
+        """Counts the steps with negligible weights and keeps the samples used by the reviews.
+
+        Returns:
+            bool: whether a review is due
+        """
+        active_awake = awake[self.active] > 0
+        # An expert with at least the uniform weight is never negligible
+        threshold = min(self.pruning["threshold"], 1 / max(np.sum(active_awake), 1))
+        self.below = np.where(
+            active_awake, np.where(self.w < threshold, self.below + 1, 0), self.below
+        )
+        self.review_step += 1
+        if self.review_step % self.review_stride == 0:
+            self.review_window.append((x, y, y_hat, awake))
+        return self.review_step >= self.pruning["review_every"]
+
+    def review(self):
+        """Freezes the experts with negligible weights and re-admits the frozen experts which
+        would now get a weight above the threshold.
+
+        The estimated slot variables of the frozen experts are advanced on the samples of the
+        period. Those whose estimated weight is above the threshold are brought exactly up to date
+        from the history, and re-admitted if their exact weight is still above the threshold.
+        """
+        window = self.review_window
+        self.review_window = []
+        self.review_step = 0
+        max_sq_regret = np.max(self.max_sq_regrets)
+        frozen = self.frozen
+        readmitted = np.array([], dtype=int)
+        if frozen.shape[0] > 0 and len(window) > 0:
+            x = np.array([row[0] for row in window])[..., frozen]
+            y = np.array([row[1] for row in window])
+            y_hat = np.array([row[2] for row in window]).reshape(y.shape)
+            awake = np.array([row[3] for row in window])[..., frozen]
+            estimates = self.advance_frozen(
+                {name: value[..., frozen] for name, value in self.estimates.items()},
+                x,
+                y,
+                y_hat,
+                awake,
+                stride=self.review_stride,
+                max_sq_regret=max_sq_regret,
+            )
+            for name, value in estimates.items():
+                self.estimates[name][..., frozen] = value
+            significant = np.flatnonzero(self.is_significant(estimates))
+            # At most as many candidates as active experts, the largest estimated weights first
+            significant = significant[
+                np.argsort(-self.log_weights(estimates)[significant])[: self.N]
+            ]
+            candidates = np.sort(frozen[significant])
+            if candidates.shape[0] > 0:
+                exact = self.catch_up(candidates)
+                readmitted = candidates[self.is_significant(exact)]
+        to_freeze = self.below >= self.pruning["patience"]
+        if np.all(to_freeze):
+            to_freeze[np.argmax(self.w)] = False
+        if np.any(to_freeze) or readmitted.shape[0] > 0:
+            self.set_active(np.union1d(self.active[~to_freeze], readmitted))
+
+    def readmit(self, experts):
+        """Brings frozen experts up to date and adds them to the active experts."""
+        self.catch_up(experts)
+        self.set_active(np.union1d(self.active, experts))
+
+    def catch_up(self, experts):
+        """Advances exactly the parked slot variables of frozen experts over the history since
+        they were frozen.
+
+        Returns:
+            dict: the updated slot variables of the experts
+        """
+        x, y, y_hat, awake = [], [], [], []
+        first = np.min(self.frozen_at[experts])
+        stop = self.n_rows
+        for block in reversed(self.history):
+            begin = stop - len(block["targets"])
+            if stop <= first:
+                break
+            rows = slice(max(first - begin, 0), None)
+            x.append(self.block_array(block, "experts", experts, rows))
+            y.append(block["targets"][rows])
+            y_hat.append(block["predictions"][rows])
+            block_awake = self.block_array(block, "awakes", experts, rows)
+            # The steps before the freeze of an expert leave its slot variables unchanged
+            block_awake = block_awake * (
+                np.arange(max(first, begin), stop)[:, None] >= self.frozen_at[experts]
+            )
+            awake.append(block_awake)
+            stop = begin
+        state = {name: value[..., experts] for name, value in self.parked.items()}
+        if len(x) > 0:
+            state = self.advance_frozen(
+                state,
+                fill_asleep(np.concatenate(x[::-1])),
+                np.concatenate(y[::-1]),
+                np.concatenate(y_hat[::-1]),
+                np.concatenate(awake[::-1]),
+                stride=1,
+                max_sq_regret=np.max(self.max_sq_regrets),
+            )
+        for name, value in state.items():
+            self.parked[name][..., experts] = value
+            self.estimates[name][..., experts] = value
+        self.frozen_at[experts] = self.n_rows
+        return state
+
+    def advance_frozen(self, state, x, y, y_hat, awake, stride, max_sq_regret):
+        """Slot variables of frozen experts after the steps x, y in a single vectorised pass.
+
+        The predictions y_hat of the mixture do not depend on frozen experts, so the recursions
+        of the aggregation rules reduce to cumulative sums and maxima. With a stride, each step
+        stands for stride steps.
+        """
+        y = np.expand_dims(y, -1)
+        y_hat = np.expand_dims(y_hat, -1)
+        awake = awake.reshape(awake.shape[:1] + (1,) * (x.ndim - 2) + awake.shape[1:])
+        r = regrets(self.loss_type, self.loss_gradient, x, y_hat, y, awake)
+        r = np.mean(r, axis=tuple(range(1, r.ndim - 1)))
+        r_square = np.square(r)
+        state = dict(state)
+        max_losses = np.maximum(
+            state["max_losses"], np.maximum.accumulate(np.abs(r), axis=0)
+        )
+        cum_vars = state["cum_vars"] + stride * np.cumsum(r_square, axis=0)
+        if self.model.upper() == "BOA":
+            B2 = np.power(2, np.ceil(np.log2(max_losses)))
+            learning_rates = np.minimum(1 / B2, np.sqrt(np.log(self.K) / cum_vars))
+            state["cum_reg_regrets"] = state["cum_reg_regrets"] + stride * np.sum(
+                1
+                / 2
+                * (r - learning_rates * r_square + B2 * (learning_rates * r > 1 / 2)),
+                axis=0,
+            )
+            state["cum_regrets"] = state["cum_regrets"] + stride * np.sum(r, axis=0)
+            state["learning_rates"] = learning_rates[-1]
+        elif self.model.upper() == "MLPOL":
+            state["cum_regrets"] = state["cum_regrets"] + stride * np.sum(r, axis=0)
+            # The increments of the largest squared regret are those seen by the active experts
+            state["learning_rates"] = 1 / (
+                1 / state["learning_rates"]
+                + stride * np.sum(r_square, axis=0)
+                + np.maximum(max_sq_regret - state["max_sq_regrets"], 0)
+            )
+            state["max_sq_regrets"] = np.maximum(state["max_sq_regrets"], max_sq_regret)
+        else:
+            epsilon = 1e-30
+            learning_rates = np.minimum(
+                np.minimum(0.5 / max_losses, np.sqrt(np.log(self.K) / cum_vars)),
+                1 / epsilon,
+            )
+            # cum_regrets / learning_rates only grows by log(1 + lr * r) / lr at each step
+            state["cum_regrets"] = learning_rates[-1] * (
+                state["cum_regrets"] / state["learning_rates"]
+                + stride
+                * np.sum(np.log(1 + learning_rates * r) / learning_rates, axis=0)
+            )
+            state["learning_rates"] = learning_rates[-1]
+        state["max_losses"] = max_losses[-1]
+        state["cum_vars"] = cum_vars[-1]
+        return {
+            name: np.broadcast_to(value, np.shape(state["w"])[:-1] + r.shape[-1:]).copy()
+            for name, value in state.items()
+        }
+
+    def is_significant(self, state):
+        """Whether each expert of a set of slot variables would get a weight above the threshold
+        if it were added alone to the active experts."""
+        candidate = self.log_weights(state)
+        current = np.logaddexp.reduce(
+            self.log_weights({name: getattr(self, name) for name in self.SLOT_VARIABLES})
+        )
+        return candidate - np.logaddexp(current, candidate) >= np.log(
+            self.pruning["threshold"]
+        )
+
+    def log_weights(self, state):
+        """Logarithm of the unnormalised weights given by the aggregation rule to a set of slot variables."""
+        if self.model.upper() == "BOA":
+            log_w = (
+                np.log(state["learning_rates"])
+                + np.log(1 / self.K)
+                + state["learning_rates"] * state["cum_reg_regrets"]
+            )
+        elif self.model.upper() == "MLPOL":
+            with np.errstate(divide="ignore"):
+                log_w = np.log(state["learning_rates"] * np.maximum(state["cum_regrets"], 0))
+        else:
+            log_w = np.log(state["learning_rates"]) + state["cum_regrets"]
+        return np.reshape(log_w, -1)
+
+    def predict_at_t_BOA(self, x, y, awake=None, plan=None):
+        """predicts at time t using BOA.
 
-    def predict_at_t_BOA(self, x, y, awake=None):
-        """predicts at time t using BOA."""
-        idx = awake > 0
+        The plan of a binary awake mask, see AwakeCache, gives the positions of the awake experts.
+        """
         Raux = (
             np.log(self.learning_rates)
             + np.log(1 / self.K)
             + self.learning_rates * self.cum_reg_regrets
         )
-        Rmax = np.max(Raux[idx])
-        self.w = np.zeros(self.N)
-        self.w[idx] = np.exp(Raux[idx] - Rmax)
+        if plan is not None and plan.all_awake:
+            self.w = np.exp(Raux - np.max(Raux))
+        else:
+            idx = awake > 0 if plan is None else plan.index
+            Rmax = np.max(Raux[idx])
+            self.w = np.zeros(self.N)
+            self.w[idx] = np.exp(Raux[idx] - Rmax)
         self.w = normalize(self.w)
         y_hat, r = self.gradient_to_call(x, y, awake=awake)
-        r_square = np.square(r)
-        self.max_losses = np.maximum(self.max_losses, np.abs(r))  # 64
-        B2 = np.power(2, np.ceil(np.log2(self.max_losses)))
-        self.cum_vars += r_square
-        self.learning_rates = np.minimum(
-            1 / B2, np.sqrt(np.log(self.K) / self.cum_vars)
-        )
-        self.cum_reg_regrets += (
-            1
-            / 2
-            * (
-                r
-                - self.learning_rates * r_square
-                + B2 * (self.learning_rates * r > 1 / 2)
-            )
-        )
-        self.cum_regrets += r
+        step_BOA(self, r, self.K)
 
         slot_variables_updates = {
             "cum_vars": self.cum_vars,
@@ -871,7 +1863,7 @@ class Mixture:
         self.w = np.exp(Raux - Rmax)
         self.w = normalize(self.w)
 
-    def predict_at_t_MLPol(self, x, y, awake=None):
+    def predict_at_t_MLPol(self, x, y, awake=None, plan=None):
         """predicts at time t using MLpol."""
         np_relu = np.maximum(self.cum_regrets, 0)
         self.w = np.multiply(self.learning_rates, np_relu)
@@ -885,21 +1877,10 @@ class Mixture:
         else :
             self.w = np.ones(self.w.shape) / self.K
 
-        self.w = normalize(awake * self.w)
+        self.w = normalize(self.w if plan is not None and plan.all_awake else awake * self.w)
 
         y_hat, r = self.gradient_to_call(x, y, awake=awake)
-
-        r_square = np.square(r)
-        self.cum_regrets += r
-
-        max_squared_regret_diff = np.maximum(
-            np.max(r_square, axis=-1, keepdims=True) - self.max_sq_regrets, 0
-        )
-
-        self.learning_rates = 1 / (
-            1 / self.learning_rates + r_square + max_squared_regret_diff
-        )
-        self.max_sq_regrets += max_squared_regret_diff
+        step_MLpol(self, r, np.max(np.square(r), axis=-1, keepdims=True))
         slot_variables_updates = {
             "max_squared_regret": self.max_sq_regrets,
             "learning_rates": self.learning_rates,
@@ -923,26 +1904,14 @@ class Mixture:
             self.w = np.ones(self.w.shape) / self.K
         self.w = normalize(self.w)
 
-    def predict_at_t_MLProd(self, x, y, awake=None):
+    def predict_at_t_MLProd(self, x, y, awake=None, plan=None):
         """predicts at time t using MLprod."""
         self.w = np.multiply(self.learning_rates, np.exp(self.cum_regrets))
         self.w = np.divide(self.w, np.sum(self.w, axis=-1, keepdims=True))
-        self.w = normalize(awake * self.w)
+        self.w = normalize(self.w if plan is not None and plan.all_awake else awake * self.w)
 
         y_hat, r = self.gradient_to_call(x, y, awake=awake)
-        r_square = np.square(r)
-        self.cum_vars += r_square
-        self.max_losses = np.maximum(self.max_losses, np.abs(r))
-        epsilon = 1e-30
-        new_learning_rates = np.minimum(
-            np.minimum(0.5 / self.max_losses, np.sqrt(np.log(self.K) / self.cum_vars)),
-            np.ones(self.learning_rates.shape) / epsilon,
-        )
-        self.cum_regrets = (
-            new_learning_rates / self.learning_rates * self.cum_regrets
-            + np.log(1 + new_learning_rates * r)
-        )
-        self.learning_rates = new_learning_rates
+        step_MLprod(self, r, self.K)
 
         slot_variables_updates = {
             "cum_vars": self.cum_vars,
@@ -959,9 +1928,10 @@ class Mixture:
         self.w = np.divide(self.w, np.sum(self.w, axis=-1, keepdims=True))
         self.w = normalize(self.w)
 
-    def predict_at_t_FTRL(self, x, y, awake=None):
-        y_hat = np.sum(self.weights[-1] * x)
-        G_t = self.loss_type(y_hat, y) * x
+    def predict_at_t_FTRL(self, x, y, awake=None, plan=None):
+        w = self.w
+        y_hat = np.sum(w * x, axis=-1, keepdims=True)
+        G_t = np.mean(np.reshape(self.loss_type(y_hat, y) * x, (-1, self.N)), axis=0)
         self.G = self.G + G_t
         if self.default_eta:
             self.eta = 1 / np.sqrt(1 / np.square(self.eta) + np.sum(np.square(G_t)))
@@ -984,13 +1954,14 @@ class Mixture:
         )
         self.w = result.x
         slot_variables_updates = {
-            "weights": self.w,
+            "weights": w,
         }
 
         return y_hat, slot_variables_updates
 
     def update_coefficient_FTRL(self):
-        self.weights = np.delete(self.weights, -1, axis=0)
+        # The coefficients of the next step are computed at the end of predict_at_t_FTRL
+        pass
 
     def plot_mixture(
         self,
@@ -1001,6 +1972,7 @@ class Mixture:
         ylabel=None,
         index_start=None,
         index_stop=None,
+        max_points=MAX_POINTS,
     ):
         """provides different diagnostic plots for an aggregation procedure.
 
@@ -1013,13 +1985,16 @@ class Mixture:
                 - avg_loss: average loss suffered by the experts
                 - contrib: contibution of each expert to the prediction
                 - all display all the above graphs
-                Defaults to "all".
+                Defaults to "all". Only plot_weight and boxplot_weight are available for vector targets.
             colors (numpy.array, optional): array of colors to be used for the plots. Defaults to None.
             max_experts (int): max number of expert to be displayed
             title (str, optional) : title. Only available plotting one graphic (not using plot_type = "all")
             ylabel (str, optional) : ylabel. Only available plotting one graphic (not using plot_type = "all")
             index_start (int) : the index where the plots starts (may be positive or negative)
             index_stop (int) : the index where the plots stops (may be positive or negative)
+            max_points (int) : max number of points drawn per series, the weights and contributions being
+                averaged over buckets of steps and the lines keeping the min and max of each bucket.
+                None to draw every step. Defaults to MAX_POINTS.
 
         Examples :
 
@@ -1052,10 +2027,12 @@ class Mixture:
 
         """
         figsize = (10, 8)
-        K = self.experts.shape[1]
+        K = len(self.experts_names)
+        if plot_type not in ["plot_weight", "boxplot_weight"]:
+            check_scalar_targets(self, plot_type)
 
         if colors is None:
-            colors = sns.color_palette(None, K + 2)
+            colors = palette(K + 2)
         colors = np.array(colors)
         if not max_experts or max_experts > K:
             max_experts = K
@@ -1070,6 +2047,7 @@ class Mixture:
                 max_experts,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
             # Boxplot of weights associated to each expert
             boxplot_weight(
@@ -1088,6 +2066,7 @@ class Mixture:
                 max_experts,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
             # Cumulative residuals
             cumul_res(
@@ -1097,6 +2076,7 @@ class Mixture:
                 max_experts,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
 
             # Average loss
@@ -1117,12 +2097,10 @@ class Mixture:
                 max_experts,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
 
-            handles, labels = ax[1, 1].get_legend_handles_labels()
-            fig.legend(handles, labels, loc="upper center", ncol=10, bbox_to_anchor=(0.5, 1), frameon=False)
-            fig.suptitle(" ", fontsize=24)
-            fig.tight_layout()
+            layout_panels(fig, ax)
         elif plot_type == "boxplot_weight":
             fig, ax = plt.subplots(dpi=100)
             # Boxplot of weights associated to each expert
@@ -1150,6 +2128,7 @@ class Mixture:
                 ylabel,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
             fig.legend(loc="upper center", ncol=K + 2, borderaxespad=1.0, bbox_to_anchor=(0.5, 1), frameon=False)
             fig.suptitle(" ", fontsize=16)
@@ -1166,6 +2145,7 @@ class Mixture:
                 ylabel,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
             fig.legend(loc="upper center", ncol=K + 2, bbox_to_anchor=(0.5, 1), frameon=False)
             fig.suptitle(" ", fontsize=16)
@@ -1182,6 +2162,7 @@ class Mixture:
                 ylabel,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
             fig.legend(loc="upper center", ncol=K + 2, bbox_to_anchor=(0.5, 1), frameon=False)
             fig.suptitle(" ", fontsize=16)
@@ -1198,6 +2179,7 @@ class Mixture:
                 ylabel,
                 index_start=index_start,
                 index_stop=index_stop,
+                max_points=max_points,
             )
             fig.legend(loc="upper center", ncol=K + 2, bbox_to_anchor=(0.5, 1), frameon=False)
             fig.suptitle(" ", fontsize=16)
@@ -0,0 +1,229 @@
+"""
+Batch replay of experts and targets files through a Mixture, run with
+
+    python replay.py --experts experts.csv --target prices.csv --model BOA --output runs/boa
+
+The files are read in chunks, the mixture is built on the first chunk and updated with the next
+ones, then the predictions, the weights and the final state of the mixture are written to the
+output directory. The number of steps per second, the peak memory and the time spent reading,
+updating and writing are printed and written to summary.json.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from export import export_history
+from ingest import prefetch, read_chunks
+from mixture import Mixture
+
+
+def peak_memory_mb():
+    """Peak resident memory of the process in MB, None where the resource module is missing."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def write_state(mixture, directory):
+    """Writes the slot variables of a mixture in state.npz, and the mixture itself in state.pkl.
+
+    A mixture holding lambdas, e.g. an FTRL mixture with the default regularisation, cannot be
+    pickled: only state.npz is written.
+
+    Returns:
+        bool: whether state.pkl was written.
+    """
+    np.savez(
+        os.path.join(directory, "state.npz"),
+        experts_names=np.array(mixture.experts_names, dtype=str),
+        **{name: getattr(mixture, name) for name in mixture.SLOT_VARIABLES},
+    )
+    path = os.path.join(directory, "state.pkl")
+    listeners, checks = mixture.listeners, mixture.checks
+    mixture.listeners, mixture.checks = [], []
+    try:
+        with open(path, "wb") as f:
+            pickle.dump(mixture, f)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        os.remove(path)
+        return False
+    finally:
+        mixture.listeners, mixture.checks = listeners, checks
+    return True
+
+
+def replay_chunks(
+    experts,
+    target,
+    awake=None,
+    target_column=None,
+    chunk_size=10000,
+    read_options=None,
+):
+    """Yields aligned (experts, targets, awake) chunks of the files.
+
+    Args:
+        experts (str or list): files of the experts, one column per expert.
+        target (str or list): files of the targets.
+        awake (str or list, optional): files of the awake coefficients, with the columns of the experts.
+            Defaults to None.
+        target_column (str, optional): column of the targets. Defaults to None, the only column.
+        chunk_size (int, optional): number of rows per chunk. Defaults to 10000.
+        read_options (dict, optional): options of pandas.read_csv. Defaults to None.
+    """
+    target_columns = None if target_column is None else [target_column]
+    streams = [
+        read_chunks(experts, None, chunk_size, read_options),
+        read_chunks(target, target_columns, chunk_size, read_options),
+    ]
+    if awake is not None:
+        streams.append(read_chunks(awake, None, chunk_size, read_options))
+    for chunks in itertools.zip_longest(*streams):
+        if any(chunk is None for chunk in chunks) or len({len(chunk) for chunk in chunks}) > 1:
+            raise ValueError(
+                "The experts, target and awake files must have the same number of rows"
+            )
+        targets = chunks[1]
+        if target_column is None:
+            if targets.shape[1] != 1:
+                raise ValueError(
+                    f"target_column must be given for a target file with the columns {list(targets.columns)}"
+                )
+            target_column = targets.columns[0]
+        yield chunks[0], targets[target_column], chunks[2] if awake is not None else None
+
+
+def replay(
+    experts,
+    target,
+    awake=None,
+    target_column=None,
+    chunk_size=10000,
+    read_options=None,
+    output=None,
+    format="npz",
+    prefetch_chunks=2,
+    **kwargs,
+):
+    """Replays files through a Mixture and measures the throughput.
+
+    Args:
+        experts (str or list): files of the experts, one column per expert.
+        target (str or list): files of the targets.
+        awake (str or list, optional): files of the awake coefficients. Defaults to None.
+        target_column (str, optional): column of the targets. Defaults to None, the only column.
+        chunk_size (int, optional): number of rows per update. Defaults to 10000.
+        read_options (dict, optional): options of pandas.read_csv. Defaults to None.
+        output (str, optional): directory of the predictions and weights, see export_history, of the
+            final state, see write_state, and of summary.json. Defaults to None, nothing written.
+        format (str, optional): format of the predictions and weights, "npz" or "parquet". Defaults to "npz".
+        prefetch_chunks (int, optional): number of chunks read ahead by a background thread. Defaults to 2.
+        **kwargs: arguments of Mixture, e.g. model or loss_type.
+    Returns:
+        (Mixture, dict): the mixture and the summary of the replay.
+    """
+    start = time.perf_counter()
+    timings = {"read": 0.0, "update": 0.0, "write": 0.0}
+    chunks = replay_chunks(experts, target, awake, target_column, chunk_size, read_options)
+    if prefetch_chunks:
+        chunks = prefetch(chunks, prefetch_chunks)
+    mixture = None
+    n_chunks = 0
+    tic = time.perf_counter()
+    for x, y, awake_chunk in chunks:
+        toc = time.perf_counter()
+        timings["read"] += toc - tic
+        if mixture is None:
+            mixture = Mixture(y=y, experts=x, awake=awake_chunk, **kwargs)
+        else:
+            mixture.update(x, y, awake=awake_chunk)
+        n_chunks += 1
+        tic = time.perf_counter()
+        timings["update"] += tic - toc
+    if mixture is None:
+        raise ValueError("No rows to replay")
+    steps = mixture.n_rows
+    if output is not None:
+        tic = time.perf_counter()
+        export_history(mixture, output, format=format, tables=["series", "weights"])
+        pickled = write_state(mixture, output)
+        timings["write"] = time.perf_counter() - tic
+    seconds = time.perf_counter() - start
+    summary = {
+        "model": mixture.model,
+        "steps": steps,
+        "experts": len(mixture.experts_names),
+        "chunks": n_chunks,
+        "loss": float(mixture.loss),
+        "seconds": seconds,
+        "steps_per_s": steps / seconds,
+        "update_steps_per_s": steps / timings["update"] if timings["update"] > 0 else None,
+        "read_s": timings["read"],
+        "update_s": timings["update"],
+        "write_s": timings["write"],
+        "peak_memory_mb": peak_memory_mb(),
+    }
+    if output is not None:
+        summary["state_pickled"] = pickled
+        with open(os.path.join(output, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+    return mixture, summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--experts", nargs="+", required=True, help="CSV or Parquet files of the experts"
+    )
+    parser.add_argument(
+        "--target", nargs="+", required=True, help="CSV or Parquet files of the targets"
+    )
+    parser.add_argument("--awake", nargs="+", help="CSV or Parquet files of the awake coefficients")
+    parser.add_argument("--target-column", help="column of the targets in the target files")
+    parser.add_argument("--model", default="BOA", choices=["BOA", "MLpol", "MLprod", "FTRL"])
+    parser.add_argument("--loss", default="mse", choices=["mse", "mae", "mape", "msle", "mspe"])
+    parser.add_argument(
+        "--no-gradient",
+        action="store_true",
+        help="compute the regrets with the loss instead of its gradient",
+    )
+    parser.add_argument("--forgetting", type=float, help="forgetting factor, see Mixture")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="number of rows per update")
+    parser.add_argument("--sep", default=",", help="separator of the CSV files")
+    parser.add_argument("--output", help="directory of the predictions, weights, state and summary")
+    parser.add_argument("--format", default="npz", choices=["npz", "parquet"])
+    parser.add_argument("--prefetch", type=int, default=2, help="chunks read ahead, 0 to disable")
+    args = parser.parse_args(argv)
+    _, summary = replay(
+        args.experts,
+        args.target,
+        awake=args.awake,
+        target_column=args.target_column,
+        chunk_size=args.chunk_size,
+        read_options={"sep": args.sep},
+        output=args.output,
+        format=args.format,
+        prefetch_chunks=args.prefetch,
+        model=args.model,
+        loss_type=args.loss,
+        loss_gradient=not args.no_gradient,
+        forgetting=args.forgetting,
+    )
+    for name, value in summary.items():
+        value = f"{value:.6g}" if isinstance(value, float) else value
+        print(f"{name:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Batch reports of many mixtures.
+
+The diagnostics of each mixture are reduced in the main process to a few arrays of bounded size,
+so the workers rendering the figures receive these arrays rather than the histories of the
+mixtures. The figures are rendered with the headless Agg backend in a process pool and written
+to a directory, with an index.html and an index.csv summing up the mixtures.
+"""
+
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib import cbook
+
+from mixture import (
+    MAX_POINTS,
+    average_losses,
+    bucket_mean,
+    cumulative_residuals,
+    draw_bars,
+    draw_boxplot,
+    draw_lines,
+    draw_stack,
+    dynamic_average_losses,
+    layout_panels,
+    min_max_decimate,
+    palette,
+    selected_experts,
+    series_legend,
+    series_predictions,
+    set_titles,
+    stacked_experts,
+)
+
+
+def diagnostics(mixture, max_experts=None, max_points=MAX_POINTS):
+    """Arrays needed to draw the diagnostic plots of a mixture, see Mixture.plot_mixture.
+
+    The series are computed by the plot helpers of mixture.py, so the experts drawn are the
+    max_experts experts with the largest mean weights, and the best and the worst of the others.
+
+    Args:
+        mixture (Mixture): the mixture.
+        max_experts (int, optional): max number of experts drawn. Defaults to None, all of them.
+        max_points (int, optional): max number of points per series. Defaults to MAX_POINTS.
+    Returns:
+        dict: the diagnostics, of size independent of the length of the history.
+    """
+    K = len(mixture.experts_names)
+    if not max_experts or max_experts > K:
+        max_experts = K
+    colors = palette(K + 2)
+    predictions = mixture.predictions
+
+    # Stacked weights, the others being summed up
+    stack, stack_colors, stack_labels = stacked_experts(mixture, max_experts, colors)
+    steps, stacked_weights = bucket_mean(stack, max_points)
+    _, contributions = bucket_mean(stack * predictions.reshape(-1, 1), max_points)
+    _, mean_predictions = bucket_mean(predictions, max_points)
+
+    # Series of the lines: the selected experts, the mixture and the uniform mixture
+    columns, series_colors, series_labels = selected_experts(mixture, max_experts, colors)
+    series_colors, series_labels = series_legend(mixture, series_colors, series_labels)
+    series = series_predictions(mixture, columns)
+    raw = series_predictions(mixture, columns, asleep_as_mixture=False)
+    n_experts = len(columns)
+    return {
+        "model": mixture.model,
+        "T": len(predictions),
+        "K": K,
+        "loss": mixture.loss,
+        "steps": steps,
+        "stacked_weights": stacked_weights,
+        "contributions": contributions,
+        "predictions": mean_predictions,
+        "stack_colors": stack_colors,
+        "stack_labels": stack_labels.astype(str),
+        "boxplot": cbook.boxplot_stats(
+            mixture.weights[:, columns], labels=series_labels[:n_experts]
+        ),
+        "box_colors": series_colors[:n_experts],
+        "average_losses": average_losses(mixture, raw),
+        "dyn_avg_loss": min_max_decimate(dynamic_average_losses(mixture, series), max_points),
+        "cumul_res": min_max_decimate(cumulative_residuals(mixture, series), max_points),
+        "series_colors": series_colors,
+        "series_labels": series_labels,
+    }
+
+
+def draw_report(diagnostic):
+    """Figure of the diagnostics of a mixture, with the panels of Mixture.plot_mixture."""
+    fig, ax = plt.subplots(3, 2, figsize=(10, 8), dpi=100)
+    steps = diagnostic["steps"]
+    colors = diagnostic["series_colors"]
+    labels = diagnostic["series_labels"]
+    stack_colors = diagnostic["stack_colors"]
+    stack_labels = diagnostic["stack_labels"]
+
+    draw_stack(ax[0, 0], steps, diagnostic["stacked_weights"], stack_colors, stack_labels)
+    set_titles(ax[0, 0], "plot_weight")
+    draw_boxplot(ax[0, 1], diagnostic["boxplot"], diagnostic["box_colors"])
+    set_titles(ax[0, 1], "boxplot_weight")
+    draw_lines(ax[1, 0], *diagnostic["dyn_avg_loss"], colors, labels)
+    set_titles(ax[1, 0], "dyn_avg_loss")
+    positions, values = diagnostic["cumul_res"]
+    draw_lines(ax[1, 1], positions, values, colors, labels, list(range(2, values.shape[1])) + [0, 1])
+    set_titles(ax[1, 1], "cumul_res")
+    draw_bars(ax[2, 0], diagnostic["average_losses"], colors, labels)
+    set_titles(ax[2, 0], "avg_loss")
+    draw_stack(
+        ax[2, 1],
+        steps,
+        diagnostic["contributions"],
+        stack_colors,
+        stack_labels,
+        diagnostic["predictions"],
+    )
+    set_titles(ax[2, 1], "contrib")
+    layout_panels(fig, ax)
+    return fig
+
+
+def use_agg():
+    plt.switch_backend("Agg")
+
+
+def render_report(stem, diagnostic, directory, formats):
+    """Writes the figure of a mixture in each format, returns the file names."""
+    use_agg()
+    fig = draw_report(diagnostic)
+    files = []
+    for extension in formats:
+        file_name = f"{stem}.{extension}"
+        fig.savefig(os.path.join(directory, file_name))
+        files.append(file_name)
+    plt.close(fig)
+    return files
+
+
+def safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+
+
+def file_stems(names):
+    """File names of the reports without extension, one per name.
+
+    Different names can have the same safe_name, e.g. "a/b" and "a_b", and the file systems may
+    ignore the case, so a suffix _2, _3, ... is added to the names whose file would overwrite the
+    one of a previous name.
+    """
+    stems = []
+    used = set()
+    for name in names:
+        stem = safe_name(name)
+        candidate = stem
+        i = 1
+        while candidate.lower() in used:
+            i += 1
+            candidate = f"{stem}_{i}"
+        used.add(candidate.lower())
+        stems.append(candidate)
+    return stems
+
+
+def build_reports(
+    mixtures,
+    directory,
+    formats=("png",),
+    n_jobs=None,
+    max_experts=None,
+    max_points=MAX_POINTS,
+):
+    """Renders the diagnostic figures of many mixtures in a directory, with an index.
+
+    Args:
+        mixtures (dict): dict mapping a report name to a Mixture.
+        directory (str): directory of the reports, created if needed.
+        formats (tuple, optional): file formats of the figures, e.g. ("png", "pdf"). Defaults to ("png",).
+        n_jobs (int, optional): number of processes rendering the figures. Defaults to None, the number
+            of processors.
+        max_experts (int, optional): max number of experts drawn per figure. Defaults to None, all of them.
+        max_points (int, optional): max number of points per series. Defaults to MAX_POINTS.
+    Returns:
+        pandas.DataFrame: the index of the reports, one row per mixture.
+
+    Example:
+        index = build_reports({"h00_q50": mod_1, "h01_q50": mod_2}, "reports/2024-01-01", formats=("png", "pdf"))
+    """
+    os.makedirs(directory, exist_ok=True)
+    names = list(mixtures)
+    diagnostics_list = [
+        diagnostics(mixtures[name], max_experts=max_experts, max_points=max_points)
+        for name in names
+    ]
+    with ProcessPoolExecutor(n_jobs, initializer=use_agg) as executor:
+        files = list(
+            executor.map(
+                render_report,
+                file_stems(names),
+                diagnostics_list,
+                [directory] * len(names),
+                [tuple(formats)] * len(names),
+            )
+        )
+    index = pd.DataFrame(
+        {
+            "name": names,
+            "model": [diagnostic["model"] for diagnostic in diagnostics_list],
+            "T": [diagnostic["T"] for diagnostic in diagnostics_list],
+            "K": [diagnostic["K"] for diagnostic in diagnostics_list],
+            "loss": [diagnostic["loss"] for diagnostic in diagnostics_list],
+            "files": [" ".join(f) for f in files],
+        }
+    )
+    index.to_csv(os.path.join(directory, "index.csv"), index=False)
+    write_index(index, os.path.join(directory, "index.html"))
+    return index
+
+
+def write_index(index, path):
+    rows = []
+    for row in index.itertuples(index=False):
+        links = " ".join(
+            f'<a href="{html.escape(f)}">{html.escape(f.rsplit(".", 1)[-1])}</a>'
+            for f in row.files.split()
+        )
+        images = "".join(
+            f'<br><img src="{html.escape(f)}" width="600">'
+            for f in row.files.split()
+            if f.endswith(".png")
+        )
+        rows.append(
+            f"<tr><td>{html.escape(str(row.name))}</td><td>{html.escape(str(row.model))}</td>"
+            f"<td>{row.T}</td><td>{row.K}</td><td>{row.loss:.6g}</td><td>{links}{images}</td></tr>"
+        )
+    with open(path, "w") as f:
+        f.write(
+            "<html><head><meta charset=\"utf-8\"><title>Mixture reports</title></head><body>\n"
+            "<table border=\"1\"><tr><th>name</th><th>model</th><th>T</th><th>K</th>"
+            "<th>loss</th><th>figures</th></tr>\n" + "\n".join(rows) + "\n</table></body></html>\n"
+        )
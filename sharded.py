@@ -0,0 +1,380 @@
+"""
+Sharded aggregation: the experts are partitioned across worker processes.
+
+Each shard keeps the slot variables (cum_regrets, learning_rates, ...) of its own experts and
+the expert forecasts of the current chunk. At each step only scalars travel between the
+coordinator and the shards:
+
+    - BOA: the max of Raux over the awake experts of the shard, the sum of exp(Raux - max)
+      and the partial prediction, combined with a log-sum-exp by the coordinator,
+    - MLpol: the partial sums of the unnormalised weights and of the prediction, and after the
+      update the largest squared regret of the shard,
+    - MLprod: the partial sums of the unnormalised weights and of the prediction.
+
+The coordinator sends back the mixture prediction and the normalisation, and each shard
+updates its slot variables with the steps of the rules used by Mixture, see mixture.step_BOA.
+"""
+
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from mixture import regrets, resolve_loss, step_BOA, step_MLpol, step_MLprod
+
+RULES = {"BOA": "BOA", "MLPOL": "MLpol", "MLPROD": "MLprod"}
+
+
+class Shard:
+    """Slot variables and history of weights of a slice of the experts."""
+
+    def __init__(self, n_experts, K, model, loss_type, loss_gradient):
+        self.K = K
+        self.model = model
+        self.loss_gradient = loss_gradient
+        self.loss_type = loss_type
+        self.cum_vars = np.ones(n_experts) / np.power(2, 20)
+        self.max_losses = np.ones(n_experts) / np.power(2, 20)
+        self.cum_regrets = np.zeros(n_experts)
+        self.cum_reg_regrets = np.zeros(n_experts)
+        self.learning_rates = np.ones(n_experts) / np.power(2, 20)
+        self.max_sq_regrets = 0.0
+        self.w = np.full(n_experts, 1 / K)
+        self.weights = []
+        self.pending_r = None
+
+    def load(self, x, awake):
+        self.x = x
+        self.awake = awake
+
+    def Raux(self):
+        return (
+            np.log(self.learning_rates)
+            + np.log(1 / self.K)
+            + self.learning_rates * self.cum_reg_regrets
+        )
+
+    def apply_max_sq_regret(self, max_sq_regret):
+        """Ends the MLpol step once the largest squared regret over the shards is known."""
+        if self.pending_r is None:
+            return
+        step_MLpol(self, self.pending_r, max_sq_regret)
+        self.pending_r = None
+
+    def partials(self, t, max_sq_regret=None):
+        """Partial sums needed by the coordinator to form the prediction at time t."""
+        x, awake = self.x[t], self.awake[t]
+        if self.model == "BOA":
+            idx = awake > 0
+            Raux = self.Raux()
+            if not np.any(idx):
+                self.unnormalised = np.zeros(x.shape[0])
+                return -np.inf, 0.0, 0.0
+            Rmax = np.max(Raux[idx])
+            self.unnormalised = np.zeros(x.shape[0])
+            self.unnormalised[idx] = np.exp(Raux[idx] - Rmax)
+            return (
+                Rmax,
+                np.sum(self.unnormalised),
+                np.sum(self.unnormalised * x),
+            )
+        elif self.model == "MLpol":
+            self.apply_max_sq_regret(max_sq_regret)
+            w = np.multiply(self.learning_rates, np.maximum(self.cum_regrets, 0))
+            self.unnormalised = awake * w
+            return (
+                np.sum(w),
+                np.sum(self.unnormalised),
+                np.sum(self.unnormalised * x),
+                np.sum(awake),
+                np.sum(awake * x),
+            )
+        else:
+            self.unnormalised = awake * np.multiply(
+                self.learning_rates, np.exp(self.cum_regrets)
+            )
+            return np.sum(self.unnormalised), np.sum(self.unnormalised * x)
+
+    def advance(self, t, y_hat, y, scale, uniform=False):
+        """Updates the slot variables of the shard with the prediction y_hat of the mixture."""
+        x, awake = self.x[t], self.awake[t]
+        if uniform:
+            self.w = awake * scale
+        else:
+            self.w = self.unnormalised * scale
+        self.weights.append(self.w)
+        r = regrets(
+            self.loss_type, self.loss_gradient, x, np.array([y_hat]), np.array([y]), awake
+        )
+        if self.model == "BOA":
+            step_BOA(self, r, self.K)
+        elif self.model == "MLpol":
+            # The step ends in apply_max_sq_regret, once the largest squared regret is known
+            self.pending_r = r
+            return np.max(np.square(r)) if r.shape[0] > 0 else 0.0
+        else:
+            step_MLprod(self, r, self.K)
+        return None
+
+    def coefficient_partials(self, max_sq_regret=None):
+        """Partial sums needed to compute the coefficients at the end of an update."""
+        if self.model == "BOA":
+            Raux = self.Raux()
+            if Raux.shape[0] == 0:
+                return -np.inf, 0.0
+            Rmax = np.max(Raux)
+            self.unnormalised = np.exp(Raux - Rmax)
+            return Rmax, np.sum(self.unnormalised)
+        elif self.model == "MLpol":
+            self.apply_max_sq_regret(max_sq_regret)
+            self.unnormalised = np.multiply(
+                self.learning_rates, np.maximum(self.cum_regrets, 0)
+            )
+        else:
+            self.unnormalised = np.multiply(
+                self.learning_rates, np.exp(self.cum_regrets)
+            )
+        return np.sum(self.unnormalised)
+
+    def set_coefficients(self, scale, uniform=False):
+        if uniform:
+            self.w = np.full(self.unnormalised.shape[0], 1 / self.K)
+        else:
+            self.w = self.unnormalised * scale
+
+    def predict_partials(self, x, awake):
+        coef = awake * self.w
+        return np.sum(coef, axis=-1), np.sum(coef * x, axis=-1)
+
+    def get(self, name):
+        if name == "weights":
+            return np.array(self.weights).reshape(len(self.weights), self.w.shape[0])
+        return getattr(self, name)
+
+
+def serve(conn, shard):
+    """Loop of a shard process: runs the methods requested by the coordinator."""
+    while True:
+        method, args = conn.recv()
+        if method == "close":
+            conn.close()
+            return
+        conn.send(getattr(shard, method)(*args))
+
+
+class ShardedMixture:
+    """Mixture whose experts are partitioned across worker processes.
+
+    The BOA, MLpol and MLprod rules give the same predictions and weights as Mixture, with the
+    vector work of each step split between the shards.
+
+    Args:
+        y (numpy.array or pandas.DataFrame): array of targets
+        experts (pandas.DataFrame): array of experts
+        awake (numpy.array or pandas.DataFrame, optional): A matrix specifying the activation coefficients
+            of the experts. Defaults to None.
+        model (str, optional): aggregation rule, one of BOA, MLpol, MLprod. Defaults to "BOA".
+        loss_type (str, optional): loss function, see Mixture. Defaults to "mse".
+        loss_gradient (bool, optional): whether the loss is used with gradient. Defaults to True.
+        n_shards (int, optional): number of worker processes. Defaults to 2.
+        mp_context (str, optional): multiprocessing start method. Defaults to None.
+
+    Example:
+        with ShardedMixture(y=targets, experts=experts, model="BOA", n_shards=4) as mix:
+            mix.update(new_experts, new_y)
+            print(mix.predict(next_experts))
+    """
+
+    def __init__(
+        self,
+        y,
+        experts,
+        awake=None,
+        model="BOA",
+        loss_type="mse",
+        loss_gradient=True,
+        n_shards=2,
+        mp_context=None,
+    ):
+        if model.upper() not in RULES:
+            raise NotImplementedError(
+                f"Algorithm {model} is not implemented in sharded mode."
+            )
+        if not isinstance(experts, pd.DataFrame):
+            raise (TypeError("Experts must be a pandas dataframe"))
+        self.model = RULES[model.upper()]
+        self.loss_function, self.loss_type = resolve_loss(loss_type, loss_gradient)
+        self.loss_gradient = loss_gradient
+        self.experts_names = experts.columns
+        self.K = experts.shape[-1]
+        self.slices = [
+            (part[0], part[-1] + 1) if len(part) else (0, 0)
+            for part in np.array_split(np.arange(self.K), n_shards)
+        ]
+        # Only the predictions and targets are kept by the coordinator, in one block per update:
+        # the experts of an update are held by the shards until the next one
+        self.history = []
+        self.history_cache = {}
+        self.cum_loss = 0.0
+        self.n_losses = 0
+        self.max_sq_regret = None
+        context = multiprocessing.get_context(mp_context)
+        self.connections = []
+        self.processes = []
+        for start, stop in self.slices:
+            parent, child = context.Pipe()
+            shard = Shard(
+                stop - start, self.K, self.model, self.loss_type, self.loss_gradient
+            )
+            process = context.Process(target=serve, args=(child, shard), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self.update(experts, y, awake=awake)
+
+    def call(self, method, *args_per_shard):
+        """Calls a method on every shard, the shards working in parallel."""
+        for i, conn in enumerate(self.connections):
+            conn.send((method, tuple(args[i] for args in args_per_shard)))
+        return [conn.recv() for conn in self.connections]
+
+    def broadcast(self, method, *args):
+        return self.call(method, *[[arg] * len(self.connections) for arg in args])
+
+    def split(self, x):
+        return [x[..., start:stop] for start, stop in self.slices]
+
+    def check(self, experts, awake):
+        if set(experts.columns) != set(self.experts_names):
+            raise (
+                ValueError(
+                    f"Bad experts columns, expected {list(self.experts_names)} found {list(experts.columns)}"
+                )
+            )
+        x = experts[self.experts_names].to_numpy()
+        if awake is None:
+            awake = np.ones(x.shape)
+        if awake.shape != x.shape:
+            raise ValueError(
+                f"Bad dimention for awake, expexted {x.shape} got {awake.shape}"
+            )
+        if isinstance(awake, pd.DataFrame):
+            awake = awake[self.experts_names]
+        return x, np.asarray(awake)
+
+    def combine(self, partials):
+        """Mixture prediction and normalisation from the partial sums of the shards."""
+        if self.model == "BOA":
+            Rmax = max(p[0] for p in partials)
+            factors = [np.exp(p[0] - Rmax) if p[1] > 0 else 0.0 for p in partials]
+            total = sum(f * p[1] for f, p in zip(factors, partials))
+            y_hat = sum(f * p[2] for f, p in zip(factors, partials)) / total
+            return y_hat, [f / total for f in factors], False
+        elif self.model == "MLpol":
+            if sum(p[0] for p in partials) != 0:
+                total = sum(p[1] for p in partials)
+                y_hat = sum(p[2] for p in partials) / total
+                return y_hat, [1 / total] * len(partials), False
+            total = sum(p[3] for p in partials)
+            y_hat = sum(p[4] for p in partials) / total
+            return y_hat, [1 / total] * len(partials), True
+        else:
+            total = sum(p[0] for p in partials)
+            y_hat = sum(p[1] for p in partials) / total
+            return y_hat, [1 / total] * len(partials), False
+
+    def update(self, new_experts, new_y, awake=None):
+        """updates the model sequentially with new experts and new targets, see Mixture.update."""
+        x, awake = self.check(new_experts, awake)
+        y = new_y if isinstance(new_y, np.ndarray) else new_y.to_numpy()
+        if x.shape[:-1] != y.shape:
+            raise ValueError("Bad dimensions: x and y should have the same shape")
+        self.call("load", self.split(x), self.split(awake))
+        y_hats = np.empty(y.shape[0])
+        for t, value in enumerate(y):
+            partials = self.broadcast("partials", t, self.max_sq_regret)
+            y_hat, scales, uniform = self.combine(partials)
+            extras = self.call(
+                "advance",
+                [t] * len(self.connections),
+                [y_hat] * len(self.connections),
+                [value] * len(self.connections),
+                scales,
+                [uniform] * len(self.connections),
+            )
+            if self.model == "MLpol":
+                self.max_sq_regret = max(extras)
+            y_hats[t] = y_hat
+        self.history.append({"predictions": y_hats, "targets": np.asarray(y, dtype=float)})
+        self.cum_loss += np.sum(self.loss_function(y_hats, y))
+        self.n_losses += np.size(y)
+        self.loss = self.cum_loss / self.n_losses
+        self.update_coefficient()
+
+    def update_coefficient(self):
+        partials = self.broadcast("coefficient_partials", self.max_sq_regret)
+        self.max_sq_regret = None
+        n = len(self.connections)
+        if self.model == "BOA":
+            Rmax = max(p[0] for p in partials)
+            factors = [np.exp(p[0] - Rmax) if p[1] > 0 else 0.0 for p in partials]
+            total = sum(f * p[1] for f, p in zip(factors, partials))
+            self.call("set_coefficients", [f / total for f in factors], [False] * n)
+        else:
+            total = sum(partials)
+            uniform = self.model == "MLpol" and total == 0
+            self.call(
+                "set_coefficients",
+                [1 / total if total != 0 else 0.0] * n,
+                [uniform] * n,
+            )
+
+    def predict(self, new_experts, awake=None):
+        """Predictions of the mixture with the last coefficients, see Mixture.predict."""
+        x, awake = self.check(new_experts, awake)
+        partials = self.call("predict_partials", self.split(x), self.split(awake))
+        total = sum(p[0] for p in partials)
+        return (sum(p[1] for p in partials) / total).reshape(-1, 1)
+
+    def history_array(self, name):
+        """Concatenates a variable of the history blocks, the result being cached, see Mixture.history_array."""
+        n_blocks, cached = self.history_cache.get(name, (0, None))
+        if n_blocks == len(self.history) and cached is not None:
+            return cached
+        parts = [block[name] for block in self.history[n_blocks:]]
+        if cached is not None:
+            parts = [cached] + parts
+        cached = np.concatenate(parts) if parts else np.array([])
+        self.history_cache[name] = (len(self.history), cached)
+        return cached
+
+    @property
+    def predictions(self):
+        return self.history_array("predictions")
+
+    @property
+    def targets(self):
+        return self.history_array("targets")
+
+    @property
+    def weights(self):
+        return np.hstack(self.broadcast("get", "weights"))
+
+    @property
+    def w(self):
+        return np.hstack(self.broadcast("get", "w"))
+
+    def close(self):
+        for conn, process in zip(self.connections, self.processes):
+            conn.send(("close", ()))
+            conn.close()
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
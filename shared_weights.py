@@ -0,0 +1,259 @@
+"""
+Publication of the weights of a mixture in shared memory, for scoring processes.
+
+The segment holds a small header followed by the weight vector and the expert names:
+
+    header  : int64[6] = sequence, number of experts, names version, names size, capacity, names capacity
+    weights : float64[capacity]
+    names   : utf-8 json list, names capacity bytes
+
+The writer follows a sequence lock protocol: the sequence is odd while the segment is being
+written and even otherwise, so readers retry a copy that overlapped a write instead of taking
+a lock. The sequence divided by two is the version of the published WeightsSnapshot. A reader
+backs off while the sequence stays odd, and gives up after a timeout, e.g. if the writer died in
+the middle of a write.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from multiprocessing import resource_tracker, shared_memory
+
+from mixture import WeightsSnapshot
+
+HEADER_SIZE = 6
+SEQUENCE, N_EXPERTS, NAMES_VERSION, NAMES_SIZE, CAPACITY, NAMES_CAPACITY = range(
+    HEADER_SIZE
+)
+
+
+def _layout(buffer):
+    header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=buffer)
+    capacity = int(header[CAPACITY])
+    names_capacity = int(header[NAMES_CAPACITY])
+    offset = 8 * HEADER_SIZE
+    weights = np.ndarray((capacity,), dtype=np.float64, buffer=buffer, offset=offset)
+    offset += 8 * capacity
+    names = np.ndarray((names_capacity,), dtype=np.uint8, buffer=buffer, offset=offset)
+    return header, weights, names
+
+
+def attach_segment(name, shared_tracker=False):
+    """Attaches an existing shared memory segment without taking its ownership.
+
+    Readers must not unlink the segment of its creator when they exit. Before Python 3.13,
+    attaching a segment registers it with the resource tracker of the process, which unlinks it
+    at exit, so it is unregistered at once.
+
+    Args:
+        name (str): name of the segment.
+        shared_tracker (bool, optional): whether the process shares the resource tracker of the
+            creator, as the processes started by multiprocessing do, e.g. the workers of a
+            ProcessPoolExecutor. The registration is then the one of the creator, and is left in
+            place. Defaults to False.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name)
+        if os.name == "posix" and not shared_tracker:
+            resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class SharedWeightsPublisher:
+    """Writes the weights of a mixture in a shared memory segment after each update.
+
+    Args:
+        mixture (Mixture): the mixture whose snapshots are published.
+        name (str, optional): name of the shared memory segment. Defaults to a random name.
+        capacity (int, optional): max number of experts the segment can hold. Defaults to the
+            current number of experts.
+        names_capacity (int, optional): number of bytes reserved for the expert names. Defaults to
+            twice the size of the current names.
+
+    Example:
+        publisher = SharedWeightsPublisher(mixture)
+        # in each worker process
+        reader = SharedWeightsReader(publisher.name)
+        reader.predict(new_experts)
+    """
+
+    def __init__(self, mixture, name=None, capacity=None, names_capacity=None):
+        snapshot = mixture.snapshot
+        encoded = self.encode_names(snapshot.experts_names)
+        if capacity is None:
+            capacity = len(snapshot.experts_names)
+        if names_capacity is None:
+            names_capacity = 2 * len(encoded)
+        size = 8 * (HEADER_SIZE + capacity) + names_capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+        header[:] = 0
+        header[CAPACITY] = capacity
+        header[NAMES_CAPACITY] = names_capacity
+        self.header, self.weights, self.names = _layout(self.shm.buf)
+        self.experts_names = None
+        self.mixture = mixture
+        self.write(snapshot)
+        mixture.add_listener(self.write)
+        mixture.add_check(self.check_names)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @staticmethod
+    def encode_names(experts_names):
+        return json.dumps(list(experts_names), default=str).encode("utf-8")
+
+    def check_names(self, experts_names):
+        """Raises a ValueError if the segment cannot hold the weights of these experts.
+
+        Registered with Mixture.add_check, so that add_expert rejects an expert the segment cannot
+        hold before changing the mixture.
+        """
+        if len(experts_names) > self.weights.shape[0]:
+            raise ValueError(
+                f"Too many experts for the shared segment, capacity {self.weights.shape[0]} got {len(experts_names)}"
+            )
+        encoded = self.encode_names(experts_names)
+        if len(encoded) > self.names.shape[0]:
+            raise ValueError(
+                f"Expert names too long for the shared segment, capacity {self.names.shape[0]} bytes got {len(encoded)}"
+            )
+        return encoded
+
+    def write(self, snapshot):
+        """Copies a WeightsSnapshot in the segment."""
+        K = len(snapshot.experts_names)
+        new_names = snapshot.experts_names != self.experts_names
+        if new_names:
+            encoded = self.check_names(snapshot.experts_names)
+        self.header[SEQUENCE] = 2 * snapshot.version - 1
+        self.header[N_EXPERTS] = K
+        self.weights[:K] = snapshot.weights
+        if new_names:
+            self.names[: len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            self.header[NAMES_SIZE] = len(encoded)
+            self.header[NAMES_VERSION] += 1
+            self.experts_names = snapshot.experts_names
+        self.header[SEQUENCE] = 2 * snapshot.version
+
+    def close(self):
+        """Stops publishing and releases the segment."""
+        if self.mixture is not None:
+            self.mixture.remove_listener(self.write)
+            self.mixture.remove_check(self.check_names)
+            self.mixture = None
+            del self.header, self.weights, self.names
+            self.shm.close()
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedWeightsReader:
+    """Reads the weights published by a SharedWeightsPublisher, without any message to the publisher.
+
+    Args:
+        name (str): name of the shared memory segment.
+        timeout (float, optional): max number of seconds a read waits for a write to end.
+            Defaults to 1.
+    """
+
+    def __init__(self, name, timeout=1.0):
+        self.timeout = timeout
+        self.shm = attach_segment(name)
+        self.header, self.weights, self.names = _layout(self.shm.buf)
+        self.names_version = -1
+        self.experts_names = ()
+        self.last = None
+
+    def read(self):
+        """Returns a consistent WeightsSnapshot of the published weights.
+
+        A read overlapping a write is retried, sleeping twice as long after each attempt up to a
+        millisecond, and a TimeoutError is raised if no consistent copy was taken within the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        delay = 1e-6
+        while True:
+            sequence = int(self.header[SEQUENCE])
+            if sequence % 2 == 1:
+                delay = self.wait(deadline, delay)
+                continue
+            if self.last is not None and sequence == 2 * self.last.version:
+                return self.last
+            K = int(self.header[N_EXPERTS])
+            weights = self.weights[:K].copy()
+            names_version = int(self.header[NAMES_VERSION])
+            if names_version != self.names_version:
+                names_size = int(self.header[NAMES_SIZE])
+                encoded = self.names[:names_size].tobytes()
+            if int(self.header[SEQUENCE]) != sequence:
+                delay = self.wait(deadline, delay)
+                continue
+            if names_version != self.names_version:
+                self.experts_names = tuple(json.loads(encoded.decode("utf-8")))
+                self.names_version = names_version
+            weights.setflags(write=False)
+            self.last = WeightsSnapshot(sequence // 2, weights, self.experts_names)
+            return self.last
+
+    def wait(self, deadline, delay):
+        """Sleeps before the next attempt of a read, returns the delay of the following one."""
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"The shared weights were not readable for {self.timeout} s, the writer may have died during a write"
+            )
+        time.sleep(delay)
+        return min(2 * delay, 1e-3)
+
+    def predict(self, new_experts, awake=None):
+        """Same output as Mixture.predict, computed from the last published weights.
+
+        Args:
+            new_experts (numpy.array or pandas.DataFrame): array of new experts, columns in the
+                order of the published names if it is not a DataFrame.
+            awake (numpy.array or pandas.DataFrame, optional): activation coefficients of the experts.
+                Defaults to None.
+        Returns:
+            numpy.array: array of predictions
+        """
+        snapshot = self.read()
+        names = list(snapshot.experts_names)
+        if isinstance(new_experts, pd.DataFrame):
+            if set(new_experts.columns) != set(names):
+                raise ValueError(
+                    f"Bad experts columns, expected {names} found {list(new_experts.columns)}"
+                )
+            new_experts = new_experts[names]
+        x = np.asarray(new_experts, dtype=float)
+        if awake is None:
+            awake = np.ones(x.shape)
+        elif isinstance(awake, pd.DataFrame):
+            awake = awake[names]
+        awake = np.asarray(awake)
+        if awake.shape != x.shape:
+            raise ValueError(
+                f"Bad dimention for awake, expexted {x.shape} got {awake.shape}"
+            )
+        return snapshot.predict(x, awake)
+
+    def close(self):
+        del self.header, self.weights, self.names
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules of the package are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The figures are drawn without a display
+matplotlib.use("Agg")
+
+from mixture import Mixture  # noqa: E402
+
+
+def make_data(T, K, seed=0, asleep=0.3):
+    """Noisy copies of a random target, with random awake coefficients, the first expert always awake.
+
+    Returns:
+        (pandas.DataFrame, pandas.Series, pandas.DataFrame): the experts, the targets and the awake
+            coefficients, each expert being asleep with probability asleep.
+    """
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.normal(10, 1, T))
+    experts = pd.DataFrame(
+        y.to_numpy()[:, None] + rng.normal(0, np.linspace(0.5, 3, K), (T, K)),
+        columns=[f"expert_{k}" for k in range(K)],
+    )
+    awake = pd.DataFrame((rng.random((T, K)) > asleep).astype(float), columns=experts.columns)
+    awake.iloc[:, 0] = 1
+    return experts, y, awake
+
+
+@pytest.fixture
+def data():
+    """Factory of the experts, targets and awake coefficients of make_data."""
+    return make_data
+
+
+def make_small_mixture(T=50, K=3, seed=0, model="BOA"):
+    """Mixture of K noisy copies of a random target, the experts being named a, b, c, ..."""
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.normal(10, 1, T))
+    experts = pd.DataFrame(
+        y.to_numpy()[:, None] + rng.normal(0, 1, (T, K)), columns=list("abcdefghij"[:K])
+    )
+    return Mixture(y=y, experts=experts, model=model)
+
+
+@pytest.fixture
+def small_mixture():
+    """Factory of the mixtures of make_small_mixture."""
+    return make_small_mixture
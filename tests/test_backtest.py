@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from backtest import backtest
+from mixture import Mixture
+
+PERIODS = {
+    "first": pd.date_range("2020-01-03 12:00", "2020-01-05 12:00", freq="D"),
+    "second": pd.date_range("2020-01-07 12:00", "2020-01-09 12:00", freq="D"),
+}
+
+
+def hourly(data):
+    experts, y, awake = data(24 * 12, 3)
+    index = pd.date_range("2020-01-01", periods=len(y), freq="h")
+    return experts.set_axis(index), y.set_axis(index), awake.set_axis(index)
+
+
+def test_predictions_only_use_the_targets_known_at_their_origin(data):
+    experts, y, awake = hourly(data)
+    lag, warmup, horizon = pd.Timedelta("3h"), pd.Timedelta("2D"), pd.Timedelta("1D")
+    summary, predictions = backtest(
+        experts, y, PERIODS, horizon, awake=awake, lag=lag, warmup=warmup, n_jobs=1, model="MLpol"
+    )
+    assert list(summary.index) == ["first", "second"]
+    assert np.all(predictions.index > predictions["origin"])
+    assert np.all(predictions.index <= predictions["origin"] + horizon)
+    for name, origins in PERIODS.items():
+        for origin in origins:
+            # A fresh mixture on the rows of the warmup known at the origin
+            known = (experts.index >= origins[0] - warmup) & (experts.index + lag <= origin)
+            mixture = Mixture(y=y[known], experts=experts[known], awake=awake[known], model="MLpol")
+            rows = predictions[(predictions["period"] == name) & (predictions["origin"] == origin)]
+            assert len(rows) == 24
+            expected = mixture.predict(experts.loc[rows.index], awake=awake.loc[rows.index])
+            np.testing.assert_allclose(rows["prediction"], expected[:, 0], rtol=1e-12)
+
+
+def test_process_pool_matches_the_current_process(data):
+    experts, y, awake = hourly(data)
+    results = [
+        backtest(experts, y, PERIODS, "1D", awake=awake, lag="1h", n_jobs=n_jobs, model="BOA")
+        for n_jobs in [1, 2]
+    ]
+    timings = ["seconds", "update_seconds", "predict_seconds"]
+    pd.testing.assert_frame_equal(results[0][0].drop(columns=timings), results[1][0].drop(columns=timings))
+    pd.testing.assert_frame_equal(results[0][1], results[1][1])
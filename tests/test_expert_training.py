@@ -0,0 +1,109 @@
+import io
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from expert_training import ExpertModels, expert_name, make_training_windows_week, window_bounds
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS)
+
+# The workers are spawned, so the model class is imported from this module
+POOL = """
+import multiprocessing, sys
+import pandas as pd
+from expert_training import ExpertModels
+from test_expert_training import QuantileOfTargets, training_data
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")
+    models = ExpertModels(training_data(), "target", ["feature"], make_model=QuantileOfTargets)
+    days = pd.date_range("2019-06-10", "2019-06-12", freq="D")
+    models.experts(days, n_jobs=2).to_csv(sys.stdout)
+"""
+
+
+class QuantileOfTargets:
+    """Model forecasting the quantile of its training targets."""
+
+    def __init__(self, quantile):
+        self.quantile = quantile
+
+    def fit(self, x, y):
+        self.value = np.quantile(y, self.quantile)
+        return self
+
+    def predict(self, x):
+        return np.full(len(x), self.value)
+
+
+def training_data(start="2019-05-01", end="2019-07-01", seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq="h")
+    return pd.DataFrame(
+        {"date": dates, "feature": rng.normal(size=len(dates)), "target": rng.normal(size=len(dates))}
+    )
+
+
+def test_experts_without_rows_to_forecast():
+    models = ExpertModels(training_data(), "target", ["feature"], make_model=QuantileOfTargets)
+    days = pd.date_range("2019-06-10", "2019-06-12", freq="D")
+    experts = models.experts(days, quantiles=(0.1, 0.9), data=training_data("2020-01-01", "2020-01-02"))
+    assert experts.empty
+    assert list(experts.columns) == [expert_name(q, i) for q in (0.1, 0.9) for i in range(5)]
+    with pytest.raises(ValueError, match="No forecast day"):
+        models.experts([])
+
+
+def test_pool_workers_leave_the_segment_to_the_parent():
+    result = subprocess.run(
+        [sys.executable, "-c", POOL],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, TESTS])),
+    )
+    assert result.returncode == 0, result.stderr
+    # The workers must not unregister the segment from the resource tracker of the parent
+    assert "resource_tracker" not in result.stderr, result.stderr
+    assert "Traceback" not in result.stderr, result.stderr
+    models = ExpertModels(training_data(), "target", ["feature"], make_model=QuantileOfTargets)
+    expected = models.experts(pd.date_range("2019-06-10", "2019-06-12", freq="D"))
+    pooled = pd.read_csv(io.StringIO(result.stdout), index_col=0, parse_dates=True)
+    pd.testing.assert_frame_equal(pooled, expected, check_names=False, check_freq=False)
+
+
+def test_consecutive_days_share_their_windows():
+    models = ExpertModels(training_data(), "target", ["feature"], make_model=QuantileOfTargets)
+    days = pd.date_range("2019-06-10", "2019-06-12", freq="D")
+    experts = models.experts(days, quantiles=(0.1, 0.9))
+    # The window i + 1 of a day is the window i of the next day: one new window per day and quantile
+    assert models.misses == 2 * (5 + 1 + 1)
+    assert models.hits == 2 * (4 + 4)
+    assert len(models.models) == 14
+    models.experts(days, quantiles=(0.1, 0.9))
+    assert models.misses == 14 and models.hits == 16 + 30
+    # A cached regressor is the one of a direct fit on its window
+    for quantile in (0.1, 0.9):
+        for i, (start, end) in enumerate(window_bounds(make_training_windows_week(days[0]))):
+            expected = models.fit_window(quantile, start, end).predict(np.zeros((1, 1)))
+            np.testing.assert_array_equal(experts[expert_name(quantile, i)].iloc[:24], expected[0])
+
+
+def test_least_recently_used_regressor_is_evicted():
+    models = ExpertModels(training_data(), "target", ["feature"], max_size=3, make_model=QuantileOfTargets)
+    starts = pd.date_range("2019-05-10", periods=4, freq="D")
+    for start in starts[:3]:
+        models.get(0.5, start, start + pd.Timedelta(days=10))
+    models.get(0.5, starts[0], starts[0] + pd.Timedelta(days=10))
+    assert (models.hits, models.misses) == (1, 3)
+    # The window of starts[1] is the least recently used
+    models.get(0.5, starts[3], starts[3] + pd.Timedelta(days=10))
+    assert len(models.models) == 3
+    assert models.key(0.5, starts[1], starts[1] + pd.Timedelta(days=10)) not in models.models
+    models.get(0.5, starts[0], starts[0] + pd.Timedelta(days=10))
+    models.get(0.5, starts[1], starts[1] + pd.Timedelta(days=10))
+    assert (models.hits, models.misses) == (2, 5)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from expert_value import expert_values
+from mixture import Mixture
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+@pytest.mark.parametrize("forgetting", [None, 0.95])
+def test_expert_values_match_refits_without_each_expert(data, model, forgetting):
+    experts, y, awake = data(150, 5, asleep=0.2)
+    # Two experts always awake, so that no step is left without any awake expert
+    awake.iloc[:, 1] = 1
+    mixture = Mixture(y=y, experts=experts, awake=awake, model=model, forgetting=forgetting)
+    values = expert_values(mixture)
+    np.testing.assert_allclose(values["loss"] - values["delta"], mixture.loss, rtol=1e-10)
+    for name in experts.columns:
+        others = experts.columns.drop(name)
+        refit = Mixture(
+            y=y, experts=experts[others], awake=awake[others], model=model, forgetting=forgetting
+        )
+        assert values.loc[name, "K"] == len(others)
+        np.testing.assert_allclose(values.loc[name, "loss"], refit.loss, rtol=1e-10)
+
+
+def test_coalitions_match_refits(data):
+    experts, y, awake = data(150, 5, asleep=0.2)
+    mixture = Mixture(y=y, experts=experts, awake=awake, model="MLprod")
+    coalitions = [["expert_1", "expert_2"], ["expert_3", "expert_4"]]
+    values = expert_values(mixture, coalitions=coalitions)
+    for coalition in coalitions:
+        others = experts.columns.drop(coalition)
+        refit = Mixture(y=y, experts=experts[others], awake=awake[others], model="MLprod")
+        np.testing.assert_allclose(values.loc[" + ".join(coalition), "loss"], refit.loss, rtol=1e-10)
+
+
+def test_coalition_of_the_only_awake_experts_cannot_be_left_out(small_mixture):
+    mixture = small_mixture(T=100)
+    awake = pd.DataFrame(np.ones((100, 3)), columns=mixture.experts_names)
+    awake.iloc[50:60] = [0, 1, 0]
+    mixture = Mixture(
+        y=mixture.targets, experts=pd.DataFrame(mixture.experts, columns=mixture.experts_names), awake=awake
+    )
+    with pytest.raises(ValueError, match=r"\['b'\] are the only awake experts at step 50"):
+        expert_values(mixture)
+    values = expert_values(mixture, coalitions=[["a"], ["c"]])
+    assert np.all(np.isfinite(values["loss"]))
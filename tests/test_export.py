@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from export import TABLES, export_history, iter_history, read_npz
+
+
+def expected(mixture, table):
+    return pd.concat(
+        [chunk[table] for chunk in iter_history(mixture, tables=[table])], ignore_index=True
+    )
+
+
+def test_npz_reexport_ignores_stale_chunks(tmp_path, small_mixture):
+    mixture = small_mixture(T=200)
+    export_history(mixture, str(tmp_path), format="npz", chunk_size=50)
+    export_history(mixture, str(tmp_path), format="npz", chunk_size=100, tables=["weights"])
+    weights = read_npz(str(tmp_path), "weights")
+    pd.testing.assert_frame_equal(weights, expected(mixture, "weights"), check_dtype=False)
+    with pytest.raises(ValueError):
+        read_npz(str(tmp_path), "series")
+
+
+def test_parquet_export(tmp_path, small_mixture):
+    pytest.importorskip("pyarrow")
+    mixture = small_mixture(T=200)
+    export_history(mixture, str(tmp_path), format="parquet", chunk_size=64)
+    for table in TABLES:
+        frame = pd.read_parquet(tmp_path / f"{table}.parquet")
+        pd.testing.assert_frame_equal(frame, expected(mixture, table), check_dtype=False)
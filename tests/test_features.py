@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from features import make_features
+
+
+def prices(n=100):
+    # 2021-01-01 is a Friday
+    return pd.DataFrame(
+        {
+            "date": pd.date_range("2021-01-01", periods=n, freq="h").astype(str),
+            "price": np.arange(n, dtype=float),
+            "coal": 1000 + np.arange(n, dtype=float),
+            "fioul": 2000 + np.arange(n, dtype=float),
+            "gas": 3000 + np.arange(n, dtype=float),
+            "nuclear": 4000 + np.arange(n, dtype=float),
+        }
+    )
+
+
+def test_features_of_a_small_frame():
+    data = prices()
+    features = make_features(data)
+    # The first 48 rows have no lag
+    assert list(features.index) == list(range(48, 100))
+    dates = pd.to_datetime(features["date"])
+    np.testing.assert_allclose(features["cos_day"], np.cos(dates.dt.day / 365 * 2 * np.pi))
+    np.testing.assert_allclose(features["sin_month"], np.sin(dates.dt.month / 12 * 2 * np.pi))
+    # Saturday 2 and Sunday 3 January
+    assert list(features["weekdays"].unique()) == [6, 0, 1]
+    np.testing.assert_array_equal(features["weekend"], (dates.dt.dayofweek >= 5).astype(float))
+    np.testing.assert_array_equal(features["not_weekend"], 1 - features["weekend"])
+    np.testing.assert_array_equal(features["2_lags_coal"], 1000 + features.index - 48)
+    np.testing.assert_array_equal(features["2_lags_nuke"], 4000 + features.index - 48)
+    np.testing.assert_array_equal(features["target_price"], features.index - 24)
+    # The columns of data are kept
+    pd.testing.assert_frame_equal(features[data.columns], data.iloc[48:])
+
+
+def test_features_without_dropna():
+    data = prices(30)
+    features = make_features(data, cycles={"hour": ("hour", 24)}, lag=2, target_shift=-1, dropna=False)
+    assert len(features) == 30
+    np.testing.assert_allclose(features["cos_hour"], np.cos(np.arange(30) % 24 / 24 * 2 * np.pi), atol=1e-12)
+    assert features["2_lags_gas"].isna().sum() == 2
+    # A negative shift takes the next price
+    np.testing.assert_array_equal(features["target_price"][:-1], np.arange(1, 30))
+    assert np.isnan(features["target_price"].iloc[-1])
+    # The weekdays of Friday 1 January and Saturday 2 January
+    np.testing.assert_array_equal(features["weekend"], np.arange(30) >= 24)
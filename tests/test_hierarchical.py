@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from hierarchical import HierarchicalMixture
+from mixture import Mixture
+
+
+def test_single_group_is_a_plain_mixture(data):
+    experts, y, awake = data(120, 4)
+    mixture = Mixture(y=y[:80], experts=experts[:80], awake=awake[:80], model="MLpol")
+    mixture.update(experts[80:], y[80:], awake=awake[80:])
+    hierarchical = HierarchicalMixture(
+        y=y[:80], experts=experts[:80], groups={"all": list(experts.columns)}, awake=awake[:80], model="MLpol"
+    )
+    hierarchical.update(experts[80:], y[80:], awake=awake[80:])
+    np.testing.assert_allclose(hierarchical.predictions, mixture.predictions, rtol=1e-12)
+    np.testing.assert_allclose(hierarchical.group_weights["all"], 1)
+    np.testing.assert_allclose(hierarchical.expert_weights(), mixture.w, rtol=1e-12)
+    np.testing.assert_allclose(
+        hierarchical.predict(experts[:5], awake=awake[:5]), mixture.predict(experts[:5], awake=awake[:5])
+    )
+
+
+def test_inner_and_outer_weights(data):
+    experts, y, awake = data(150, 6)
+    groups = {"low": ["expert_0", "expert_1", "expert_2"], "high": ["expert_3", "expert_4", "expert_5"]}
+    hierarchical = HierarchicalMixture(y=y, experts=experts, groups=groups, awake=awake, inner_model="MLprod")
+    for group, names in groups.items():
+        rows = np.any(awake[names] > 0, axis=1).to_numpy()
+        inner = Mixture(y=y[rows], experts=experts.loc[rows, names], awake=awake.loc[rows, names], model="MLprod")
+        np.testing.assert_allclose(hierarchical.inner[group].predictions, inner.predictions, rtol=1e-12)
+    # The outer mixture aggregates the predictions of the inner mixtures, asleep with their groups
+    group_experts = pd.DataFrame(0.0, index=range(len(y)), columns=list(groups))
+    group_awake = np.zeros((len(y), len(groups)))
+    for i, (group, names) in enumerate(groups.items()):
+        rows = np.any(awake[names] > 0, axis=1).to_numpy()
+        group_experts.loc[rows, group] = hierarchical.inner[group].predictions
+        group_awake[rows, i] = 1
+    outer = Mixture(y=y, experts=group_experts, awake=group_awake)
+    np.testing.assert_allclose(hierarchical.group_weights, outer.weights, rtol=1e-12)
+    np.testing.assert_allclose(hierarchical.predictions, outer.predictions, rtol=1e-12)
+    weights = hierarchical.expert_weights()
+    for i, (group, names) in enumerate(groups.items()):
+        np.testing.assert_allclose(weights[names], outer.w[i] * hierarchical.inner[group].w, rtol=1e-12)
+    np.testing.assert_allclose(weights.sum(), 1)
@@ -0,0 +1,71 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest import ChunkedReader, prefetch, read_chunks
+
+
+def test_prefetch_yields_the_items_in_order():
+    assert list(prefetch(iter(range(10)), depth=2)) == list(range(10))
+
+
+def test_prefetch_raises_the_errors_of_the_iterator():
+    def items():
+        yield 1
+        raise KeyError("broken")
+
+    chunks = prefetch(items(), depth=2)
+    assert next(chunks) == 1
+    with pytest.raises(KeyError):
+        next(chunks)
+
+
+def test_prefetch_early_close_on_a_full_queue():
+    produced = threading.Event()
+
+    def items():
+        yield from range(2)
+        produced.set()
+
+    chunks = prefetch(items(), depth=1)
+    assert next(chunks) == 0
+    # The producer has read everything and is waiting on the full queue to send its end marker
+    assert produced.wait(5)
+    closing = threading.Thread(target=chunks.close, daemon=True)
+    closing.start()
+    closing.join(5)
+    assert not closing.is_alive()
+
+
+def test_prefetch_early_close_on_an_error():
+    failed = threading.Event()
+
+    def items():
+        yield from range(2)
+        failed.set()
+        raise KeyError("broken")
+
+    chunks = prefetch(items(), depth=1)
+    assert next(chunks) == 0
+    assert failed.wait(5)
+    closing = threading.Thread(target=chunks.close, daemon=True)
+    closing.start()
+    closing.join(5)
+    assert not closing.is_alive()
+
+
+def test_chunked_reader_matches_one_update(tmp_path):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(10, 1, (250, 3)), columns=["price", "a", "b"])
+    paths = []
+    for i, rows in enumerate([slice(0, 70), slice(70, 180), slice(180, None)]):
+        paths.append(str(tmp_path / f"part_{i}.csv"))
+        data.iloc[rows].to_csv(paths[-1], index=False)
+    chunks = list(read_chunks(paths, chunk_size=100))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), data)
+    reader = ChunkedReader(paths, target="price", experts=["a", "b"], chunk_size=100)
+    mixture = reader.mixture(model="MLpol")
+    assert mixture.n_rows == 250
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from lazy import ExpertProviders, LazyMixture
+from mixture import Mixture
+
+
+def providers(experts):
+    return {name: (lambda rows, name=name: experts.loc[rows, name]) for name in experts.columns}
+
+
+def test_asleep_experts_are_missing_from_the_history(data):
+    experts, y, awake = data(100, 4)
+    lazy = LazyMixture(y=y, providers=providers(experts), index=experts.index, awake=awake)
+    mixture = Mixture(y=y, experts=experts, awake=awake)
+    history = lazy.mixture.experts
+    assert np.all(np.isnan(history[awake.to_numpy() == 0]))
+    awake_rows = awake.to_numpy() > 0
+    np.testing.assert_array_equal(history[awake_rows], experts.to_numpy()[awake_rows])
+    np.testing.assert_array_equal(lazy.predictions, mixture.predictions)
+    np.testing.assert_array_equal(lazy.weights, mixture.weights)
+    np.testing.assert_array_equal(
+        lazy.predict(experts.index[:10], awake=awake[:10]),
+        mixture.predict(experts[:10], awake=awake[:10]),
+    )
+
+
+def test_awake_experts_must_have_forecasts(data):
+    experts, y, _ = data(20, 3)
+    mixture = Mixture(y=y[:10], experts=experts[:10])
+    experts.iloc[12, 1] = np.nan
+    with pytest.raises(ValueError):
+        mixture.update(experts[10:], y[10:])
+
+
+def test_cache_is_bounded(data):
+    experts, _, _ = data(100, 2)
+    lazy = ExpertProviders(providers(experts), max_rows=30)
+    lazy.evaluate(experts.index[:50])
+    assert all(len(cached) == 30 for cached in lazy.cached.values())
+    # The last 30 rows are cached, the first 20 ones are computed again
+    lazy.evaluate(experts.index[:50])
+    assert lazy.calls == {name: 70 for name in experts.columns}
+    lazy.evaluate(experts.index[40:50])
+    assert lazy.calls == {name: 70 for name in experts.columns}
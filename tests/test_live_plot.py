@@ -0,0 +1,45 @@
+import numpy as np
+
+from live_plot import Buckets, LiveFigure
+from mixture import Mixture
+
+
+def test_buckets_double_their_width():
+    buckets = Buckets(2, max_buckets=8, mode="minmax")
+    values = np.random.default_rng(0).normal(size=(100, 2))
+    widths = []
+    for start in range(0, 100, 3):
+        buckets.append(values[start : start + 3])
+        widths.append(buckets.width)
+        assert buckets.counts.shape[0] <= 8
+        assert buckets.counts.sum() == buckets.n_steps
+    assert widths == sorted(widths) and set(widths) == {1, 2, 4, 8, 16}
+    edges = np.append(np.arange(0, 100, 16), 100)
+    _, envelope = buckets.envelope()
+    np.testing.assert_array_equal(
+        envelope[0::2], [values[a:b].min(axis=0) for a, b in zip(edges[:-1], edges[1:])]
+    )
+    np.testing.assert_array_equal(
+        envelope[1::2], [values[a:b].max(axis=0) for a, b in zip(edges[:-1], edges[1:])]
+    )
+
+
+def test_live_figure_draws_a_bounded_number_of_points(data):
+    experts, y, awake = data(1000, 4)
+    mixture = Mixture(y=y[:10], experts=experts[:10], awake=awake[:10])
+    live = LiveFigure(mixture, max_experts=2, max_points=40, refresh=False)
+    widths = []
+    for t in range(10, 1000, 7):
+        mixture.update(experts[t : t + 7], y[t : t + 7], awake=awake[t : t + 7])
+        widths.append(live.weights.width)
+        for line in live.loss_lines + live.residual_lines + [live.prediction_line]:
+            assert len(line.get_xdata()) <= 40
+    assert live.n_steps == 1000
+    assert widths == sorted(widths) and set(widths) == {1, 2, 4, 8, 16, 32, 64}
+    # The bucket means are the means of the weights drawn over the steps of each bucket
+    width = live.weights.width
+    columns = mixture.experts_names.get_indexer(live.experts_names)
+    expected = [mixture.weights[a : a + width, columns].mean(axis=0) for a in range(0, 1000, width)]
+    np.testing.assert_allclose(live.weights.means()[:, 1:], expected)
+    live.close()
+    assert mixture.listeners == []
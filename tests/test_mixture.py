@@ -0,0 +1,424 @@
+import copy
+import hashlib
+import threading
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from mixture import AwakeCache, Mixture, bucket_mean, min_max_decimate
+
+
+def test_add_expert_mlpol_matches_an_expert_asleep_from_the_start(data):
+    experts, y, _ = data(200, 4)
+    awake = pd.DataFrame(np.ones(experts.shape), columns=experts.columns)
+    awake.iloc[:100, 3] = 0
+    first, rest = slice(0, 100), slice(100, None)
+    asleep = Mixture(y=y[first], experts=experts[first], awake=awake[first], model="MLpol")
+    asleep.update(experts[rest], y[rest], awake=awake[rest])
+    late = Mixture(y=y[first], experts=experts.iloc[first, :3], model="MLpol")
+    late.add_expert("expert_3")
+    late.update(experts[rest], y[rest])
+    np.testing.assert_array_equal(late.predictions[100:], asleep.predictions[100:])
+    np.testing.assert_array_equal(late.w, asleep.w)
+
+
+# Digests of the predictions and weights of the mixture before pruning was added, see rule_digest
+BASELINE_DIGESTS = {
+    ("BOA", True): "b200b4fb12d58247",
+    ("BOA", False): "83a8c66522abaf8d",
+    ("MLpol", True): "a8853d5a16ccae0b",
+    ("MLpol", False): "b402d21d66113a59",
+    ("MLprod", True): "b7c63875f976cd4f",
+    ("MLprod", False): "5e65bd73f55dc567",
+}
+
+
+def rule_digest(mixture):
+    values = np.concatenate([np.ravel(mixture.predictions), np.ravel(mixture.weights)])
+    return hashlib.sha256(values.astype("<f8").tobytes()).hexdigest()[:16]
+
+
+def switching_experts(T=800, switch=400, seed=0):
+    """A good, a fair and a bad expert, the bad one becoming the best at step switch."""
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.normal(10, 1, T))
+    experts = pd.DataFrame(
+        {
+            "good": y + rng.normal(0, 0.3, T),
+            "fair": y + rng.normal(0, 1, T),
+            "bad": y + 4 + rng.normal(0, 0.3, T),
+        }
+    )
+    experts.loc[switch:, "bad"] = y[switch:] + rng.normal(0, 0.05, T - switch)
+    experts.loc[switch:, "good"] = y[switch:] + 2
+    return experts, y
+
+
+PRUNING = {"threshold": 1e-2, "patience": 20, "review_every": 20, "review_samples": None}
+
+
+def boa_steps(state, x, y, y_hat, K):
+    """Slot variables of BOA experts left out of the mixture, advanced one step at a time."""
+    state = {name: np.array(value, dtype=float) for name, value in state.items()}
+    for xt, yt, ht in zip(x, y, y_hat):
+        gradient = 2 * (ht - yt)
+        r = gradient * ht - gradient * xt
+        state["max_losses"] = np.maximum(state["max_losses"], np.abs(r))
+        B2 = np.power(2, np.ceil(np.log2(state["max_losses"])))
+        state["cum_vars"] = state["cum_vars"] + np.square(r)
+        state["learning_rates"] = np.minimum(1 / B2, np.sqrt(np.log(K) / state["cum_vars"]))
+        state["cum_reg_regrets"] = state["cum_reg_regrets"] + 1 / 2 * (
+            r
+            - state["learning_rates"] * np.square(r)
+            + B2 * (state["learning_rates"] * r > 1 / 2)
+        )
+        state["cum_regrets"] = state["cum_regrets"] + r
+    return state
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+@pytest.mark.parametrize("loss_gradient", [True, False])
+def test_no_pruning_matches_the_baseline(data, model, loss_gradient):
+    experts, y, awake = data(200, 5, seed=3)
+    first, rest = slice(0, 120), slice(120, None)
+    mixtures = [
+        Mixture(
+            y=y[first],
+            experts=experts[first],
+            awake=awake[first],
+            model=model,
+            loss_gradient=loss_gradient,
+            pruning=pruning,
+        )
+        for pruning in [None, {"threshold": 0, "patience": 5, "review_every": 10}]
+    ]
+    for mixture in mixtures:
+        mixture.update(experts[rest], y[rest], awake=awake[rest])
+    assert rule_digest(mixtures[0]) == BASELINE_DIGESTS[(model, loss_gradient)]
+    # A pruning which never freezes an expert leaves the mixture unchanged
+    assert len(mixtures[1].frozen) == 0
+    np.testing.assert_array_equal(mixtures[1].predictions, mixtures[0].predictions)
+    np.testing.assert_array_equal(mixtures[1].weights, mixtures[0].weights)
+
+
+def test_pruning_freezes_a_bad_expert():
+    experts, y = switching_experts()
+    mixture = Mixture(y=y[:100], experts=experts[:100], model="BOA", pruning=PRUNING)
+    mixture.update(experts[100:400], y[100:400])
+    assert list(mixture.experts_names[mixture.frozen]) == ["bad"]
+    effective_K = mixture.effective_K
+    frozen_from = np.argmax(effective_K == 2)
+    assert frozen_from > 0
+    np.testing.assert_array_equal(effective_K[:frozen_from], 3)
+    np.testing.assert_array_equal(effective_K[frozen_from:], 2)
+    np.testing.assert_array_equal(mixture.weights[frozen_from:, 2], 0)
+    np.testing.assert_allclose(np.sum(mixture.weights, axis=1), 1)
+    assert mixture.snapshot.weights[2] == 0
+
+    # Once the bad expert becomes the best one, a review re-admits it
+    mixture.update(experts[400:], y[400:])
+    assert 2 in mixture.active
+    assert mixture.effective_K[-1] == 3
+    assert np.argmax(mixture.w) == 2
+
+
+def test_readmission_catches_up_the_frozen_expert():
+    experts, y = switching_experts()
+    mixture = Mixture(y=y[:100], experts=experts[:100], model="BOA", pruning=PRUNING)
+    mixture.update(experts[100:410], y[100:410])
+    assert list(mixture.frozen) == [2]
+    first = mixture.frozen_at[2]
+    parked = {name: mixture.parked[name][..., 2] for name in Mixture.SLOT_VARIABLES}
+    expected = boa_steps(
+        parked,
+        mixture.experts[first:, 2],
+        mixture.targets[first:],
+        mixture.predictions[first:],
+        mixture.K,
+    )
+    mixture.readmit(np.array([2]))
+    assert list(mixture.active) == [0, 1, 2]
+    for name in ["max_losses", "cum_vars", "learning_rates", "cum_reg_regrets", "cum_regrets"]:
+        np.testing.assert_allclose(getattr(mixture, name)[2], expected[name], rtol=1e-12)
+
+
+def test_step_with_only_frozen_experts_awake():
+    experts, y = switching_experts()
+    mixture = Mixture(y=y[:100], experts=experts[:100], model="BOA", pruning=PRUNING)
+    mixture.update(experts[100:400], y[100:400])
+    assert list(mixture.frozen) == [2]
+    awake = np.array([[0.0, 0.0, 1.0]])
+    mixture.update(experts[400:401], y[400:401], awake=awake)
+    # The only awake expert is re-admitted and predicts alone
+    assert mixture.predictions[-1] == experts["bad"][400]
+    assert list(mixture.active) == [0, 1, 2]
+    assert mixture.effective_K[-1] == 3
+    np.testing.assert_array_equal(mixture.weights[-1], [0, 0, 1])
+
+
+def updated_in_chunks(experts, y, awake, sizes, **kwargs):
+    """Mixture built on the first sizes[0] rows and updated with chunks of the next sizes."""
+    bounds = np.cumsum([0] + list(sizes))
+    rows = slice(bounds[0], bounds[1])
+    mixture = Mixture(y=y[rows], experts=experts[rows], awake=awake[rows], **kwargs)
+    for start, stop in zip(bounds[1:-1], bounds[2:]):
+        mixture.update(experts[start:stop], y[start:stop], awake=awake[start:stop])
+    return mixture
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_checkpoints_every_steps_across_updates(data, model):
+    experts, y, awake = data(200, 4)
+    mixture = updated_in_chunks(experts, y, awake, [37, 50, 13, 100], model=model, checkpoint_every=25)
+    assert [c["row"] for c in mixture.checkpoints] == list(range(0, 201, 25))
+    for checkpoint in mixture.checkpoints[1:]:
+        row = checkpoint["row"]
+        expected = Mixture(y=y[:row], experts=experts[:row], awake=awake[:row], model=model)
+        np.testing.assert_array_equal(checkpoint["state"]["cum_regrets"], expected.cum_regrets)
+        np.testing.assert_array_equal(checkpoint["state"]["learning_rates"], expected.learning_rates)
+        np.testing.assert_allclose(checkpoint["cum_loss"], expected.cum_loss, rtol=1e-12)
+        assert checkpoint["n_losses"] == row
+
+
+def test_truncated_history(data):
+    experts, y, awake = data(100, 3)
+    mixture = updated_in_chunks(experts, y, awake, [30, 30, 40], checkpoint_every=10)
+    for row in [0, 15, 30, 45, 100]:
+        blocks = mixture.truncated_history(row)
+        assert sum(len(block["targets"]) for block in blocks) == row
+        if row > 0:
+            for name in ["predictions", "targets"]:
+                values = np.concatenate([block[name] for block in blocks])
+                np.testing.assert_array_equal(values, getattr(mixture, name)[:row])
+    # The blocks of the mixture are left whole
+    assert [len(block["targets"]) for block in mixture.history] == [30, 30, 40]
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_replay_without_changes_reproduces_the_history(data, model):
+    experts, y, awake = data(200, 4)
+    mixture = updated_in_chunks(experts, y, awake, [80, 120], model=model, checkpoint_every=25)
+    for t in [0, 60, 130, 200]:
+        replay = mixture.replay_from(t)
+        np.testing.assert_array_equal(replay.predictions, mixture.predictions)
+        np.testing.assert_array_equal(replay.weights, mixture.weights)
+        np.testing.assert_array_equal(replay.w, mixture.w)
+        np.testing.assert_allclose(replay.loss, mixture.loss, rtol=1e-12)
+    # The mixture itself is unchanged by the replays
+    assert mixture.n_rows == 200 and len(mixture.checkpoints) == 9
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_replay_with_changes_matches_a_refit(data, model):
+    experts, y, awake = data(200, 4)
+    mixture = updated_in_chunks(experts, y, awake, [80, 120], model=model, checkpoint_every=25)
+    t = 130
+
+    # A replaced expert
+    replaced = experts.copy()
+    replaced.loc[t:, "expert_1"] = y[t:] + 0.1
+    replay = mixture.replay_from(t, experts=replaced[t:])
+    refit = Mixture(y=y, experts=replaced, awake=awake, model=model)
+    np.testing.assert_array_equal(replay.predictions, refit.predictions)
+    np.testing.assert_array_equal(replay.weights, refit.weights)
+
+    # An expert asleep from t onwards
+    asleep = awake.copy()
+    asleep.loc[t:, "expert_2"] = 0
+    replay = mixture.replay_from(t, experts=["expert_0", "expert_1", "expert_3"])
+    refit = Mixture(y=y, experts=experts, awake=asleep, model=model)
+    np.testing.assert_array_equal(replay.predictions, refit.predictions)
+    np.testing.assert_array_equal(replay.weights, refit.weights)
+    np.testing.assert_array_equal(
+        mixture.replay_from(t, awake=asleep[t:]).predictions, refit.predictions
+    )
+
+
+def vector_data(T=120, d=4, K=3, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.normal(10, 1, (T, d))
+    experts = y[..., None] + rng.normal(0, np.linspace(0.5, 3, K), (T, d, K))
+    return experts, y
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_vector_targets(model):
+    experts, y = vector_data()
+    names = ["a", "b", "c"]
+    mixture = Mixture(y=y[:80], experts=experts[:80], model=model, experts_names=names)
+    mixture.update(experts[80:], y[80:])
+    assert mixture.predictions.shape == y.shape and mixture.weights.shape == (120, 3)
+    # The d targets of a step share the weights of the step
+    np.testing.assert_allclose(
+        mixture.predictions, np.sum(mixture.weights[:, None, :] * experts, axis=-1), rtol=1e-12
+    )
+    np.testing.assert_allclose(mixture.loss, np.mean(np.square(mixture.predictions - y)), rtol=1e-12)
+    np.testing.assert_allclose(
+        mixture.predict(experts[:5]), np.sum(mixture.w * experts[:5], axis=-1, keepdims=True), rtol=1e-12
+    )
+    # d copies of the same target average d equal regrets, as a scalar mixture
+    scalar = Mixture(y=pd.Series(y[:, 0]), experts=pd.DataFrame(experts[:, 0], columns=names), model=model)
+    copies = Mixture(
+        y=np.repeat(y[:, :1], 3, axis=1),
+        experts=np.repeat(experts[:, :1], 3, axis=1),
+        model=model,
+        experts_names=names,
+    )
+    np.testing.assert_allclose(copies.weights, scalar.weights, rtol=1e-10)
+    np.testing.assert_allclose(copies.predictions[:, 0], scalar.predictions, rtol=1e-10)
+
+
+def test_plots_of_vector_targets():
+    experts, y = vector_data()
+    mixture = Mixture(y=y, experts=experts, experts_names=["a", "b", "c"])
+    mixture.plot_mixture(plot_type="plot_weight")
+    mixture.plot_mixture(plot_type="boxplot_weight")
+    plt.close("all")
+    for plot_type in ["all", "contrib", "avg_loss"]:
+        with pytest.raises(ValueError, match="not available for vector targets"):
+            mixture.plot_mixture(plot_type=plot_type)
+
+
+def test_predict_during_updates_uses_a_published_snapshot(data):
+    experts, y, _ = data(400, 5)
+    mixture = Mixture(y=y[:50], experts=experts[:50], model="MLpol")
+    published = [mixture.snapshot]
+    mixture.add_listener(published.append)
+    new_experts = experts[:3]
+    results = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            results.append(mixture.predict(new_experts))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for t in range(50, 400, 5):
+        mixture.update(experts[t : t + 5], y[t : t + 5])
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert len(published) == 71 and len(results) > 0
+    expected = {
+        snapshot.predict(new_experts.to_numpy(), np.ones(new_experts.shape)).tobytes()
+        for snapshot in published
+    }
+    assert all(result.tobytes() in expected for result in results)
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_forgetting_of_one_is_no_forgetting(data, model):
+    experts, y, awake = data(200, 5)
+    mixtures = [
+        Mixture(y=y, experts=experts, awake=awake, model=model, forgetting=forgetting)
+        for forgetting in [None, 1]
+    ]
+    np.testing.assert_array_equal(mixtures[1].predictions, mixtures[0].predictions)
+    np.testing.assert_array_equal(mixtures[1].weights, mixtures[0].weights)
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_forgetting_discounts_the_accumulators_after_each_step(data, model):
+    experts, y, awake = data(101, 5)
+    gamma, floor = 0.9, 1 / np.power(2, 20)
+    mixture = Mixture(y=y[:100], experts=experts[:100], awake=awake[:100], model=model, forgetting=gamma)
+    # The same step without forgetting gives the accumulators before the discount
+    undiscounted = copy.deepcopy(mixture)
+    undiscounted.forgetting = None
+    mixture.update(experts[100:], y[100:], awake=awake[100:])
+    undiscounted.update(experts[100:], y[100:], awake=awake[100:])
+    np.testing.assert_allclose(mixture.cum_regrets, gamma * undiscounted.cum_regrets, rtol=1e-12)
+    if model == "BOA":
+        np.testing.assert_allclose(
+            mixture.cum_reg_regrets, gamma * undiscounted.cum_reg_regrets, rtol=1e-12
+        )
+    if model in ["BOA", "MLprod"]:
+        # The running sums and maxima decay towards their initial value
+        np.testing.assert_allclose(
+            mixture.cum_vars, floor + gamma * (undiscounted.cum_vars - floor), rtol=1e-12
+        )
+        np.testing.assert_allclose(
+            mixture.max_losses, floor + gamma * (undiscounted.max_losses - floor), rtol=1e-12
+        )
+    if model == "MLpol":
+        # The inverse learning rates are running sums of squared regrets
+        np.testing.assert_allclose(
+            1 / mixture.learning_rates,
+            1 / floor + gamma * (1 / undiscounted.learning_rates - 1 / floor),
+            rtol=1e-12,
+        )
+        np.testing.assert_allclose(
+            mixture.max_sq_regrets, gamma * undiscounted.max_sq_regrets, rtol=1e-12
+        )
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+@pytest.mark.parametrize("binary", [True, False])
+def test_awake_cache_matches_an_uncached_run(data, monkeypatch, model, binary):
+    experts, y, awake = data(300, 6, seed=1)
+    if not binary:
+        awake = awake * np.random.default_rng(1).uniform(0.5, 1, awake.shape)
+    cached = Mixture(y=y[:150], experts=experts[:150], awake=awake[:150], model=model)
+    cached.update(experts[150:], y[150:], awake=awake[150:])
+    assert (cached.awake_cache.misses > 0) == binary
+    monkeypatch.setattr(AwakeCache, "plans", lambda self, awake: None)
+    uncached = Mixture(y=y[:150], experts=experts[:150], awake=awake[:150], model=model)
+    uncached.update(experts[150:], y[150:], awake=awake[150:])
+    np.testing.assert_array_equal(cached.predictions, uncached.predictions)
+    np.testing.assert_array_equal(cached.weights, uncached.weights)
+
+
+def test_awake_cache_is_bounded():
+    cache = AwakeCache(max_size=4)
+    masks = np.array([[int(bit) for bit in f"{n:04b}"] for n in range(1, 16)])
+    plans = cache.plans(masks)
+    assert len(cache.plans_by_key) == 4 and cache.misses == 15
+    np.testing.assert_array_equal(plans[4].index, [1, 3])
+    assert plans[-1].all_awake and not plans[0].all_awake
+    # The least recently used masks are evicted first
+    cache.plans(masks[-4:-3])
+    cache.plans(masks[:1])
+    assert cache.hits == 1 and cache.misses == 16
+    assert len(cache.plans_by_key) == 4
+    cache.plans(masks[-4:-3])
+    assert cache.hits == 2
+
+
+@pytest.mark.parametrize("max_points", [7, 100, 999])
+def test_decimation_keeps_at_most_max_points(max_points):
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(1000, 3))
+    # A spike in a single step must survive the decimation
+    values[421, 1] = 50
+    steps, means = bucket_mean(values, max_points)
+    assert len(steps) == len(means) <= max_points
+    assert np.all(np.diff(steps) > 0)
+    positions, lines = min_max_decimate(values, max_points)
+    assert positions.shape == lines.shape and positions.shape[0] <= max_points
+    assert np.all(np.diff(positions, axis=0) >= 0)
+    np.testing.assert_array_equal(lines.max(axis=0), values.max(axis=0))
+    np.testing.assert_array_equal(lines.min(axis=0), values.min(axis=0))
+    assert lines[:, 1].max() == 50
+
+
+def test_bucket_mean_keeps_the_mean():
+    values = np.random.default_rng(0).normal(size=1000)
+    # Equal buckets: the means of the buckets average to the mean of the values
+    steps, means = bucket_mean(values, 100)
+    np.testing.assert_allclose(means.mean(), values.mean())
+    np.testing.assert_allclose(steps, np.arange(4.5, 1000, 10))
+
+
+@pytest.mark.parametrize("max_points", [None, 0, 50, 60])
+def test_decimation_passes_short_series_through(max_points):
+    values = np.random.default_rng(0).normal(size=(50, 2))
+    steps, means = bucket_mean(values, max_points)
+    np.testing.assert_array_equal(steps, np.arange(50))
+    assert means is values
+    positions, lines = min_max_decimate(values, max_points)
+    np.testing.assert_array_equal(positions, np.tile(np.arange(50)[:, None], (1, 2)))
+    assert lines is values
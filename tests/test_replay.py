@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import replay
+from mixture import Mixture
+
+
+def write_files(directory, T=300, K=3, seed=0):
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.normal(10, 1, T), name="price")
+    experts = pd.DataFrame(
+        y.to_numpy()[:, None] + rng.normal(0, np.linspace(0.5, 3, K), (T, K)),
+        columns=[f"expert_{k}" for k in range(K)],
+    )
+    experts.to_csv(directory / "experts.csv", index=False)
+    y.to_frame().to_csv(directory / "prices.csv", index=False)
+    return experts, y
+
+
+def test_replay_matches_the_mixture(tmp_path):
+    experts, y = write_files(tmp_path)
+    mixture, summary = replay.replay(
+        str(tmp_path / "experts.csv"),
+        str(tmp_path / "prices.csv"),
+        chunk_size=100,
+        output=str(tmp_path / "run"),
+        model="MLpol",
+    )
+    expected = Mixture(y=y[:100], experts=experts[:100], model="MLpol")
+    expected.update(experts[100:200], y[100:200])
+    expected.update(experts[200:], y[200:])
+    np.testing.assert_allclose(mixture.predictions, expected.predictions)
+    assert summary["steps"] == 300 and summary["chunks"] == 3
+    with open(tmp_path / "run" / "summary.json") as f:
+        assert json.load(f)["steps"] == 300
+
+
+def test_replay_raises_on_files_of_different_lengths(tmp_path):
+    experts, y = write_files(tmp_path)
+    y[:250].to_frame().to_csv(tmp_path / "prices.csv", index=False)
+    with pytest.raises(ValueError, match="same number of rows"):
+        replay.replay(
+            str(tmp_path / "experts.csv"), str(tmp_path / "prices.csv"), chunk_size=100
+        )
+
+
+def test_peak_memory_is_in_megabytes_on_macos(monkeypatch):
+    resource = pytest.importorskip("resource")
+    # 512 MB, in the bytes of macOS
+    usage = SimpleNamespace(ru_maxrss=512 * 1024 * 1024)
+    monkeypatch.setattr(resource, "getrusage", lambda who: usage)
+    monkeypatch.setattr(replay.sys, "platform", "darwin")
+    assert replay.peak_memory_mb() == 512
+    monkeypatch.setattr(replay.sys, "platform", "linux")
+    assert replay.peak_memory_mb() == 512 * 1024
@@ -0,0 +1,33 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from reports import build_reports, diagnostics, draw_report
+
+
+def test_colliding_names_get_distinct_files(tmp_path, small_mixture):
+    mixtures = {"a/b": small_mixture(seed=0), "a_b": small_mixture(seed=1), "A_B": small_mixture(seed=2)}
+    index = build_reports(mixtures, str(tmp_path), n_jobs=1)
+    files = list(index["files"])
+    assert files == ["a_b.png", "a_b_2.png", "A_B_3.png"]
+    for file_name in files:
+        assert os.path.exists(tmp_path / file_name)
+
+
+def test_report_draws_the_panels_of_plot_mixture(small_mixture):
+    mixture = small_mixture(T=3000, K=5)
+    mixture.plot_mixture()
+    expected = plt.gcf()
+    report = draw_report(diagnostics(mixture))
+    for axis, report_axis in zip(expected.axes, report.axes):
+        assert axis.get_title() == report_axis.get_title()
+        assert [t.get_text() for t in axis.get_xticklabels()] == [
+            t.get_text() for t in report_axis.get_xticklabels()
+        ]
+        assert len(axis.collections) == len(report_axis.collections)
+        assert len(axis.patches) == len(report_axis.patches)
+        assert len(axis.lines) == len(report_axis.lines)
+        for line, report_line in zip(axis.lines, report_axis.lines):
+            np.testing.assert_array_equal(line.get_xydata(), report_line.get_xydata())
+    plt.close("all")
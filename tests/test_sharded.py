@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from mixture import Mixture
+from sharded import ShardedMixture
+
+# The shards sum their partial normalisations in another order than Mixture
+RTOL = 1e-9
+
+
+@pytest.mark.parametrize("model", ["BOA", "MLpol", "MLprod"])
+def test_sharded_mixture_matches_mixture(model, data):
+    experts, y, awake = data(120, 7, asleep=0.2)
+    first, rest = slice(0, 80), slice(80, None)
+    mixture = Mixture(y=y[first], experts=experts[first], awake=awake[first], model=model)
+    mixture.update(experts[rest], y[rest], awake=awake[rest])
+    with ShardedMixture(
+        y=y[first], experts=experts[first], awake=awake[first], model=model, n_shards=3
+    ) as sharded:
+        sharded.update(experts[rest], y[rest], awake=awake[rest])
+        np.testing.assert_allclose(
+            sharded.predictions, np.ravel(mixture.predictions), rtol=RTOL
+        )
+        np.testing.assert_allclose(sharded.weights, mixture.weights, rtol=RTOL, atol=1e-15)
+        np.testing.assert_allclose(sharded.loss, mixture.loss, rtol=RTOL)
+        np.testing.assert_allclose(
+            sharded.predict(experts[:5], awake=awake[:5]),
+            mixture.predict(experts[:5], awake=awake[:5]),
+            rtol=RTOL,
+        )
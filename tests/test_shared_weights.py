@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from shared_weights import SEQUENCE, SharedWeightsPublisher, SharedWeightsReader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READER = """
+import json, sys
+from shared_weights import SharedWeightsReader
+reader = SharedWeightsReader(sys.argv[1])
+print(json.dumps(list(reader.read().weights)))
+reader.close()
+"""
+
+
+def read_in_process(name):
+    result = subprocess.run(
+        [sys.executable, "-c", READER, name],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+def test_reader_exit_keeps_the_segment(small_mixture):
+    mixture = small_mixture()
+    with SharedWeightsPublisher(mixture) as publisher:
+        # A reader process exiting must not unlink the segment of the publisher
+        first = read_in_process(publisher.name)
+        second = read_in_process(publisher.name)
+        np.testing.assert_array_equal(first, mixture.snapshot.weights)
+        np.testing.assert_array_equal(second, mixture.snapshot.weights)
+
+
+def test_expert_beyond_the_capacity_is_rejected_before_the_change(small_mixture):
+    mixture = small_mixture()
+    with SharedWeightsPublisher(mixture) as publisher:
+        version = mixture.snapshot.version
+        with pytest.raises(ValueError, match="capacity 3 got 4"):
+            mixture.add_expert("d")
+        assert list(mixture.experts_names) == ["a", "b", "c"]
+        assert mixture.w.shape == (3,) and mixture.snapshot.version == version
+        with SharedWeightsReader(publisher.name) as reader:
+            assert reader.read().version == version
+
+
+def test_read_during_a_stuck_write_times_out(small_mixture):
+    mixture = small_mixture()
+    with SharedWeightsPublisher(mixture) as publisher:
+        with SharedWeightsReader(publisher.name, timeout=0.05) as reader:
+            # A writer dying in the middle of a write leaves the sequence odd
+            publisher.header[SEQUENCE] += 1
+            with pytest.raises(TimeoutError):
+                reader.read()
+            publisher.header[SEQUENCE] += 1
+            np.testing.assert_array_equal(reader.read().weights, mixture.snapshot.weights)
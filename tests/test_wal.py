@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from mixture import Mixture
+from wal import DurableMixture, read_log
+
+
+@pytest.mark.parametrize("fsync_every", [1, 8])
+def test_rejected_update_is_not_logged(tmp_path, fsync_every, data):
+    experts, y, _ = data(60, 3)
+    durable = DurableMixture(Mixture(y=y[:20], experts=experts[:20]), tmp_path, fsync_every=fsync_every)
+    durable.update(experts[20:30], y[20:30])
+    bad = experts[30:40].copy()
+    bad.iloc[3, 1] = np.nan
+    with pytest.raises(ValueError, match="NaN"):
+        durable.update(bad, y[30:40])
+    assert durable.sequence == 1
+    assert [update[0] for update in read_log(tmp_path)] == [1]
+    durable.update(experts[40:60], y[40:60])
+    durable.close()
+    assert [update[0] for update in read_log(tmp_path)] == [1, 2]
+
+    recovered = DurableMixture.recover(tmp_path)
+    expected = Mixture(y=y[:20], experts=experts[:20])
+    expected.update(experts[20:30], y[20:30])
+    expected.update(experts[40:60], y[40:60])
+    assert recovered.sequence == 2
+    np.testing.assert_array_equal(recovered.mixture.predictions, expected.predictions)
+    np.testing.assert_array_equal(recovered.mixture.weights, expected.weights)
+    recovered.close()
@@ -0,0 +1,340 @@
+"""
+Write-ahead log of the updates of a mixture, for crash-safe online aggregation.
+
+Each update is appended to a log before being applied to the mixture, and the state of the
+mixture is pickled from time to time. After a crash, the mixture is rebuilt from the last state
+and the updates logged after it, so only the updates not yet synced to disk are lost.
+
+The log is split in segments named updates_<first sequence>.log, a new segment being started
+after each saved state, and made of frames:
+
+    header  : uint32[2] = payload size, crc32 of the payload
+    payload : int8 kind followed by
+        NAMES : utf-8 json list of the experts names of the next updates
+        ROWS  : int64[4] = sequence, rows, targets per row (0 for a vector of targets), experts,
+                then float64 experts, targets and awake coefficients
+
+A frame cut by a crash, or whose checksum does not match, ends the log.
+"""
+
+import json
+import os
+import pickle
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+HEADER = struct.Struct("<II")
+ROWS_HEADER = struct.Struct("<qqqq")
+NAMES, ROWS = 0, 1
+STATE_FILE = "state.pkl"
+
+
+def segment_name(sequence):
+    return f"updates_{sequence:012d}.log"
+
+
+def list_segments(directory):
+    """Paths of the log segments of a directory, in the order of their sequences."""
+    files = sorted(
+        f for f in os.listdir(directory) if f.startswith("updates_") and f.endswith(".log")
+    )
+    return [os.path.join(directory, f) for f in files]
+
+
+def fsync_directory(directory):
+    """Makes the creation, the renaming or the removal of files of a directory durable."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_rows(sequence, x, y, awake):
+    n, K = awake.shape
+    d = 0 if y.ndim == 1 else y.shape[1]
+    return b"".join(
+        [
+            bytes([ROWS]),
+            ROWS_HEADER.pack(sequence, n, d, K),
+            np.ascontiguousarray(x, dtype="<f8").tobytes(),
+            np.ascontiguousarray(y, dtype="<f8").tobytes(),
+            np.ascontiguousarray(awake, dtype="<f8").tobytes(),
+        ]
+    )
+
+
+def decode_rows(payload):
+    sequence, n, d, K = ROWS_HEADER.unpack_from(payload, 1)
+    values = np.frombuffer(payload, dtype="<f8", offset=1 + ROWS_HEADER.size)
+    size_x = n * max(d, 1) * K
+    size_y = n * max(d, 1)
+    x = values[:size_x]
+    y = values[size_x : size_x + size_y]
+    awake = values[size_x + size_y :].reshape(n, K)
+    if d == 0:
+        return sequence, x.reshape(n, K), y, awake
+    return sequence, x.reshape(n, d, K), y.reshape(n, d), awake
+
+
+def read_frames(path):
+    """Yields the payloads of the frames of a segment, up to the first incomplete or corrupted one."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        size, crc = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        payload = data[start : start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            return
+        yield payload
+        offset = start + size
+
+
+class UpdateLog:
+    """Append-only log of updates, synced to disk every fsync_every updates.
+
+    Args:
+        path (str): path of the segment, created if needed.
+        sequence (int): sequence of the last update logged before this segment.
+        fsync_every (int, optional): number of updates written between two calls to fsync,
+            1 to sync each update. Defaults to 1.
+
+    The updates appended since the last sync are lost when the machine crashes, so up to
+    fsync_every - 1 acknowledged updates may be lost, in exchange for fewer syncs.
+    """
+
+    def __init__(self, path, sequence=0, fsync_every=1):
+        if fsync_every < 1:
+            raise ValueError(f"fsync_every must be positive, got {fsync_every}")
+        self.path = path
+        self.sequence = sequence
+        self.fsync_every = fsync_every
+        self.pending = 0
+        self.names = None
+        self.syncs = 0
+        self.file = open(path, "ab")
+        # Offset, names and pending count before the last update, see undo
+        self.last = None
+
+    def write(self, payload):
+        self.file.write(HEADER.pack(len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+
+    def append(self, x, y, awake, experts_names):
+        """Logs the rows of one update, returns their sequence number.
+
+        Args:
+            x (numpy.array): experts, of shape (n, K) or (n, d, K), in the order of experts_names.
+            y (numpy.array): targets, of shape (n,) or (n, d).
+            awake (numpy.array): activation coefficients, of shape (n, K).
+            experts_names (list): names of the experts, logged when they change.
+        """
+        names = [str(name) for name in experts_names]
+        self.last = (self.file.tell(), self.names, self.pending)
+        if names != self.names:
+            self.write(bytes([NAMES]) + json.dumps(names).encode("utf-8"))
+            self.names = names
+        self.sequence += 1
+        self.write(encode_rows(self.sequence, x, y, awake))
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+        return self.sequence
+
+    def undo(self):
+        """Removes the frames of the last update appended, e.g. an update rejected by the mixture.
+
+        The log is synced afterwards, so that a removed frame already synced does not come back
+        after a crash.
+        """
+        if self.last is None:
+            raise ValueError("No update to undo")
+        offset, self.names, self.pending = self.last
+        self.last = None
+        self.file.flush()
+        self.file.truncate(offset)
+        self.sequence -= 1
+        self.sync()
+
+    def sync(self):
+        """Flushes the updates written so far and waits for the disk."""
+        if self.file.closed:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.syncs += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+def read_log(directory, after=0):
+    """Yields the logged updates of a directory with a sequence larger than after.
+
+    Args:
+        directory (str): directory of the log segments.
+        after (int, optional): sequence of the last update already applied. Defaults to 0.
+    Yields:
+        (int, list, numpy.array, numpy.array, numpy.array): the sequence, the experts names, the experts,
+            the targets and the awake coefficients of each update.
+    """
+    for path in list_segments(directory):
+        names = None
+        for payload in read_frames(path):
+            if payload[0] == NAMES:
+                names = json.loads(payload[1:].decode("utf-8"))
+                continue
+            sequence, x, y, awake = decode_rows(payload)
+            if sequence > after:
+                yield (sequence, names, x, y, awake)
+
+
+class DurableMixture:
+    """Mixture whose updates are logged before being applied, so that it survives a crash.
+
+    Args:
+        mixture (Mixture): the mixture, which must be picklable, e.g. not an FTRL mixture with
+            the default regularisation, which holds lambdas.
+        directory (str): directory of the state and of the log, created if needed.
+        fsync_every (int, optional): number of updates between two syncs of the log, see UpdateLog.
+            Defaults to 1.
+        save_every (int, optional): number of updates between two saved states, None to save the
+            state only when save is called. The longer the log after the last state, the longer
+            the recovery, but each save pickles the whole mixture, see save. Defaults to None.
+        sequence (int, optional): sequence of the last update applied to the mixture. Defaults to 0.
+
+    The state is saved when the object is created, replacing the state and the log of the
+    directory, so that the log only holds later updates.
+    The pool changes are not logged, the state being saved after each of them.
+
+    Example:
+        durable = DurableMixture(Mixture(y=y, experts=experts), "runs/boa", fsync_every=64)
+        durable.update(new_experts, new_y)
+        # after a crash
+        durable = DurableMixture.recover("runs/boa", fsync_every=64)
+        mixture = durable.mixture
+    """
+
+    def __init__(self, mixture, directory, fsync_every=1, save_every=None, sequence=0):
+        if save_every is not None and save_every < 1:
+            raise ValueError(f"save_every must be positive, got {save_every}")
+        self.mixture = mixture
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.save_every = save_every
+        self.sequence = sequence
+        self.log = None
+        os.makedirs(directory, exist_ok=True)
+        self.save()
+
+    @classmethod
+    def recover(cls, directory, fsync_every=1, save_every=None):
+        """Rebuilds the mixture of a directory from its last state and the updates logged after it.
+
+        The frames cut by the crash are dropped and a new state is saved, so the log starts afresh.
+
+        Args:
+            directory (str): directory of a DurableMixture.
+            fsync_every (int, optional): number of updates between two syncs of the log. Defaults to 1.
+            save_every (int, optional): number of updates between two saved states. Defaults to None.
+        Returns:
+            DurableMixture: the recovered mixture, which carries on logging in the same directory.
+        """
+        path = os.path.join(directory, STATE_FILE)
+        if not os.path.exists(path):
+            raise ValueError(f"No saved state in {directory}")
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        mixture = state["mixture"]
+        sequence = state["sequence"]
+        for sequence_t, names, x, y, awake in read_log(directory, after=sequence):
+            if sequence_t != sequence + 1:
+                raise ValueError(
+                    f"The log of {directory} misses the updates {sequence + 1} to {sequence_t - 1}"
+                )
+            if names != [str(name) for name in mixture.experts_names]:
+                raise ValueError(
+                    f"Update {sequence_t} was logged for the experts {names}, the mixture has {list(mixture.experts_names)}"
+                )
+            if x.ndim == 2:
+                x = pd.DataFrame(x, columns=mixture.experts_names)
+            mixture.update(x, y, awake=awake)
+            sequence = sequence_t
+        return cls(mixture, directory, fsync_every=fsync_every, save_every=save_every, sequence=sequence)
+
+    def update(self, new_experts, new_y, awake=None):
+        """Logs an update, then applies it to the mixture, see Mixture.update.
+
+        An update rejected by the mixture, e.g. with NaN forecasts of awake experts, is removed
+        from the log before the error is raised again, so the recovery does not replay it.
+        """
+        mixture = self.mixture
+        new_experts = mixture.check_columns(new_experts)
+        awake = np.asarray(mixture.check_awake(awake, new_experts), dtype=float)
+        x = np.asarray(new_experts, dtype=float)
+        y = np.asarray(new_y, dtype=float)
+        if x.shape[:-1] != y.shape:
+            raise ValueError("Bad dimensions: x and y should have the same shape")
+        self.sequence = self.log.append(x, y, awake, mixture.experts_names)
+        try:
+            mixture.update(new_experts, new_y, awake=awake)
+        except Exception:
+            self.log.undo()
+            self.sequence = self.log.sequence
+            raise
+        if self.save_every is not None and self.sequence % self.save_every == 0:
+            self.save()
+
+    def save(self):
+        """Pickles the mixture with the sequence of its last update, and starts a new log segment.
+
+        The state is written to a temporary file renamed over the previous one, so a crash leaves
+        either state, and the log segments, all covered by the new state, are removed afterwards.
+
+        The state is not incremental: the whole mixture is pickled, its history of predictions,
+        weights and losses included, so the time and the size of a save grow with the number of
+        steps applied so far, while the log only grows with the steps since the last save.
+        """
+        if self.log is not None:
+            self.log.close()
+        path = os.path.join(self.directory, STATE_FILE)
+        listeners, checks = self.mixture.listeners, self.mixture.checks
+        self.mixture.listeners, self.mixture.checks = [], []
+        try:
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump({"sequence": self.sequence, "mixture": self.mixture}, f)
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            self.mixture.listeners, self.mixture.checks = listeners, checks
+        os.replace(path + ".tmp", path)
+        for old in list_segments(self.directory):
+            os.remove(old)
+        segment = os.path.join(self.directory, segment_name(self.sequence + 1))
+        self.log = UpdateLog(segment, self.sequence, self.fsync_every)
+        fsync_directory(self.directory)
+
+    def add_expert(self, name, init_weight=None):
+        """Adds an expert to the mixture, see Mixture.add_expert, and saves the state."""
+        self.mixture.add_expert(name, init_weight=init_weight)
+        self.save()
+
+    def remove_expert(self, name):
+        """Removes an expert from the mixture, see Mixture.remove_expert, and saves the state."""
+        self.mixture.remove_expert(name)
+        self.save()
+
+    def sync(self):
+        self.log.sync()
+
+    def close(self):
+        """Syncs the log, the updates logged so far being durable."""
+        self.log.close()